@@ -1,27 +1,43 @@
+import os
 import sys
 import time
+STARTUP_T0 = time.perf_counter()  # 启动计时起点（--profile-startup）
 import json
-import csv
-import socket
-import threading
 from datetime import datetime
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, 
                              QLabel, QPushButton, QCheckBox, QSpinBox, QGroupBox,
-                             QMessageBox, QFileDialog, QComboBox, QLineEdit, QTabWidget)
+                             QMessageBox, QFileDialog, QComboBox, QLineEdit, QTabWidget,
+                             QListWidget, QListWidgetItem)
 from PyQt5.QtCore import QThread, pyqtSignal, Qt, QTimer, QMetaObject, Q_ARG, pyqtSlot
-import pyqtgraph as pg
-import pandas as pd
+from spectrometer.notifications import (NotificationCenter, LEVEL_INFO, LEVEL_WARNING,
+                                        LEVEL_ERROR, LEVEL_NAMES)
+from spectrometer.pipeline import DataProcessor, PipelineWorker, default_record_filename
+from spectrometer.protocol import HEARTBEAT_INTERVAL, MIN_STREAM_INTERVAL, is_valid_ipv4
+from spectrometer.netcore import NetworkCore, CLIENT_EVENTS
+from spectrometer.discovery import DeviceCache, auto_local_ip, discover_devices
+from spectrometer.supervisor import acquisition_supervisor, summarize_report, WORKER_LABELS
+from spectrometer.measurement import (MEASUREMENT_TARGET, MEASUREMENT_TIMEOUT_MARGIN, MEASUREMENT_STAGES,
+                                      write_measurement_session_csv, measurement_session_filename)
 
 # ========================== 宏定义 ==========================
-TCP_SERVER_PORT = 6677       # 接收设备连接/状态通知
-UDP_SERVER_PORT = 6699       # 接收光谱数据
-DEVICE_CMD_PORT = 6688       # 设备指令服务器
-HEARTBEAT_INTERVAL = 20      # 心跳间隔（秒）
 MAX_DATA_CACHE = 1000        # 最大绘图缓存
-RECV_BUFFER_SIZE = 4096      # 接收缓冲区
+# 实时绘图显示范围：(名称, 时间跨度秒数)，None 表示只显示绘图缓存（最近 MAX_DATA_CACHE 个点）
+HISTORY_SPANS = [("实时缓存", None), ("10 分钟", 600), ("1 小时", 3600), ("6 小时", 6 * 3600),
+                 ("1 天", 86400), ("7 天", 7 * 86400)]
 CONNECTION_CHECK_INTERVAL = 10# 连接检查间隔
-MIN_STREAM_INTERVAL = 400    # 最小数据流间隔（ms，匹配设备协议）
+TOAST_DURATION = 4000        # 通知气泡显示时长（ms）
+MAX_TOASTS = 3               # 同时显示的通知气泡上限
+PLOT_REFRESH_INTERVAL = 100  # 实时绘图刷新间隔（ms），绘图只读取处理线程的数据快照
+MEASUREMENT_PLOT_STAT = "median"  # 测量结果绘图使用的重复测量统计量（median/mean/trimmed_mean）
+STREAM_STALE_MARGIN = 5.0    # 测量前检查：超过 数据流间隔 + 该秒数未收到数据即判定数据流中断
+PROFILE_STARTUP = "--profile-startup" in sys.argv  # 输出启动各阶段耗时
+PUBLISH_SHM_RING = "--no-shm-ring" not in sys.argv  # 实时数据发布到共享内存环形缓冲（供本机其他进程读取）
+STREAM_SERVER = "--stream-server" in sys.argv  # 启动本机数据分发服务（JSON-lines/WebSocket，供仪表盘与脚本订阅）
+BIND_ALL_INTERFACES = "--bind-all" in sys.argv  # 6677/6699监听所有网卡，切换本机IP只改变网卡过滤条件
+SESSION_DB = "--no-session-db" not in sys.argv  # 定时测量会话同时写入会话库（SQLite，见 spectrometer/sessiondb.py）
+# 会话库路径（--session-db PATH；未指定时为 ~/spectrometer_sessions.db，与启动目录无关）
+SESSION_DB_PATH = sys.argv[sys.argv.index("--session-db") + 1] if "--session-db" in sys.argv[:-1] else None
 
 # 光谱通道配置
 CHANNEL_CONFIG = [
@@ -36,617 +52,157 @@ CHANNEL_CONFIG = [
 ]
 
 # ========================== 工具函数 ==========================
-def is_valid_ipv4(ip):
-    parts = ip.split('.')
-    if len(parts) != 4:
-        return False
-    for part in parts:
-        if not part.isdigit():
-            return False
-        num = int(part)
-        if num < 0 or num > 255:
-            return False
-    return True
+def get_local_ip_auto(cache=None):
+    """本机IP：最近发现设备所用的网卡，否则为热点/主路由网卡（见 spectrometer.discovery.auto_local_ip）"""
+    return auto_local_ip(cache)
+
+class StartupProfiler:
+    """启动耗时统计：按阶段记录耗时，窗口首次显示后输出（--profile-startup）"""
+
+    def __init__(self, enabled, start_time):
+        self.enabled = enabled
+        self.start_time = start_time
+        self.last_time = start_time
+        self.stages = []  # (阶段, 耗时, 累计耗时)
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        self.stages.append((stage, now - self.last_time, now - self.start_time))
+        self.last_time = now
+
+    def report(self):
+        if not self.enabled:
+            return
+        print("[Startup] 启动耗时统计:")
+        for stage, cost, total in self.stages:
+            print(f"[Startup] {cost * 1000:8.1f} ms  (累计 {total * 1000:8.1f} ms)  {stage}")
 
-def get_local_ip_auto():
-    return "192.168.137.1"
+startup_profiler = StartupProfiler(PROFILE_STARTUP, STARTUP_T0)
+startup_profiler.mark("导入模块")
 
-# ========================== 网络通信模块 ==========================
-class TcpServerThread(QThread):
-    device_connected_signal = pyqtSignal(dict)    # 设备连接通知
-    device_disconnected_signal = pyqtSignal(str) # 设备断开通知
-    device_status_signal = pyqtSignal(dict)      # 设备状态更新
-    stream_complete_signal = pyqtSignal(dict)    # 数据流完成通知
-    server_status_signal = pyqtSignal(bool, str) # 服务状态
-    json_parse_error_signal = pyqtSignal(str)    # JSON解析错误
-
-    def __init__(self, local_ip):
-        super().__init__()
-        self.local_ip = local_ip
-        self.server_socket = None
-        self.client_socket = None
-        self.client_addr = None
-        self.running = False
-        self.buffer = b""
+pg = None  # pyqtgraph导入较慢，按需导入，见 load_pyqtgraph()
 
-    def run(self):
-        self.running = True
-        try:
-            # 创建TCP服务器套接字
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.local_ip, TCP_SERVER_PORT))
-            self.server_socket.listen(1)
-            self.server_socket.settimeout(1)
-            
-            status_msg = f"TCP Server启动成功: {self.local_ip}:{TCP_SERVER_PORT}"
-            print(f"[TCP Server] {status_msg}")
-            self.server_status_signal.emit(True, status_msg)
-
-            while self.running:
-                try:
-                    # 接受客户端连接
-                    client_socket, client_addr = self.server_socket.accept()
-                    self.client_socket = client_socket
-                    self.client_addr = client_addr
-                    client_ip = client_addr[0]
-                    
-                    print(f"[TCP Server] 设备连接: {client_ip}")
-                    self.client_socket.settimeout(1.0)  # 设置读取超时，避免阻塞
-                    
-                    # 处理客户端数据
-                    self.handle_client()
-                    
-                except socket.timeout:
-                    continue  # 超时是正常情况，继续等待新连接
-                except OSError as e:
-                    # 检查是否是因为服务器停止运行导致的错误
-                    if not self.running:
-                        break
-                    if e.errno == 9:  # Bad file descriptor
-                        print(f"[TCP Server] 套接字已关闭，停止接受连接")
-                        break
-                    else:
-                        err_msg = f"套接字错误: {e}"
-                        print(f"[TCP Server] {err_msg}")
-                        self.server_status_signal.emit(False, err_msg)
-                        continue  # 继续运行，不退出线程
-                except Exception as e:
-                    if self.running:
-                        err_msg = f"连接错误: {e}"
-                        print(f"[TCP Server] {err_msg}")
-                        self.server_status_signal.emit(False, err_msg)
-                    # 发生异常时继续运行，不退出线程
-                    continue
+def load_pyqtgraph():
+    """首次创建绘图时才导入pyqtgraph"""
+    global pg
+    if pg is None:
+        import pyqtgraph
+        pg = pyqtgraph
+        startup_profiler.mark("导入pyqtgraph")
+    return pg
 
-        except Exception as e:
-            if self.running:
-                err_msg = f"启动失败: {e}（IP: {self.local_ip}，端口: {TCP_SERVER_PORT}）"
-                print(f"[TCP Server] {err_msg}")
-                self.server_status_signal.emit(False, err_msg)
-
-        finally:
-            # 确保资源被清理
-            self.client_disconnect()
-            if self.server_socket:
-                try:
-                    self.server_socket.close()
-                except Exception as e:
-                    print(f"[TCP Server] 关闭服务器套接字错误: {e}")
-                self.server_socket = None
-            
-            print(f"[TCP Server] 线程已退出")
+# ========================== 网络通信模块 ==========================
+class NetworkBridgeThread(QThread):
+    """Qt适配层：从网络核心（spectrometer.netcore）的事件队列取出事件，转发为Qt信号，
+    由主线程按事件名分发；网络核心停止时放入None，本线程随之退出"""
+    network_event_signal = pyqtSignal(str, str, object)  # 事件名, 设备IP, 参数元组
 
-    def handle_client(self):
-        """处理客户端连接和数据接收 - 修复版本"""
-        if not self.client_socket or not self.client_addr:
-            return
-            
-        client_ip = self.client_addr[0]
-        print(f"[TCP Server] 开始处理客户端: {client_ip}")
-        
-        try:
-            while self.running:
-                try:
-                    data = self.client_socket.recv(RECV_BUFFER_SIZE)
-                    if not data:
-                        print(f"[TCP Server] 设备主动断开: {client_ip}")
-                        # 注意：不发送断开信号，因为6677端口断开是正常行为
-                        break
-                        
-                    # 处理接收到的数据
-                    self.buffer += data
-                    while b'\n' in self.buffer:
-                        line_end = self.buffer.find(b'\n')
-                        line = self.buffer[:line_end]
-                        self.buffer = self.buffer[line_end + 1:]
-                        
-                        if line:
-                            try:
-                                json_str = line.decode("utf-8", errors="ignore").strip()
-                                print(f"[TCP Server] 收到数据: {json_str}")
-                                json_data = json.loads(json_str)
-                                
-                                # 判断数据类型并发送相应信号
-                                if json_data.get('type') == 'connection':
-                                    print(f"[TCP Server] 发送设备连接信号")
-                                    self.device_connected_signal.emit(json_data)
-                                elif json_data.get('type') == 'status':
-                                    self.device_status_signal.emit(json_data)
-                                elif json_data.get('type') == 'stream_complete':
-                                    self.stream_complete_signal.emit(json_data)
-                                    
-                            except json.JSONDecodeError as e:
-                                err_msg = f"JSON解析失败: {e}，原始数据: {line}"
-                                print(f"[TCP Server] {err_msg}")
-                                self.json_parse_error_signal.emit(err_msg)
-                
-                except socket.timeout:
-                    continue  # 超时是正常情况，继续循环
-                except ConnectionResetError:
-                    print(f"[TCP Server] 连接被重置: {client_ip}")
-                    break
-                except OSError as e:
-                    if e.errno == 9:  # Bad file descriptor
-                        print(f"[TCP Server] 套接字已关闭: {client_ip}")
-                        break
-                    else:
-                        print(f"[TCP Server] 套接字错误: {e}")
-                        break
-                except Exception as e:
-                    if self.running:
-                        print(f"[TCP Server] 客户端数据接收错误: {e}")
-                    break
-        
-        except Exception as e:
-            print(f"[TCP Server] 客户端处理异常: {e}")
-        finally:
-            print(f"[TCP Server] 客户端处理结束: {client_ip}")
-            self.client_disconnect()
-
-    def client_disconnect(self):
-        """断开客户端连接"""
-        if self.client_socket:
-            try:
-                self.client_socket.shutdown(socket.SHUT_RDWR)
-                self.client_socket.close()
-            except Exception as e:
-                print(f"[TCP Server] 断开客户端错误: {e}")
-            self.client_socket = None
-            self.client_addr = None
-            self.buffer = b""
-
-    def update_ip(self, new_ip):
-        self.local_ip = new_ip
-
-    def stop(self):
-        print(f"[TCP Server] 正在停止...")
-        self.running = False
-        self.client_disconnect()
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except Exception as e:
-                print(f"[TCP Server] 关闭服务器错误: {e}")
-            self.server_socket = None
-        if self.isRunning():
-            self.wait(5000)
-        print(f"[TCP Server] 已停止")
-
-class UdpServerThread(QThread):
-    spectral_data_signal = pyqtSignal(dict)    # 光谱数据信号
-    data_status_signal = pyqtSignal(bool)      # 数据传输状态
-    server_status_signal = pyqtSignal(bool, str) # 服务状态
-    json_parse_error_signal = pyqtSignal(str)  # JSON解析错误
-
-    def __init__(self, local_ip):
+    def __init__(self, events):
         super().__init__()
-        self.local_ip = local_ip
-        self.server_socket = None
-        self.running = False
-        self.last_data_time = time.time()  # 添加最后收到数据的时间戳
-        self.status_check_timer = None
+        self.events = events
 
     def run(self):
-        self.running = True
-        try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.local_ip, UDP_SERVER_PORT))
-            self.server_socket.settimeout(1)
-            status_msg = f"UDP Server启动成功: {self.local_ip}:{UDP_SERVER_PORT}"
-            print(f"[UDP Server] {status_msg}")
-            self.server_status_signal.emit(True, status_msg)
-
-            self.start_status_check_timer()
-            while self.running:
-                try:
-                    if not self.running:
-                        break
-                    # 接收UDP数据
-                    data, addr = self.server_socket.recvfrom(RECV_BUFFER_SIZE)
-                    if not data:
-                        continue
-                    json_str = data.decode("utf-8", errors="ignore").strip()
-                    print(f"[UDP Server] 收到光谱数据: {addr[0]} -> {json_str}")
-
-                    try:
-                        json_data = json.loads(json_str)
-                        # 验证是否为设备光谱数据
-                        if all(key in json_data for key in ["t", "d", "c"]):
-                            self.last_data_time = time.time()
-                            normalized_data = {
-                                "timestamp": json_data["t"],
-                                "packetCount": json_data["c"],
-                                "data": json_data["d"],
-                                "streamCount": json_data.get("sc", 0),
-                                "device_ip": addr[0]
-                            }
-                            self.spectral_data_signal.emit(normalized_data)
-                            self.data_status_signal.emit(True)
-                        else:
-                            print(f"[UDP Server] 忽略无效数据（缺少必要字段）: {json_str}")
-
-                    except json.JSONDecodeError as e:
-                        err_msg = f"JSON解析失败: {e}，原始数据: {json_str}"
-                        print(f"[UDP Server] {err_msg}")
-                        self.json_parse_error_signal.emit(err_msg)
-
-                except socket.timeout:
-                    # 超时时检查数据流状态
-                    if hasattr(self, 'last_data_time') and time.time() - self.last_data_time > 10:
-                        self.data_status_signal.emit(False)
-                    continue
-
-                except Exception as e:
-                    if self.running:
-                        err_msg = f"运行错误: {e}"
-                        print(f"[UDP Server] {err_msg}")
-                        self.server_status_signal.emit(False, err_msg)
-                    break
-
-        except Exception as e:
-            if self.running:
-                err_msg = f"启动失败: {e}（IP: {self.local_ip}，端口: {UDP_SERVER_PORT}）"
-                print(f"[UDP Server] {err_msg}")
-                self.server_status_signal.emit(False, err_msg)
-
-        print(f"[UDP Server] 线程已退出")
-
-    def start_status_check_timer(self):
-        self.stop_status_check_timer()
-        if self.running:
-            self.status_check_timer = threading.Timer(3, self.check_data_status)
-            self.status_check_timer.start()
-
-    def stop_status_check_timer(self):
-        if self.status_check_timer:
-            self.status_check_timer.cancel()
-            self.status_check_timer = None
-
-    def check_data_status(self):
-        if not self.running:
-            return
-        # 5秒无数据则判定为中断
-        if time.time() - self.last_data_time > 5:
-            self.data_status_signal.emit(False)
-        self.start_status_check_timer()
-
-    def update_ip(self, new_ip):
-        self.local_ip = new_ip
-
-    def stop(self):
-        print(f"[UDP Server] 正在停止...")
-        self.running = False
-        self.stop_status_check_timer()
-        if self.server_socket:
-            try:
-                self.server_socket.close()
-            except Exception as e:
-                print(f"[UDP Server] 关闭套接字错误: {e}")
-            self.server_socket = None
-        self.wait(5000)
-        print(f"[UDP Server] 已停止")
-
-class TcpClientThread(QThread):
-    """修复版TCP客户端：优化重连逻辑+完整指令支持"""
-    cmd_response_signal = pyqtSignal(str)          # 指令响应
-    client_status_signal = pyqtSignal(bool, str)   # 客户端状态
-    cmd_send_error_signal = pyqtSignal(str)        # 指令发送错误
-    heartbeat_sent_signal = pyqtSignal(str)        # 心跳发送成功
-    connection_established_signal = pyqtSignal(str)# 连接建立
-
-    def __init__(self, device_ip):
+        while True:
+            item = self.events.get()
+            if item is None:
+                break
+            self.network_event_signal.emit(*item)
+        print("[NetBridge] 线程已退出")
+
+class DiscoveryThread(QThread):
+    """后台搜索设备（并发探测6688端口），完成后发出结果列表"""
+    finished_signal = pyqtSignal(object, bool)  # 结果列表, 是否为完整网段扫描
+
+    def __init__(self, cache, exclude=(), full_scan=True):
         super().__init__()
-        self.device_ip = device_ip  # 修复：使用正确的属性名
-        self.client_socket = None
-        self.running = False
-        self.connected = False
-        self.reconnect_count = 0
-        self.last_heartbeat_time = 0
-        self.heartbeat_timeout = 10  # 心跳超时时间（秒）
+        self.cache = cache
+        self.exclude = list(exclude)
+        self.full_scan = full_scan
 
     def run(self):
-        self.running = True
-        self.reconnect_count = 0
-        print(f"[TCP Client] 启动，目标设备: {self.device_ip}:{DEVICE_CMD_PORT}")
-
-        while self.running:
-            try:
-                if not self.connected:
-                    if not self.running:
-                        break
-                    
-                    # 重连计数与间隔控制
-                    self.reconnect_count += 1
-                    print(f"[TCP Client] 第{self.reconnect_count}次尝试连接: {self.device_ip}")
-                    
-                    # 创建新套接字
-                    self.close_socket()
-                    self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                    self.client_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-                    self.client_socket.settimeout(10)
-                    
-                    # 尝试连接
-                    print(f"[TCP Client] 正在连接 {self.device_ip}:{DEVICE_CMD_PORT}...")
-                    self.client_socket.connect((self.device_ip, DEVICE_CMD_PORT))
-                    self.connected = True
-                    self.reconnect_count = 0
-                    self.last_heartbeat_time = time.time()
-                    self.client_socket.settimeout(0.5)
-                    
-                    print(f"[TCP Client] 连接成功: {self.device_ip}:{DEVICE_CMD_PORT}")
-                    self.connection_established_signal.emit(self.device_ip)
-                    self.client_status_signal.emit(True, self.device_ip)
-
-                # 连接后的核心逻辑
-                if self.connected and self.running:
-                    current_time = time.time()
-
-                    # 1. 心跳检测（每HEARTBEAT_INTERVAL秒一次）- 简化心跳，不发送状态查询
-                    if current_time - self.last_heartbeat_time >= HEARTBEAT_INTERVAL:
-                        if self.send_heartbeat():
-                            self.last_heartbeat_time = current_time
-                            self.heartbeat_sent_signal.emit(f"心跳发送成功: {self.device_ip}")
-
-                    # 2. 移除频繁的状态查询，由主窗口控制
-
-                    # 3. 心跳超时检测
-                    if current_time - self.last_heartbeat_time > self.heartbeat_timeout:
-                        print(f"[TCP Client] 心跳超时，重新连接")
-                        self.connected = False
-                        continue
-
-                    # 4. 非阻塞读取指令响应
-                    try:
-                        data = self.client_socket.recv(RECV_BUFFER_SIZE)
-                        if data:
-                            response = data.decode("utf-8", errors="ignore").strip()
-                            if response:
-                                print(f"[TCP Client] 收到响应: {response}")
-                                self.cmd_response_signal.emit(response)
-                    except socket.timeout:
-                        pass
-                    except Exception as e:
-                        print(f"[TCP Client] 读取数据错误: {e}")
-                        self.connected = False
-                        continue
-
-                # 控制循环频率
-                time.sleep(0.1)
-
-            except socket.timeout:
-                print(f"[TCP Client] 连接超时: {self.device_ip}")
-                self.connected = False
-            except ConnectionRefusedError:
-                print(f"[TCP Client] 连接被拒绝: {self.device_ip}:{DEVICE_CMD_PORT}")
-                self.connected = False
-                time.sleep(5)
-            except Exception as e:
-                print(f"[TCP Client] 连接错误: {e}")
-                self.connected = False
-
-            # 连接失败后的处理
-            if not self.connected and self.running:
-                old_connected = self.connected
-                self.close_socket()
-
-                if old_connected:
-                    print(f"[TCP Client] 连接丢失，尝试重连")
-                    self.client_status_signal.emit(False, self.device_ip)
-
-                time.sleep(5)
-
-        print(f"[TCP Client] 线程已退出")
-        self.close_socket()
-
-    def close_socket(self):
-        """安全关闭套接字 - 修复版本"""
-        if self.client_socket:
-            try:
-                self.client_socket.shutdown(socket.SHUT_RDWR)
-            except:
-                pass
-            try:
-                self.client_socket.close()
-            except:
-                pass
-            self.client_socket = None
-        self.connected = False
-
-    def send_heartbeat(self):
-        """发送设备可识别的心跳指令"""
-        if not self.connected or not self.client_socket:
-            return False
-        try:
-            heartbeat_cmd = '{"type":"heartbeat"}\n'
-            self.client_socket.sendall(heartbeat_cmd.encode("utf-8"))
-            print(f"[TCP Client] 发送心跳: {heartbeat_cmd.strip()}")
-            return True
-        except Exception as e:
-            print(f"[TCP Client] 心跳发送失败: {e}")
-            self.connected = False
-            return False
-
-    def send_cmd(self, cmd_dict):
-        """发送控制指令（支持所有设备协议指令）"""
-        if not self.running or not self.connected:
-            err_msg = "指令发送失败：未连接设备"
-            self.cmd_send_error_signal.emit(err_msg)
-            return False
         try:
-            # 确保指令以\n结尾（设备要求）
-            cmd_str = json.dumps(cmd_dict) + "\n"
-            self.client_socket.sendall(cmd_str.encode("utf-8"))
-            print(f"[TCP Client] 发送指令: {cmd_str.strip()}")
-            return True
-        except Exception as e:
-            err_msg = f"指令发送错误: {e}"
-            print(f"[TCP Client] {err_msg}")
-            self.cmd_send_error_signal.emit(err_msg)
-            self.connected = False
-            return False
-
-    def stop(self):
-        print(f"[TCP Client] 正在停止...")
-        self.running = False
-        self.close_socket()
-        self.wait(3000)
-        print(f"[TCP Client] 已停止")
-
-    def is_connected(self):
-        """检查连接状态 - 修复版本"""
-        return self.running and self.connected and self.client_socket is not None
-
-# ========================== 数据处理模块 ==========================
-class DataProcessor:
-    def __init__(self):
-        self.spectral_cache = []  # 绘图缓存
-        self.recording = False    # 记录状态
-        self.record_data = []     # 记录数据
-        self.stream_complete = False  # 数据流完成标记
-
-    def get_cache_count(self):
-        """获取缓存数据点数"""
-        return len(self.spectral_cache)
-    
-    def get_record_count(self):
-        """获取记录数据点数"""
-        return len(self.record_data)
-    
-    def clear_cache_data(self):
-        """清空缓存数据"""
-        self.spectral_cache = []
-        return True
-        
-    def clear_record_data(self):
-        """清空记录数据（仅在非记录状态下）"""
-        if not self.recording:
-            self.record_data = []
-            return True
-        return False
-
-    def parse_spectral_data(self, json_data):
-        """修复光谱数据解析：匹配设备UDP字段"""
-        try:
-            # 从标准化后的数据中提取字段（UDP模块已处理字段映射）
-            timestamp = json_data.get("timestamp", 0)
-            packet_count = json_data.get("packetCount", 0)
-            data_list = json_data.get("data", [0]*8)
-            stream_count = json_data.get("streamCount", 0)
-
-            # 构建标准光谱数据结构
-            spectral_data = {
-                "timestamp": timestamp,
-                "packetCount": packet_count,
-                "streamCount": stream_count,
-                "F1": data_list[0], "F2": data_list[1], "F3": data_list[2], "F4": data_list[3],
-                "F5": data_list[4], "F6": data_list[5], "F7": data_list[6], "F8": data_list[7]
-            }
-
-            # 更新缓存（超出最大长度时删除最旧数据）
-            self.spectral_cache.append(spectral_data)
-            if len(self.spectral_cache) > MAX_DATA_CACHE:
-                self.spectral_cache.pop(0)
-
-            # 记录数据（如果处于记录状态）
-            if self.recording:
-                self.record_data.append(spectral_data.copy())
-
-            return spectral_data, None
-
-        except Exception as e:
-            err_msg = f"解析光谱数据错误: {e}，数据: {json_data}"
-            print(f"[DataProcessor] {err_msg}")
-            return None, err_msg
-
-    def start_record(self):
-        """开始数据记录"""
-        self.recording = True
-        self.record_data = []
-        self.stream_complete = False
-        print("[DataProcessor] 开始记录数据")
-        return True
-
-    def stop_record(self):
-        """停止数据记录"""
-        self.recording = False
-        record_count = len(self.record_data)
-        print(f"[DataProcessor] 停止记录，共{record_count}个数据点")
-        return self.record_data, record_count
-
-    def save_to_csv(self, data_list, filename=None):
-        """保存数据到CSV"""
-        if not data_list:
-            return False, "无数据可保存"
-
-        # 生成默认文件名（包含日期时间）
-        if not filename:
-            now = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"spectral_data_{now}.csv"
-        
-        file_path, _ = QFileDialog.getSaveFileName(
-            None, "保存光谱数据", filename, "CSV Files (*.csv);;All Files (*)"
-        )
-        if not file_path:
-            return False, "取消保存"
-
-        try:
-            with open(file_path, "w", newline="", encoding="utf-8") as f:
-                # CSV字段包含新增的streamCount
-                fieldnames = ["timestamp", "packetCount", "streamCount", 
-                              "F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8"]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                for data in data_list:
-                    writer.writerow(data)
-            return True, f"保存成功: {file_path}"
-        except Exception as e:
-            return False, f"保存错误: {str(e)}"
-
-    def mark_stream_complete(self):
-        """标记数据流完成"""
-        self.stream_complete = True
+            results = discover_devices(self.cache, exclude=self.exclude, full_scan=self.full_scan)
+        except OSError as e:
+            print(f"[Discovery] 搜索失败: {e}")
+            results = []
+        self.finished_signal.emit(results, self.full_scan)
+
+# ========================== 通知界面模块 ==========================
+LEVEL_COLORS = {LEVEL_INFO: "#4CAF50", LEVEL_WARNING: "#FFA000", LEVEL_ERROR: "#FF4444"}
+
+class ToastWidget(QLabel):
+    """非模态通知气泡：悬浮在主窗口右下角，定时自动消失，点击立即关闭"""
+    closed_signal = pyqtSignal(object)
+
+    def __init__(self, parent, entry):
+        super().__init__(parent)
+        self.entry = entry
+        self.dismissed = False
+        self.setWordWrap(True)
+        self.setFixedWidth(320)
+        color = LEVEL_COLORS.get(entry.level, LEVEL_COLORS[LEVEL_INFO])
+        self.setStyleSheet(f"background-color: {color}; color: white; padding: 8px; border-radius: 6px;")
+        self.refresh()
+        QTimer.singleShot(TOAST_DURATION, self.dismiss)
+
+    def refresh(self):
+        """刷新文本（重复通知显示累计次数）"""
+        text = f"<b>{self.entry.title}</b><br>{self.entry.message}"
+        if self.entry.count > 1:
+            text += f"（x{self.entry.count}）"
+        self.setText(text)
+        self.adjustSize()
+
+    def mousePressEvent(self, event):
+        self.dismiss()
+
+    def dismiss(self):
+        if self.dismissed:
+            return
+        self.dismissed = True
+        self.hide()
+        self.closed_signal.emit(self)
+        self.deleteLater()
 
 # ========================== 主窗口模块 ==========================
 class SpectrometerUpperPC(QMainWindow):
+    notification_signal = pyqtSignal(object, bool)  # 通知（可由任意线程发出）
+    measurement_collected_signal = pyqtSignal(str, list)  # 处理线程测量采集完成
+    spectral_parse_error_signal = pyqtSignal(str)  # 处理线程解析错误
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("光谱仪上位机软件 V1.3（定时测量优化版）")
         self.setGeometry(100, 100, 1300, 850)
 
         # 核心变量初始化
-        self.auto_local_ip = get_local_ip_auto()
+        self.device_cache = DeviceCache()  # 已知设备（设备IP、名称、对应的本机IP）
+        self.discovery_thread = None
+        self.discovered_devices = []
+        self.auto_local_ip = get_local_ip_auto(self.device_cache)
         self.current_local_ip = self.auto_local_ip
         self.device_info = None  # 设备基础信息
         self.device_status = None  # 设备实时状态
-        self.tcp_server = None
-        self.udp_server = None
-        self.tcp_client = None
-        self.data_processor = DataProcessor()
+        self.network = None  # 网络核心（单一事件循环线程承载6677/6699/6688）
+        self.network_bridge = None
+        self.tcp_client = None  # 当前设备的指令连接（DeviceClient）
+        self.data_processor = DataProcessor(MAX_DATA_CACHE)
+        # 数据处理线程：解析/记录/测量采集都在该线程完成，GUI只在渲染时读取快照
+        self.pipeline = PipelineWorker(self.data_processor)
+        self.pipeline.on_parse_error = self.spectral_parse_error_signal.emit
+        self.measurement_collected_signal.connect(self.on_measurement_collected)
+        self.spectral_parse_error_signal.connect(self.on_spectral_parse_error)
+        self.pipeline.start()
+        self.rendered_version = -1  # 已渲染的数据版本
         self.plot_curves = []  # 绘图曲线
+        self.plot_view = None  # 实时绘图（窗口显示后再创建）
         self.selected_channels = [True]*8  # 通道选择状态
         self.x_axis_mode = "packetCount"  # 横轴模式
+        self.history = None  # 多分辨率历史（窗口显示后创建，由处理线程写入）
+        self.lod = None  # 实时绘图的 min/max 金字塔（窗口显示后创建，由处理线程写入）
+        self.shm_ring = None  # 共享内存环形缓冲写入者（窗口显示后创建，由处理线程写入）
+        self.stream_server = None  # 本机数据分发服务（窗口显示后创建）
+        self.history_span = None  # 实时绘图显示的时间跨度（秒），None 为绘图缓存
         self.connected_device_ip = ""  # 已连接设备IP
         self.data_stream_active = False  # 数据流是否开启
 
@@ -671,6 +227,8 @@ class SpectrometerUpperPC(QMainWindow):
         self.current_measurement_group = 0
         self.measurement_plots = {}  # 存储三个标签页的绘图对象
         self.measurement_session_data = {}  # 存储整个测量会话的数据
+        self.session_db = None  # 会话库（首次定时测量时打开）
+        self.session_db_id = None  # 当前定时测量会话在会话库中的ID（未写入会话库时为None）
 
         # 定时测量变量
         self.timer_measurement_session_active = False
@@ -683,14 +241,28 @@ class SpectrometerUpperPC(QMainWindow):
         self.led_only_data = []
         self.uv_only_data = []
         self.led_uv_data = []
-        self.measurement_target = 5  # 明确设置每组测量5次
+        self.measurement_target = MEASUREMENT_TARGET  # 每组测量5次
+
+        # 非阻塞通知：数据路径上只发通知，不弹模态对话框
+        self.notification_center = NotificationCenter()
+        self.notification_center.add_listener(
+            lambda entry, shown: self.notification_signal.emit(entry, shown))
+        self.notification_signal.connect(self.on_notification)
+        self.toasts = []  # 当前显示的通知气泡
+        self.event_log_items = {}  # 通知ID -> 事件日志条目
 
-        # 初始化界面
+        # 初始化界面（绘图标签页延迟到窗口显示后/首次切换时创建）
         self.init_ui()
+        startup_profiler.mark("创建主界面")
 
         # 启动网络服务
         self.start_network_services(self.current_local_ip)
 
+        # 监控网络与处理线程：故障时自动重启，记录中断区间供定时测量会话汇总
+        self.supervisor = acquisition_supervisor(self.network, self.pipeline, self.on_worker_event)
+        self.supervisor.start()
+        self.supervision_mark = None  # 定时测量会话开始时的监控标记
+
         # 定时器：连接状态检查（3秒一次）
         self.connection_check_timer = QTimer(self)
         self.connection_check_timer.timeout.connect(self.check_device_connection)
@@ -701,6 +273,16 @@ class SpectrometerUpperPC(QMainWindow):
         self.ui_update_timer.timeout.connect(self.update_ui)
         self.ui_update_timer.start(200)
 
+        # 实时绘图刷新定时器：与数据接收解耦，只在有新数据时渲染
+        self.plot_refresh_timer = QTimer(self)
+        self.plot_refresh_timer.timeout.connect(self.refresh_live_plot)
+        self.plot_refresh_timer.start(PLOT_REFRESH_INTERVAL)
+
+        # 测量采集超时定时器
+        self.measurement_timeout_timer = QTimer(self)
+        self.measurement_timeout_timer.setSingleShot(True)
+        self.measurement_timeout_timer.timeout.connect(self.on_measurement_collection_timeout)
+
         # 定时测量功能变量
         self.timer_measurement_enabled = False
         self.timer_measurement_interval = 300  # 默认5分钟
@@ -711,12 +293,16 @@ class SpectrometerUpperPC(QMainWindow):
         # 测量状态机
         self.measurement_state = "idle"  # idle, led_only, uv_only, led_uv
         self.measurement_count = 0
-        self.measurement_target = 5  # 每组测量5次
+        self.measurement_target = MEASUREMENT_TARGET  # 每组测量5次
         
         # 修改设备状态查询间隔为10秒
         self.last_status_query_time = 0
         self.status_query_interval = 10  # 10秒一次
 
+        # 事件循环启动（窗口显示）后再创建实时绘图
+        QTimer.singleShot(0, self.finish_startup)
+        startup_profiler.mark("启动服务与定时器")
+
     def init_ui(self):
         """初始化UI：添加标签页和定时测量功能"""
         central_widget = QWidget()
@@ -733,6 +319,12 @@ class SpectrometerUpperPC(QMainWindow):
         self.ip_input.setFixedWidth(150)
         self.ip_confirm_btn = QPushButton("确认IP")
         self.ip_confirm_btn.clicked.connect(self.on_ip_confirm)
+        self.discover_btn = QPushButton("搜索设备")
+        self.discover_btn.clicked.connect(lambda: self.start_discovery(full_scan=True))
+        self.device_combo = QComboBox()
+        self.device_combo.setMinimumWidth(180)
+        self.device_combo.addItem("未搜索")
+        self.device_combo.activated.connect(self.on_discovered_device_selected)
 
         # 服务状态
         self.server_status_label = QLabel("服务状态: 初始化中...")
@@ -758,6 +350,8 @@ class SpectrometerUpperPC(QMainWindow):
         status_layout.addWidget(ip_label)
         status_layout.addWidget(self.ip_input)
         status_layout.addWidget(self.ip_confirm_btn)
+        status_layout.addWidget(self.discover_btn)
+        status_layout.addWidget(self.device_combo)
         status_layout.addSpacing(20)
         status_layout.addWidget(self.server_status_label)
         status_layout.addSpacing(20)
@@ -787,12 +381,13 @@ class SpectrometerUpperPC(QMainWindow):
         
         # 初始化所有左侧面板控件
         self.init_left_panel_controls(left_layout)
+        startup_profiler.mark("创建控制面板")
         
         scroll_area.setWidget(left_container)
         middle_layout.addWidget(scroll_area)
 
         # 2.2 右侧绘图区 - 改为标签页
-        plot_tabs_widget = QTabWidget()
+        self.plot_tabs_widget = QTabWidget()
         
         # 创建四个标签页
         self.real_time_tab = QWidget()
@@ -800,19 +395,27 @@ class SpectrometerUpperPC(QMainWindow):
         self.uv_only_tab = QWidget()
         self.led_uv_tab = QWidget()
         
-        # 初始化各个标签页的绘图
-        self.init_plot_tab(self.real_time_tab, "实时数据")
-        self.init_plot_tab(self.led_only_tab, "LED Only数据")
-        self.init_plot_tab(self.uv_only_tab, "UV Only数据") 
-        self.init_plot_tab(self.led_uv_tab, "LED+UV数据")
+        # 各标签页的绘图延迟创建：实时数据在窗口显示后，测量标签页在首次切换到时
+        self.pending_plot_tabs = {
+            self.real_time_tab: "实时数据",
+            self.led_only_tab: "LED Only数据",
+            self.uv_only_tab: "UV Only数据",
+            self.led_uv_tab: "LED+UV数据"
+        }
         
         # 添加到标签页
-        plot_tabs_widget.addTab(self.real_time_tab, "实时数据")
-        plot_tabs_widget.addTab(self.led_only_tab, "LED Only")
-        plot_tabs_widget.addTab(self.uv_only_tab, "UV Only")
-        plot_tabs_widget.addTab(self.led_uv_tab, "LED+UV")
-        
-        middle_layout.addWidget(plot_tabs_widget)
+        self.plot_tabs_widget.addTab(self.real_time_tab, "实时数据")
+        self.plot_tabs_widget.addTab(self.led_only_tab, "LED Only")
+        self.plot_tabs_widget.addTab(self.uv_only_tab, "UV Only")
+        self.plot_tabs_widget.addTab(self.led_uv_tab, "LED+UV")
+
+        # 事件日志标签页
+        self.event_log_tab = QWidget()
+        self.init_event_log_tab(self.event_log_tab)
+        self.plot_tabs_widget.addTab(self.event_log_tab, "事件日志")
+        self.plot_tabs_widget.currentChanged.connect(self.on_plot_tab_changed)
+        
+        middle_layout.addWidget(self.plot_tabs_widget)
         main_layout.addLayout(middle_layout)
 
         # 3. 底部状态栏
@@ -831,6 +434,7 @@ class SpectrometerUpperPC(QMainWindow):
         layout.addWidget(title_label)
         
         # 绘图区域
+        load_pyqtgraph()
         plot_widget = pg.PlotWidget()
         plot_widget.setLabel("left", "光谱强度", fontsize=12)
         plot_widget.setLabel("bottom", "测量次数", fontsize=12)
@@ -853,6 +457,8 @@ class SpectrometerUpperPC(QMainWindow):
         if "实时" in title:
             self.plot_curves = curves
             self.plot_view = plot_widget
+            # 手动缩放/平移时按新的可见范围重新取数据
+            plot_widget.sigXRangeChanged.connect(self.on_live_range_changed)
         elif "LED Only" in title:
             self.measurement_plots["led_only"] = {
                 "plot": plot_widget,
@@ -869,6 +475,76 @@ class SpectrometerUpperPC(QMainWindow):
                 "curves": curves
             }
 
+    def ensure_plot_tab(self, tab_widget):
+        """创建尚未初始化的绘图标签页，返回是否新建"""
+        title = self.pending_plot_tabs.pop(tab_widget, None)
+        if title is None:
+            return False
+        self.init_plot_tab(tab_widget, title)
+        return True
+
+    def on_plot_tab_changed(self, index):
+        """首次切换到测量标签页时创建绘图，并补绘已有的测量数据"""
+        if self.ensure_plot_tab(self.plot_tabs_widget.widget(index)):
+            if self.measurement_session_data.get("measurements"):
+                self.update_measurement_plots()
+
+    def finish_startup(self):
+        """窗口显示后创建实时绘图，并输出启动耗时统计"""
+        startup_profiler.mark("显示窗口")
+        from spectrometer.history import History
+        from spectrometer.lod import MinMaxPyramid
+        self.history = History()
+        self.lod = MinMaxPyramid()
+        self.pipeline.sample_listeners.append(self.history.add_sample)
+        self.pipeline.sample_listeners.append(self.lod.add_sample)
+        if PUBLISH_SHM_RING:
+            from spectrometer.shm_ring import RingWriter, RingInUseError, RingFormatError, RING_NAME
+            try:
+                try:
+                    self.shm_ring = RingWriter()
+                except (RingInUseError, RingFormatError) as e:
+                    # 另一个实例正在发布：改用带本进程PID的名称
+                    self.shm_ring = RingWriter(f"{RING_NAME}_{os.getpid()}")
+                    self.notify(LEVEL_WARNING, "共享内存", f"{e}，本窗口的实时数据改为发布到 {self.shm_ring.name}")
+                self.pipeline.sample_listeners.append(self.shm_ring.add_sample)
+            except (OSError, ValueError, RingFormatError) as e:
+                self.notify(LEVEL_WARNING, "共享内存", f"无法创建实时数据共享内存: {e}")
+        if STREAM_SERVER:
+            from spectrometer.fanout import FanoutServer
+            try:
+                self.stream_server = FanoutServer()
+                self.stream_server.start()
+                self.pipeline.sample_listeners.append(self.stream_server.publish_sample)
+                self.network.event_listeners.append(self.stream_server.publish_event)
+            except OSError as e:
+                self.stream_server = None
+                self.notify(LEVEL_WARNING, "数据分发服务", f"无法启动数据分发服务: {e}")
+        self.ensure_plot_tab(self.real_time_tab)
+        if self.x_axis_mode != "packetCount":
+            self.plot_view.setLabel("bottom", f"横轴: {self.x_axis_mode}")
+        self.refresh_live_plot(force=True)
+        if self.device_cache.devices:
+            self.start_discovery(full_scan=False)  # 先探测已知设备，设备IP未变时可立即重连
+        startup_profiler.mark("创建实时绘图")
+        startup_profiler.report()
+
+    def init_event_log_tab(self, tab_widget):
+        """初始化事件日志标签页（记录所有通知，重复通知合并计数）"""
+        layout = QVBoxLayout(tab_widget)
+
+        title_label = QLabel("事件日志")
+        title_label.setAlignment(Qt.AlignCenter)
+        title_label.setStyleSheet("font-size: 14px; font-weight: bold;")
+        layout.addWidget(title_label)
+
+        self.event_log_list = QListWidget()
+        layout.addWidget(self.event_log_list)
+
+        self.clear_event_log_btn = QPushButton("清空日志")
+        self.clear_event_log_btn.clicked.connect(self.clear_event_log)
+        layout.addWidget(self.clear_event_log_btn)
+
     def init_left_panel_controls(self, left_layout):
         """初始化左侧面板的所有控件组"""
         # 1. 设备信息组
@@ -1118,22 +794,105 @@ class SpectrometerUpperPC(QMainWindow):
         x_axis_layout.addWidget(self.x_axis_combo)
 
         left_layout.addWidget(x_axis_group)
+
+        # 9. 显示范围选择（长时间范围自动使用秒/分钟/小时汇总数据）
+        span_group = QGroupBox("显示范围")
+        span_layout = QVBoxLayout(span_group)
+
+        self.history_span_combo = QComboBox()
+        self.history_span_combo.addItems([name for name, _ in HISTORY_SPANS])
+        self.history_span_combo.currentIndexChanged.connect(self.change_history_span)
+        span_layout.addWidget(self.history_span_combo)
+
+        left_layout.addWidget(span_group)
         
         # 添加弹性空间
         left_layout.addStretch(1)
 
+    # ========================== 通知功能 ==========================
+    def notify(self, level, title, message, key=None):
+        """发布非阻塞通知（气泡+事件日志），不会阻塞事件循环"""
+        self.notification_center.post(level, title, message, key)
+
+    @pyqtSlot(object, bool)
+    def on_notification(self, entry, shown):
+        """通知到达：更新事件日志，必要时显示气泡"""
+        text = f"{entry.time_str()} [{LEVEL_NAMES.get(entry.level, entry.level)}] {entry.title}: {entry.message}"
+        if entry.count > 1:
+            text += f"（x{entry.count}）"
+
+        item = self.event_log_items.get(entry.id)
+        if item is None:
+            item = QListWidgetItem(text)
+            item.setForeground(QtGui.QColor(LEVEL_COLORS.get(entry.level, "#666666")))
+            self.event_log_list.addItem(item)
+            self.event_log_items[entry.id] = item
+            # 超出日志上限时删除最旧条目
+            while self.event_log_list.count() > self.notification_center.history.maxlen:
+                old_item = self.event_log_list.takeItem(0)
+                self.event_log_items = {k: v for k, v in self.event_log_items.items() if v is not old_item}
+        else:
+            item.setText(text)
+
+        # 重复通知：刷新已显示的气泡计数
+        for toast in self.toasts:
+            if toast.entry is entry:
+                toast.refresh()
+                self.layout_toasts()
+                return
+
+        if shown:
+            self.show_toast(entry)
+
+    def show_toast(self, entry):
+        """显示通知气泡（超过上限时关闭最旧的）"""
+        while len(self.toasts) >= MAX_TOASTS:
+            self.toasts[0].dismiss()
+        toast = ToastWidget(self, entry)
+        toast.closed_signal.connect(self.on_toast_closed)
+        self.toasts.append(toast)
+        toast.show()
+        toast.raise_()
+        self.layout_toasts()
+
+    @pyqtSlot(object)
+    def on_toast_closed(self, toast):
+        if toast in self.toasts:
+            self.toasts.remove(toast)
+            self.layout_toasts()
+
+    def layout_toasts(self):
+        """从右下角向上堆叠排列通知气泡"""
+        margin = 16
+        y = self.height() - margin - 30  # 避开底部指令响应栏
+        for toast in reversed(self.toasts):
+            y -= toast.height()
+            toast.move(self.width() - toast.width() - margin, y)
+            y -= 8
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.layout_toasts()
+
+    def clear_event_log(self):
+        """清空事件日志"""
+        self.notification_center.clear()
+        self.event_log_list.clear()
+        self.event_log_items = {}
+
     # ========================== 定时测量功能 ==========================
     def toggle_timer_measurement(self, state):
         """启用/禁用定时测量"""
         if state == Qt.Checked:
             if not self.tcp_client or not self.tcp_client.is_connected():
-                QMessageBox.warning(self, "警告", "未连接设备，无法启用定时测量！")
+                self.notify(LEVEL_WARNING, "警告", "未连接设备，无法启用定时测量！")
                 self.timer_measure_enable.setChecked(False)
                 return
                 
             # 初始化测量会话
             self.timer_measurement_session_active = True
             self.timer_measurement_start_time = time.time()
+            self.supervision_mark = self.supervisor.mark()
             self.timer_measurement_elapsed = 0
             self.current_measurement_group = 0
             
@@ -1142,6 +901,7 @@ class SpectrometerUpperPC(QMainWindow):
                 "session_start": datetime.now().strftime("%Y%m%d_%H%M%S"),
                 "measurements": []
             }
+            self.session_db_id = self.create_db_session()
             
             self.timer_measurement_enabled = True
             self.timer_measurement_interval = self.timer_interval_spin.value() * 60  # 转换为秒
@@ -1168,6 +928,13 @@ class SpectrometerUpperPC(QMainWindow):
             # 保存完整的测量会话数据
             if self.measurement_session_data["measurements"]:
                 self.save_measurement_session()
+
+            # 会话期间的网络/处理中断与丢包
+            if self.supervision_mark is not None:
+                supervision = self.supervisor.report(self.supervision_mark)
+                self.supervision_mark = None
+                if supervision["outages"] or supervision["lost_packets"]:
+                    self.notify(LEVEL_WARNING, "会话期间数据中断", summarize_report(supervision))
             
             self.cmd_response_label.setText("指令响应: 定时测量已禁用")
 
@@ -1202,7 +969,7 @@ class SpectrometerUpperPC(QMainWindow):
             # 检查是否达到总时长
             if elapsed_seconds >= self.timer_measurement_duration:
                 self.timer_measure_enable.setChecked(False)
-                QMessageBox.information(self, "测量完成", f"定时测量已完成！共完成{self.current_measurement_group}次测量")
+                self.notify(LEVEL_INFO, "测量完成", f"定时测量已完成！共完成{self.current_measurement_group}次测量")
                 return
         
         self.timer_measurement_remaining -= 1
@@ -1220,32 +987,36 @@ class SpectrometerUpperPC(QMainWindow):
             self.timer_remaining_label.setText(f"下次测量: {minutes:02d}:{seconds:02d}")
 
     def start_instant_measurement(self):
-        """立即开始测量 - 修复版本"""
+        """立即开始测量"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接设备，无法开始测量！")
+            self.notify(LEVEL_WARNING, "警告", "未连接设备，无法开始测量！")
             return
         
         # 检查UDP数据流
         if not self.check_udp_stream_before_measurement():
             return
             
-        self.start_measurement_sequence()
+        self.start_single_measurement()
 
     def start_single_measurement(self):
         """开始单次测量 - 修复：确保数据流处于正确状态"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接设备，无法开始测量！")
+            self.notify(LEVEL_WARNING, "警告", "未连接设备，无法开始测量！")
             return
             
         print("[Measurement] 开始单次测量")
         
         # 确保数据流处于运行状态
         if not self.data_stream_active:
-            QMessageBox.warning(self, "警告", "请先开启数据流！")
+            self.notify(LEVEL_WARNING, "警告", "请先开启数据流！")
             return
             
         if self.stream_paused:
-            QMessageBox.warning(self, "警告", "数据流处于暂停状态，请先继续数据流！")
+            self.notify(LEVEL_WARNING, "警告", "数据流处于暂停状态，请先继续数据流！")
+            return
+
+        if self.measurement_state != "idle":
+            self.notify(LEVEL_WARNING, "警告", "上一次测量尚未完成，已跳过本次测量")
             return
         
         self.measurement_state = "led_only"
@@ -1264,165 +1035,86 @@ class SpectrometerUpperPC(QMainWindow):
         QTimer.singleShot(1000, self.start_led_only_measurement)
 
     def start_led_only_measurement(self):
-        """开始LED only测量 - 修复：使用QTimer进行可靠的定时收集"""
+        """开始LED only测量"""
         print("[Measurement] 开始LED only测量")
+        self.measurement_state = "led_only"
         self.measurement_status_label.setText("测量状态: LED Only测量中...")
-        self.measurement_count = 0
-        self.led_only_data = []  # 清空之前的数据
         
         # 开启LED，关闭UV
         self.tcp_client.send_cmd({"as7341Led": True})
         self.tcp_client.send_cmd({"uvLed": False})
         
         # 等待LED稳定，然后开始收集
-        QTimer.singleShot(1000, self.start_led_only_collection)
-
-    def start_led_only_collection(self):
-        """开始LED only数据收集 - 使用定时器确保收集5次"""
-        self.measurement_count = 0
-        self.collect_led_only_data()
-
-    def collect_led_only_data(self):
-        """收集LED only数据 - 修复：确保收集5次"""
-        if self.measurement_count < 5:  # 明确收集5次
-            # 获取当前光谱数据
-            if self.data_processor.spectral_cache:
-                latest_data = self.data_processor.spectral_cache[-1].copy()
-                latest_data["measurement_type"] = "led_only"
-                latest_data["measurement_index"] = self.measurement_count
-                latest_data["measurement_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.led_only_data.append(latest_data)
-                print(f"[Measurement] LED Only 第{self.measurement_count + 1}次数据收集完成")
-            
-            self.measurement_count += 1
-            
-            if self.measurement_count < 5:
-                # 继续收集，间隔500ms
-                QTimer.singleShot(500, self.collect_led_only_data)
-            else:
-                # LED only测量完成
-                print(f"[Measurement] LED only测量完成，收集{len(self.led_only_data)}个数据点")
-                self.tcp_client.send_cmd({"as7341Led": False})  # 关闭LED
-                QTimer.singleShot(1000, self.start_uv_only_measurement)  # 等待1秒后开始UV测量
-        else:
-            # 安全退出
-            print(f"[Measurement] LED only测量完成")
-            self.tcp_client.send_cmd({"as7341Led": False})
+        QTimer.singleShot(1000, lambda: self.begin_measurement_collection("led_only"))
 
-    # 同样修复 UV Only 和 LED+UV 的测量函数
     def start_uv_only_measurement(self):
         """开始UV only测量"""
         print("[Measurement] 开始UV only测量")
+        self.measurement_state = "uv_only"
         self.measurement_status_label.setText("测量状态: UV Only测量中...")
-        self.measurement_count = 0
-        self.uv_only_data = []  # 清空之前的数据
         
         # 开启UV，关闭LED
         self.tcp_client.send_cmd({"uvLed": True})
         self.tcp_client.send_cmd({"as7341Led": False})
         
         # 等待UV稳定
-        QTimer.singleShot(1000, self.start_uv_only_collection)
-
-    def start_uv_only_collection(self):
-        """开始UV only数据收集"""
-        self.measurement_count = 0
-        self.collect_uv_only_data()
-
-    def collect_uv_only_data(self):
-        """收集UV only数据 - 确保收集5次"""
-        if self.measurement_count < 5:
-            # 获取当前光谱数据
-            if self.data_processor.spectral_cache:
-                latest_data = self.data_processor.spectral_cache[-1].copy()
-                latest_data["measurement_type"] = "uv_only"
-                latest_data["measurement_index"] = self.measurement_count
-                latest_data["measurement_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.uv_only_data.append(latest_data)
-                print(f"[Measurement] UV Only 第{self.measurement_count + 1}次数据收集完成")
-            
-            self.measurement_count += 1
-            
-            if self.measurement_count < 5:
-                # 继续收集，间隔500ms
-                QTimer.singleShot(500, self.collect_uv_only_data)
-            else:
-                # UV only测量完成
-                print(f"[Measurement] UV only测量完成，收集{len(self.uv_only_data)}个数据点")
-                self.tcp_client.send_cmd({"uvLed": False})  # 关闭UV
-                QTimer.singleShot(1000, self.start_led_uv_measurement)  # 等待1秒后开始LED+UV测量
-        else:
-            # 安全退出
-            print(f"[Measurement] UV only测量完成")
-            self.tcp_client.send_cmd({"uvLed": False})
+        QTimer.singleShot(1000, lambda: self.begin_measurement_collection("uv_only"))
 
     def start_led_uv_measurement(self):
         """开始LED+UV测量"""
         print("[Measurement] 开始LED+UV测量")
+        self.measurement_state = "led_uv"
         self.measurement_status_label.setText("测量状态: LED+UV测量中...")
-        self.measurement_count = 0
-        self.led_uv_data = []  # 清空之前的数据
         
         # 同时开启LED和UV
         self.tcp_client.send_cmd({"as7341Led": True})
         self.tcp_client.send_cmd({"uvLed": True})
         
         # 等待稳定
-        QTimer.singleShot(1000, self.start_led_uv_collection)
+        QTimer.singleShot(1000, lambda: self.begin_measurement_collection("led_uv"))
 
-    def start_led_uv_collection(self):
-        """开始LED+UV数据收集"""
+    def begin_measurement_collection(self, measurement_type):
+        """开始收集测量数据：由处理线程在新数据包到达时采集，GUI只负责超时判定"""
+        if self.measurement_state != measurement_type:
+            return  # 测量已取消
+        print(f"[Measurement] 开始收集{measurement_type}数据")
         self.measurement_count = 0
-        self.collect_led_uv_data()
-
-    def collect_led_uv_data(self):
-        """收集LED+UV数据 - 确保收集5次"""
-        if self.measurement_count < 5:
-            # 获取当前光谱数据
-            if self.data_processor.spectral_cache:
-                latest_data = self.data_processor.spectral_cache[-1].copy()
-                latest_data["measurement_type"] = "led_uv"
-                latest_data["measurement_index"] = self.measurement_count
-                latest_data["measurement_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                self.led_uv_data.append(latest_data)
-                print(f"[Measurement] LED+UV 第{self.measurement_count + 1}次数据收集完成")
-            
-            self.measurement_count += 1
-            
-            if self.measurement_count < 5:
-                # 继续收集，间隔500ms
-                QTimer.singleShot(500, self.collect_led_uv_data)
-            else:
-                # LED+UV测量完成
-                print(f"[Measurement] LED+UV测量完成，收集{len(self.led_uv_data)}个数据点")
-                # 关闭所有灯
-                self.tcp_client.send_cmd({"as7341Led": False})
-                self.tcp_client.send_cmd({"uvLed": False})
-                
-                # 保存本次测量数据到会话
-                self.save_single_measurement()
-                
-                # 更新测量绘图
-                self.update_measurement_plots()
-                
-                # 重置测量状态
-                self.measurement_state = "idle"
-                self.measurement_status_label.setText("测量状态: 完成")
-                
-                # 更新统计信息
-                self.current_measurement_group += 1
-                self.measurement_stats_label.setText(f"已完成测量: {self.current_measurement_group}次")
-                
-                # 显示完成消息
-                total_points = len(self.led_only_data) + len(self.uv_only_data) + len(self.led_uv_data)
-                success_msg = f"第{self.current_measurement_group}次测量完成！共收集{total_points}个数据点"
-                self.cmd_response_label.setText(f"指令响应: {success_msg}")
-                print(f"[Measurement] {success_msg}")
-        else:
-            # 安全退出
-            print(f"[Measurement] LED+UV测量完成")
-            self.tcp_client.send_cmd({"as7341Led": False})
-            self.tcp_client.send_cmd({"uvLed": False})
+        self.pipeline.start_collection(
+            measurement_type, self.measurement_target,
+            lambda m_type, samples: self.measurement_collected_signal.emit(m_type, samples))
+
+        # 超时：按数据流间隔估算，至少等待 MEASUREMENT_TIMEOUT_MARGIN
+        timeout_ms = self.measurement_target * self.stream_interval_spin.value() + MEASUREMENT_TIMEOUT_MARGIN
+        self.measurement_timeout_timer.start(timeout_ms)
+
+    @pyqtSlot(str, list)
+    def on_measurement_collected(self, measurement_type, samples):
+        """处理线程采集完成（已转发到主线程）"""
+        self.measurement_timeout_timer.stop()
+        if measurement_type != self.measurement_state:
+            return  # 测量已取消或已超时处理
+        self.store_measurement_samples(measurement_type, samples)
+        self.finish_measurement_stage(measurement_type)
+
+    def on_measurement_collection_timeout(self):
+        """测量采集超时：取消采集并以已收集的数据完成当前阶段"""
+        result = self.pipeline.cancel_collection()
+        if result is None:
+            return  # 采集刚好完成，等待完成信号处理
+        measurement_type, samples = result
+        print(f"[Measurement] {measurement_type} 数据收集超时")
+        self.store_measurement_samples(measurement_type, samples)
+        self.finish_measurement_stage(measurement_type, timeout=True)
+
+    def store_measurement_samples(self, measurement_type, samples):
+        """保存当前阶段收集到的数据"""
+        self.measurement_count = len(samples)
+        if measurement_type == "led_only":
+            self.led_only_data = samples
+        elif measurement_type == "uv_only":
+            self.uv_only_data = samples
+        elif measurement_type == "led_uv":
+            self.led_uv_data = samples
 
     def save_single_measurement(self):
         """保存单次测量数据到会话"""
@@ -1436,8 +1128,10 @@ class SpectrometerUpperPC(QMainWindow):
         
         self.measurement_session_data["measurements"].append(measurement_data)
         
-        # 实时保存到CSV文件
+        # 实时保存到CSV文件（并写入会话库）
         self.save_measurement_to_csv()
+        if self.session_db_id is not None:
+            self.save_to_database(measurement_data)
 
     def save_measurement_to_csv(self):
         """将测量数据保存到CSV文件"""
@@ -1446,59 +1140,48 @@ class SpectrometerUpperPC(QMainWindow):
             
         try:
             # 生成文件名（包含会话开始时间）
-            base_filename = f"measurement_session_{self.measurement_session_data['session_start']}.csv"
-            
-            with open(base_filename, "w", newline="", encoding="utf-8") as f:
-                fieldnames = [
-                    "measurement_index", "measurement_time", "measurement_type", "data_index",
-                    "F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8"
-                ]
-                writer = csv.DictWriter(f, fieldnames=fieldnames)
-                writer.writeheader()
-                
-                for measurement in self.measurement_session_data["measurements"]:
-                    # 写入LED Only数据
-                    for i, data in enumerate(measurement["led_only"]):
-                        row_data = {
-                            "measurement_index": measurement["measurement_index"],
-                            "measurement_time": measurement["measurement_time"],
-                            "measurement_type": "LED Only",
-                            "data_index": i,
-                            "F1": data["F1"], "F2": data["F2"], "F3": data["F3"], "F4": data["F4"],
-                            "F5": data["F5"], "F6": data["F6"], "F7": data["F7"], "F8": data["F8"]
-                        }
-                        writer.writerow(row_data)
-                    
-                    # 写入UV Only数据
-                    for i, data in enumerate(measurement["uv_only"]):
-                        row_data = {
-                            "measurement_index": measurement["measurement_index"],
-                            "measurement_time": measurement["measurement_time"],
-                            "measurement_type": "UV Only", 
-                            "data_index": i,
-                            "F1": data["F1"], "F2": data["F2"], "F3": data["F3"], "F4": data["F4"],
-                            "F5": data["F5"], "F6": data["F6"], "F7": data["F7"], "F8": data["F8"]
-                        }
-                        writer.writerow(row_data)
-                    
-                    # 写入LED+UV数据
-                    for i, data in enumerate(measurement["led_uv"]):
-                        row_data = {
-                            "measurement_index": measurement["measurement_index"],
-                            "measurement_time": measurement["measurement_time"],
-                            "measurement_type": "LED+UV",
-                            "data_index": i,
-                            "F1": data["F1"], "F2": data["F2"], "F3": data["F3"], "F4": data["F4"],
-                            "F5": data["F5"], "F6": data["F6"], "F7": data["F7"], "F8": data["F8"]
-                        }
-                        writer.writerow(row_data)
-            
+            base_filename = measurement_session_filename(self.measurement_session_data['session_start'])
+            write_measurement_session_csv(self.measurement_session_data["measurements"], base_filename)
             print(f"[Measurement] 测量数据已保存: {base_filename}")
             return True
         except Exception as e:
             print(f"[Measurement] 保存测量数据失败: {e}")
             return False
 
+    def create_db_session(self):
+        """在会话库中新建当前定时测量会话（记录设备、固件、亮度与间隔）并提示会话库位置，
+        关闭会话库或失败时返回None"""
+        if not SESSION_DB:
+            return None
+        info = dict(self.device_info or {}, **(self.device_status or {}))
+        device_status = info.get("status") if isinstance(info.get("status"), dict) else {}
+        session_start = self.measurement_session_data["session_start"]
+        try:
+            if self.session_db is None:
+                # 会话库依赖numpy/sqlite3，首次定时测量时再导入（不影响启动速度）
+                from spectrometer.sessiondb import SessionDatabase, DEFAULT_DB_PATH
+                self.session_db = SessionDatabase(SESSION_DB_PATH or DEFAULT_DB_PATH)
+            session_id = self.session_db.create_session(
+                session_start, device=info.get("device"), device_ip=self.connected_device_ip or None,
+                firmware=info.get("firmware"), led_brightness=device_status.get("as7341_bright"),
+                uv_brightness=device_status.get("uv_bright"), interval=self.timer_interval_spin.value() * 60,
+                stream_interval=self.stream_interval_spin.value(),
+                source=os.path.abspath(measurement_session_filename(session_start)))
+        except Exception as e:
+            self.notify(LEVEL_ERROR, "会话库错误", f"创建会话记录失败，本次会话只保存CSV: {e}", key="session_db_error")
+            return None
+        self.notify(LEVEL_INFO, "定时测量",
+                    f"测量数据保存到 {os.path.abspath(measurement_session_filename(session_start))}，"
+                    f"同时写入会话库 {os.path.abspath(self.session_db.path)}（会话ID {session_id}）")
+        return session_id
+
+    def save_to_database(self, measurement_data):
+        """将单次测量写入会话库"""
+        try:
+            self.session_db.add_measurement(self.session_db_id, measurement_data)
+        except Exception as e:
+            self.notify(LEVEL_ERROR, "会话库错误", f"写入会话库失败: {e}", key="session_db_error")
+
     def save_measurement_session(self):
         """保存完整的测量会话数据"""
         if not self.measurement_session_data["measurements"]:
@@ -1506,73 +1189,40 @@ class SpectrometerUpperPC(QMainWindow):
             
         success = self.save_measurement_to_csv()
         if success:
-            QMessageBox.information(self, "测量完成", 
-                                f"测量会话数据已保存！\n"
-                                f"总测量次数: {len(self.measurement_session_data['measurements'])}\n"
-                                f"文件名: measurement_session_{self.measurement_session_data['session_start']}.csv")
+            self.notify(LEVEL_INFO, "测量完成",
+                        f"测量会话数据已保存！总测量次数: {len(self.measurement_session_data['measurements'])}，"
+                        f"文件名: measurement_session_{self.measurement_session_data['session_start']}.csv")
 
     def update_measurement_plots(self):
-        """更新所有测量绘图"""
+        """更新所有测量绘图（每次测量取各类型重复测量的中位数，全零行不参与）"""
         if not self.measurement_session_data["measurements"]:
             return
-            
-        # 为每个测量类型准备数据
-        led_only_avg_data = []
-        uv_only_avg_data = []
-        led_uv_avg_data = []
-        
-        for measurement in self.measurement_session_data["measurements"]:
-            # 计算每个测量类型的平均值
-            if measurement["led_only"]:
-                avg_led = self.calculate_average_measurement(measurement["led_only"])
-                led_only_avg_data.append(avg_led)
-            
-            if measurement["uv_only"]:
-                avg_uv = self.calculate_average_measurement(measurement["uv_only"])
-                uv_only_avg_data.append(avg_uv)
-                
-            if measurement["led_uv"]:
-                avg_led_uv = self.calculate_average_measurement(measurement["led_uv"])
-                led_uv_avg_data.append(avg_led_uv)
-        
-        # 更新绘图
-        self.update_single_measurement_plot("led_only", led_only_avg_data)
-        self.update_single_measurement_plot("uv_only", uv_only_avg_data)
-        self.update_single_measurement_plot("led_uv", led_uv_avg_data)
 
-    def calculate_average_measurement(self, data_list):
-        """计算测量数据的平均值"""
-        if not data_list:
-            return None
-            
-        avg_data = {"F1": 0, "F2": 0, "F3": 0, "F4": 0, "F5": 0, "F6": 0, "F7": 0, "F8": 0}
-        
-        for data in data_list:
-            for channel in ["F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8"]:
-                avg_data[channel] += data[channel]
-        
-        for channel in avg_data:
-            avg_data[channel] /= len(data_list)
-            
-        return avg_data
+        # 汇总模块依赖numpy，首次绘制测量结果时再导入（不影响启动速度）
+        from spectrometer.summary import summarize_measurements, stat_series
+        summary = summarize_measurements(self.measurement_session_data["measurements"])
 
-    def update_single_measurement_plot(self, measurement_type, data_list):
-        """更新单个测量类型的绘图"""
+        # 更新绘图
+        for measurement_type, type_name, _, _ in MEASUREMENT_STAGES:
+            measurement_index, values = stat_series(summary, type_name, MEASUREMENT_PLOT_STAT)
+            self.update_single_measurement_plot(measurement_type, measurement_index, values)
+
+    def update_single_measurement_plot(self, measurement_type, measurement_index, values):
+        """更新单个测量类型的绘图（values: (测量次数, 8通道) 统计量数组）"""
         if measurement_type not in self.measurement_plots:
             return
 
         plot_data = self.measurement_plots[measurement_type]
         curves = plot_data["curves"]
         
-        if not data_list:
+        if len(measurement_index) == 0:
             return
 
         # 更新绘图数据
-        x_data = list(range(1, len(data_list) + 1))  # 测量次数从1开始
-        for i, (curve, config) in enumerate(zip(curves, CHANNEL_CONFIG)):
+        x_data = measurement_index + 1  # 测量次数从1开始
+        for i, curve in enumerate(curves):
             if self.selected_channels[i]:
-                y_data = [data[config["name"]] for data in data_list]
-                curve.setData(x_data, y_data)
+                curve.setData(x_data, values[:, i])
             else:
                 curve.clear()
 
@@ -1692,7 +1342,7 @@ class SpectrometerUpperPC(QMainWindow):
         actual_count = stream_data.get("actual_count", 0)
         status_msg = f"数据流完成！总数据包: {total_packets}, 目标计数: {target_count}, 实际计数: {actual_count}"
         self.cmd_response_label.setText(f"指令响应: {status_msg}")
-        QMessageBox.information(self, "数据流完成", status_msg)
+        self.notify(LEVEL_INFO, "数据流完成", status_msg)
 
         # 如果处于记录状态，自动停止记录
         if self.data_processor.recording:
@@ -1823,67 +1473,137 @@ class SpectrometerUpperPC(QMainWindow):
         self.json_error_label.setText(f"JSON解析: 错误")
         self.json_error_label.setStyleSheet("color: #C62828; padding: 2px 8px;")
         self.cmd_response_label.setText(f"指令响应: JSON解析错误: {err_msg[:50]}...")  # 截断长错误信息
-        QMessageBox.warning(self, "JSON解析错误", err_msg)
+        self.notify(LEVEL_ERROR, "JSON解析错误", err_msg, key="json_parse_error")
 
     # 由于代码长度限制，以下方法保持原有实现，只列出方法签名
     def on_ip_confirm(self):
         new_ip = self.ip_input.text().strip()
 
         if not is_valid_ipv4(new_ip):
-            QMessageBox.warning(self, "IP格式错误", f"请输入有效的IPv4地址（如：192.168.1.100），当前输入：{new_ip}")
+            self.notify(LEVEL_WARNING, "IP格式错误", f"请输入有效的IPv4地址（如：192.168.1.100），当前输入：{new_ip}")
             self.ip_input.setText(self.current_local_ip)
             return
 
         if new_ip == self.current_local_ip:
-            QMessageBox.information(self, "IP未变化", f"当前IP已为：{new_ip}，无需修改")
+            self.notify(LEVEL_INFO, "IP未变化", f"当前IP已为：{new_ip}，无需修改")
             return
 
-        # 停止现有服务
-        self.stop_network_services()
+        # 只重新绑定6677/6699服务（失败时保留原IP）；指令连接由系统路由，与本机监听地址无关，
+        # 设备可达时会话保持，断开后照常重连
         self.server_status_label.setText(f"服务状态: 正在切换IP至 {new_ip}...")
-        QtWidgets.QApplication.processEvents()
-
-        # 更新IP并重启服务
+        if not self.start_network_services(new_ip):
+            self.ip_input.setText(self.current_local_ip)
+            return
         self.current_local_ip = new_ip
-        self.start_network_services(new_ip)
 
-        # 重置设备连接状态
-        self.on_device_disconnected("")
+    def on_worker_event(self, event, name, info):
+        """Supervisor 事件（监控线程中调用，通知中心线程安全）"""
+        label = WORKER_LABELS.get(name, name)
+        if event == "worker_down":
+            self.notify(LEVEL_ERROR, "服务中断", f"{info['reason']}，正在自动重启", key=f"worker_{name}")
+        elif event == "worker_restart_failed":
+            self.notify(LEVEL_WARNING, "重启失败", f"{label}: {info['error']}，{info['retry_in']:.0f}秒后重试",
+                        key=f"worker_{name}_retry")
+        elif event == "worker_recovered":
+            self.notify(LEVEL_INFO, "服务已恢复", f"{label} 已恢复，中断 {info['downtime']:.1f} 秒",
+                        key=f"worker_{name}_recovered")
+
+    def start_discovery(self, full_scan=True):
+        """后台搜索设备：full_scan 为 False 时只探测缓存中的已知设备（已连接的设备不探测）"""
+        if self.discovery_thread and self.discovery_thread.isRunning():
+            return
+        exclude = [self.connected_device_ip] if self.tcp_client and self.connected_device_ip else []
+        self.discover_btn.setEnabled(False)
+        self.discover_btn.setText("搜索中...")
+        self.discovery_thread = DiscoveryThread(self.device_cache, exclude, full_scan)
+        self.discovery_thread.finished_signal.connect(self.on_discovery_finished)
+        self.discovery_thread.start()
+
+    def on_discovery_finished(self, results, full_scan):
+        """搜索完成：列出设备；启动时的快速探测找到可用的已知设备且尚未连接时自动连接"""
+        self.discover_btn.setEnabled(True)
+        self.discover_btn.setText("搜索设备")
+        self.discovered_devices = results
+        self.device_combo.clear()
+        if not results:
+            self.device_combo.addItem("未发现设备")
+            if full_scan:
+                self.notify(LEVEL_WARNING, "搜索设备", "本机各网段中未发现设备（6688端口）")
+            return
+        for result in results:
+            label = result["ip"] if not result.get("name") else f"{result['name']} ({result['ip']})"
+            if not result["identified"]:
+                label += "（指令连接被占用）"
+            self.device_combo.addItem(label)
+        if full_scan:
+            self.notify(LEVEL_INFO, "搜索设备", f"发现 {len(results)} 台设备，请在列表中选择")
+        elif not self.tcp_client:
+            available = [r for r in results if r["identified"]]
+            if available:
+                self.connect_discovered_device(available[0])
+                self.notify(LEVEL_INFO, "自动连接", f"已连接上次使用的设备: {available[0]['ip']}")
+
+    def on_discovered_device_selected(self, index):
+        if 0 <= index < len(self.discovered_devices):
+            self.connect_discovered_device(self.discovered_devices[index])
+
+    def connect_discovered_device(self, result):
+        """连接搜索到的设备：本机服务切换到与设备同网段的网卡，再连接设备指令服务器"""
+        device_ip, local_ip = result["ip"], result.get("local_ip")
+        if local_ip and local_ip != self.current_local_ip:
+            self.ip_input.setText(local_ip)
+            self.on_ip_confirm()
+        self.connected_device_ip = device_ip
+        self.device_ip_label.setText(f"设备IP: {device_ip}")
+        self.device_cache.update(device_ip, local_ip=self.current_local_ip)
+        self.ensure_tcp_client_connected(device_ip)
 
     def start_network_services(self, local_ip):
-        """启动TCP/UDP服务"""
-        # 启动TCP Server
-        self.tcp_server = TcpServerThread(local_ip)
-        self.tcp_server.device_connected_signal.connect(self.on_device_connected)
-        self.tcp_server.device_disconnected_signal.connect(self.on_device_disconnected)
-        self.tcp_server.device_status_signal.connect(self.on_device_status_updated)
-        self.tcp_server.stream_complete_signal.connect(self.on_stream_complete)
-        self.tcp_server.server_status_signal.connect(self.on_server_status_change)
-        self.tcp_server.json_parse_error_signal.connect(self.on_json_parse_error)
-        self.tcp_server.start()
-
-        # 启动UDP Server
-        self.udp_server = UdpServerThread(local_ip)
-        self.udp_server.spectral_data_signal.connect(self.on_spectral_data_received)
-        self.udp_server.data_status_signal.connect(self.update_data_status)
-        self.udp_server.server_status_signal.connect(self.on_server_status_change)
-        self.udp_server.json_parse_error_signal.connect(self.on_json_parse_error)
-        self.udp_server.start()
+        """启动TCP/UDP服务（已启动时在新IP上重新绑定），返回是否成功"""
+        if self.network:
+            return self.network.restart_servers(local_ip)
+
+        # 光谱数据在网络线程中直接入队处理线程，不经过GUI事件循环
+        self.network = NetworkCore(local_ip, data_sink=self.pipeline.submit, bind_all=BIND_ALL_INTERFACES)
+        self.network_handlers = {
+            "device_connected": self.on_device_connected,
+            "device_status": self.on_device_status_updated,
+            "stream_complete": self.on_stream_complete,
+            "server_status": self.on_server_status_change,
+            "json_parse_error": self.on_json_parse_error,
+            "data_status": self.update_data_status,
+            "cmd_response": self.on_cmd_response,
+            "client_status": self.on_cmd_client_status_change,
+            "cmd_send_error": self.on_cmd_send_error,
+            "heartbeat_sent": self.on_heartbeat_sent,
+            "connection_established": self.on_client_connection_established
+        }
+        self.network_bridge = NetworkBridgeThread(self.network.events)
+        self.network_bridge.network_event_signal.connect(self.on_network_event)
+        self.network_bridge.start()
+        self.network.start()
+        return True
 
     def stop_network_services(self):
         """停止所有网络服务"""
-        if self.tcp_server:
-            self.tcp_server.stop()
-            self.tcp_server = None
-
-        if self.udp_server:
-            self.udp_server.stop()
-            self.udp_server = None
-
         if self.tcp_client:
             self.tcp_client.stop()
             self.tcp_client = None
 
+        if self.network:
+            self.network.stop()
+            self.network_bridge.wait(3000)
+            self.network = None
+            self.network_bridge = None
+
+    def on_network_event(self, event, device_ip, args):
+        """网络事件分发（主线程）：指令客户端事件只处理当前设备的，忽略已断开设备的迟到事件"""
+        if event in CLIENT_EVENTS and (not self.tcp_client or device_ip != self.tcp_client.device_ip):
+            return
+        handler = self.network_handlers.get(event)
+        if handler:
+            handler(*args)
+
     def on_device_connected(self, device_info):
         """设备连接：修复竞争条件"""
         print(f"[MainWindow] 收到设备连接信息: {device_info}")
@@ -1898,6 +1618,7 @@ class SpectrometerUpperPC(QMainWindow):
         # 更新连接状态
         self.connected_device_ip = device_ip
         self.tcp_server_connected = True  # 确保标记为已连接
+        self.device_cache.update(device_ip, name=device_info.get("device"), local_ip=self.current_local_ip)
         
         print(f"[MainWindow] 设备发现: {device_ip}")
 
@@ -1937,7 +1658,8 @@ class SpectrometerUpperPC(QMainWindow):
     def on_cmd_send_error(self, err_msg):
         """指令发送错误提示（优化弹窗）"""
         self.cmd_response_label.setText(f"指令响应: {err_msg}")
-        QMessageBox.warning(self, "指令发送错误", err_msg + "\n可能是设备连接已断开，请检查设备状态")
+        self.notify(LEVEL_ERROR, "指令发送错误", err_msg + "，可能是设备连接已断开，请检查设备状态",
+                    key="cmd_send_error")
 
     def send_measurement_commands(self):
         """发送测量相关指令 - 优化版本"""
@@ -1952,13 +1674,13 @@ class SpectrometerUpperPC(QMainWindow):
             QTimer.singleShot(i * 200, lambda c=cmd: self.tcp_client.send_cmd(c))
 
     def check_udp_stream_before_measurement(self):
-        """测量前检查UDP数据流状态"""
-        if not hasattr(self.udp_server, 'last_data_time') or time.time() - self.udp_server.last_data_time > 5:
-            reply = QMessageBox.question(self, "UDP数据流中断", 
-                                    "UDP数据流已中断，测量可能无法获取数据。\n是否继续测量？",
-                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
-            if reply == QMessageBox.No:
-                return False
+        """测量前检查UDP数据流状态（允许的静默时间随数据流间隔增加，间隔较长的正常数据流不会被误判）"""
+        stale_after = self.stream_interval_spin.value() / 1000 + STREAM_STALE_MARGIN
+        if not self.network or time.time() - self.network.last_data_time > stale_after:
+            # 不弹出询问框阻塞事件循环：直接放弃本次测量并提示
+            self.notify(LEVEL_WARNING, "UDP数据流中断",
+                        "UDP数据流已中断，测量无法获取数据，已取消本次测量。请确认数据流后重试")
+            return False
         return True
 
     def on_server_status_change(self, is_success, status_msg):
@@ -1969,7 +1691,8 @@ class SpectrometerUpperPC(QMainWindow):
         else:
             self.server_status_label.setText(f"服务状态: {status_msg}")
             self.server_status_label.setStyleSheet("color: #C62828; padding: 2px 8px;")
-            QMessageBox.warning(self, "服务启动失败", status_msg + "\n请检查IP或端口是否被占用")
+            self.notify(LEVEL_ERROR, "服务启动失败", status_msg + "，请检查IP或端口是否被占用",
+                        key="server_status_error")
 
     def update_ui(self):
         """定期刷新UI（同步控件与设备状态）"""
@@ -1998,17 +1721,10 @@ class SpectrometerUpperPC(QMainWindow):
             print(f"[MainWindow] 停止旧TCP Client")
             self.tcp_client.stop()
             self.tcp_client = None
-            QThread.msleep(300)  # 增加等待时间确保线程完全停止
 
-        # 创建新TCP Client
+        # 创建新TCP Client（在网络核心的事件循环中连接）
         print(f"[MainWindow] 启动TCP Client连接: {device_ip}:6688")
-        self.tcp_client = TcpClientThread(device_ip)
-        self.tcp_client.cmd_response_signal.connect(self.on_cmd_response)
-        self.tcp_client.client_status_signal.connect(self.on_cmd_client_status_change)
-        self.tcp_client.cmd_send_error_signal.connect(self.on_cmd_send_error)
-        self.tcp_client.heartbeat_sent_signal.connect(self.on_heartbeat_sent)
-        self.tcp_client.connection_established_signal.connect(self.on_client_connection_established)
-        self.tcp_client.start()
+        self.tcp_client = self.network.connect_device(device_ip)
 
         print(f"[MainWindow] 指令服务器Client启动完成")
 
@@ -2103,36 +1819,46 @@ class SpectrometerUpperPC(QMainWindow):
                 print(f"[Sync] TCP Client状态不一致: UI={self.tcp_client_connected}, Actual={actual_client_connected}")
                 self.tcp_client_connected = actual_client_connected
 
-    def on_spectral_data_received(self, json_data):
-        """处理UDP光谱数据 - 增强版，自动更新统计"""
-        spectral_data, err_msg = self.data_processor.parse_spectral_data(json_data)
-        if not spectral_data:
-            self.cmd_response_label.setText(f"指令响应: 光谱数据解析错误: {err_msg}")
+    def refresh_live_plot(self, force=False):
+        """刷新实时绘图：只在处理线程有新数据时读取快照渲染"""
+        version = self.pipeline.version
+        if not force and version == self.rendered_version:
             return
+        self.rendered_version = version
 
         # 更新绘图数据
-        x_data = [d[self.x_axis_mode] for d in self.data_processor.spectral_cache]
-        for i, (curve, config) in enumerate(zip(self.plot_curves, CHANNEL_CONFIG)):
-            if self.selected_channels[i]:
-                y_data = [d[config["name"]] for d in self.data_processor.spectral_cache]
-                curve.setData(x_data, y_data)
-            else:
-                curve.clear()
+        if self.history_span and self.history:
+            self.plot_history()
+        elif self.lod:
+            self.plot_live_lod()
+        else:
+            x_data, y_data = self.data_processor.snapshot_columns(self.x_axis_mode)
+            for i, (curve, config) in enumerate(zip(self.plot_curves, CHANNEL_CONFIG)):
+                if self.selected_channels[i]:
+                    curve.setData(x_data, y_data[config["name"]])
+                else:
+                    curve.clear()
 
         # 同步数据流计数UI
-        if "streamCount" in spectral_data:
+        spectral_data = self.data_processor.latest()
+        if spectral_data and "streamCount" in spectral_data:
             current_count = spectral_data["streamCount"]
             remaining_count = self.target_stream_count - current_count if self.current_stream_mode == "fixed" else 0
             self.current_count_label.setText(f"当前计数: {current_count}")
             self.remaining_count_label.setText(f"剩余计数: {remaining_count}")
         
-        # 自动更新数据统计（每次收到新数据时）
+        # 自动更新数据统计
         self.update_data_stats()
 
+    @pyqtSlot(str)
+    def on_spectral_parse_error(self, err_msg):
+        """处理线程解析错误"""
+        self.cmd_response_label.setText(f"指令响应: 光谱数据解析错误: {err_msg}")
+
     def toggle_data_stream(self):
         """开启/关闭数据流 - 修复：开启时同时发送暂停指令"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制数据流！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制数据流！")
             return
 
         if not self.data_stream_active:
@@ -2186,7 +1912,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_stream_mode(self, index):
         """设置数据流模式（continuous/fixed）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法设置数据流模式！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法设置数据流模式！")
             return
 
         # 更新本地模式
@@ -2209,10 +1935,10 @@ class SpectrometerUpperPC(QMainWindow):
     def set_stream_count(self):
         """设置fixed模式的目标发送次数"""
         if self.current_stream_mode != "fixed":
-            QMessageBox.warning(self, "警告", "仅在「指定次数模式」下可设置目标次数！")
+            self.notify(LEVEL_WARNING, "警告", "仅在「指定次数模式」下可设置目标次数！")
             return
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法设置目标次数！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法设置目标次数！")
             return
 
         self.target_stream_count = self.stream_count_spin.value()
@@ -2225,10 +1951,10 @@ class SpectrometerUpperPC(QMainWindow):
     def toggle_stream_pause(self):
         """暂停/继续数据流 - 修复状态同步"""
         if not self.data_stream_active:
-            QMessageBox.warning(self, "警告", "数据流未开启，无法暂停/继续！")
+            self.notify(LEVEL_WARNING, "警告", "数据流未开启，无法暂停/继续！")
             return
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制数据流！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制数据流！")
             return
 
         # 切换暂停状态
@@ -2258,10 +1984,10 @@ class SpectrometerUpperPC(QMainWindow):
     def reset_stream_count(self):
         """重置数据流计数（fixed模式）"""
         if self.current_stream_mode != "fixed":
-            QMessageBox.warning(self, "警告", "仅在「指定次数模式」下可重置计数！")
+            self.notify(LEVEL_WARNING, "警告", "仅在「指定次数模式」下可重置计数！")
             return
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法重置计数！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法重置计数！")
             return
 
         success = self.tcp_client.send_cmd({"streamReset": True})
@@ -2273,12 +1999,12 @@ class SpectrometerUpperPC(QMainWindow):
     def set_stream_interval(self):
         """设置数据流间隔（修复最小间隔验证）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法设置间隔！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法设置间隔！")
             return
 
         interval = self.stream_interval_spin.value()
         if interval < MIN_STREAM_INTERVAL:
-            QMessageBox.warning(self, "间隔过小", f"数据流最小间隔为 {MIN_STREAM_INTERVAL} ms，请重新设置！")
+            self.notify(LEVEL_WARNING, "间隔过小", f"数据流最小间隔为 {MIN_STREAM_INTERVAL} ms，请重新设置！")
             self.stream_interval_spin.setValue(MIN_STREAM_INTERVAL)
             return
 
@@ -2289,7 +2015,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_as7341_led(self, state):
         """控制AS7341 LED（修复指令字段，匹配设备协议）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制设备！")
             return
 
         led_state = (state == Qt.Checked)
@@ -2301,7 +2027,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_as7341_bright(self, value):
         """设置AS7341 LED亮度（修复指令字段）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制设备！")
             return
 
         success = self.tcp_client.send_cmd({"as7341Brightness": value})
@@ -2311,7 +2037,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_uv_led(self, state):
         """控制UV LED（修复指令字段）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制设备！")
             return
 
         led_state = (state == Qt.Checked)
@@ -2323,7 +2049,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_uv_bright(self, value):
         """设置UV LED亮度（修复指令字段）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制设备！")
             return
 
         success = self.tcp_client.send_cmd({"uvBrightness": value})
@@ -2333,7 +2059,7 @@ class SpectrometerUpperPC(QMainWindow):
     def set_buzzer(self, state):
         """控制蜂鸣器（修复指令字段）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法控制设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法控制设备！")
             return
 
         buzzer_state = (state == Qt.Checked)
@@ -2345,7 +2071,7 @@ class SpectrometerUpperPC(QMainWindow):
     def get_device_status(self):
         """主动获取设备状态（新增，匹配设备协议）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法获取设备状态！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法获取设备状态！")
             return
 
         success = self.tcp_client.send_cmd({"getDeviceStatus": True})
@@ -2355,7 +2081,7 @@ class SpectrometerUpperPC(QMainWindow):
     def reboot_device(self):
         """设备重启（新增，带确认提示）"""
         if not self.tcp_client or not self.tcp_client.is_connected():
-            QMessageBox.warning(self, "警告", "未连接指令服务器，无法重启设备！")
+            self.notify(LEVEL_WARNING, "警告", "未连接指令服务器，无法重启设备！")
             return
 
         # 确认重启
@@ -2393,16 +2119,26 @@ class SpectrometerUpperPC(QMainWindow):
 
     def save_data_record(self):
         """保存记录数据（修复错误提示）"""
-        success, msg = self.data_processor.save_to_csv(self.data_processor.record_data)
+        if not self.data_processor.record_data:
+            self.notify(LEVEL_WARNING, "保存失败", "无数据可保存")
+            return
+
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存光谱数据", default_record_filename(), "CSV Files (*.csv);;All Files (*)"
+        )
+        if not file_path:
+            return
+
+        success, msg = self.data_processor.save_to_csv(self.data_processor.record_data, file_path)
         if success:
-            QMessageBox.information(self, "保存成功", msg)
+            self.notify(LEVEL_INFO, "保存成功", msg)
         else:
-            QMessageBox.warning(self, "保存失败", msg)
+            self.notify(LEVEL_WARNING, "保存失败", msg)
 
     def clear_all_data(self):
         """清空所有数据（缓存和记录数据）"""
         if self.data_processor.recording:
-            QMessageBox.warning(self, "警告", "正在记录中，无法清空数据！")
+            self.notify(LEVEL_WARNING, "警告", "正在记录中，无法清空数据！")
             return
             
         reply = QMessageBox.question(self, "确认清空", "确定要清空所有数据吗？\n这将清除：\n- 绘图缓存数据\n- 已记录的数据\n此操作不可撤销！",
@@ -2410,6 +2146,10 @@ class SpectrometerUpperPC(QMainWindow):
         if reply == QMessageBox.Yes:
             # 清空缓存数据
             self.data_processor.clear_cache_data()
+            if self.lod:
+                self.lod.clear()
+            if self.history:
+                self.history.clear()
             # 清空记录数据
             self.data_processor.clear_record_data()
             # 清空绘图
@@ -2433,8 +2173,7 @@ class SpectrometerUpperPC(QMainWindow):
         """更新通道选择状态"""
         self.selected_channels[channel_idx] = (state == Qt.Checked)
         # 立即刷新绘图
-        if self.data_processor.spectral_cache:
-            self.on_spectral_data_received(self.data_processor.spectral_cache[-1] if self.data_processor.spectral_cache else {})
+        self.refresh_live_plot(force=True)
 
     def select_all_channels(self):
         """全选通道"""
@@ -2444,8 +2183,7 @@ class SpectrometerUpperPC(QMainWindow):
             if checkbox:
                 checkbox.setChecked(True)
         # 刷新绘图
-        if self.data_processor.spectral_cache:
-            self.on_spectral_data_received(self.data_processor.spectral_cache[-1] if self.data_processor.spectral_cache else {})
+        self.refresh_live_plot(force=True)
 
     def select_no_channels(self):
         """全不选通道"""
@@ -2461,113 +2199,64 @@ class SpectrometerUpperPC(QMainWindow):
     def change_x_axis_mode(self, index):
         """切换横轴模式（packetCount/timestamp）"""
         self.x_axis_mode = "packetCount" if index == 0 else "timestamp"
-        self.plot_view.setLabel("bottom", f"横轴: {self.x_axis_mode}")
+        if self.plot_view and not self.history_span:
+            self.plot_view.setLabel("bottom", f"横轴: {self.x_axis_mode}")
         # 刷新绘图
-        if self.data_processor.spectral_cache:
-            self.on_spectral_data_received(self.data_processor.spectral_cache[-1] if self.data_processor.spectral_cache else {})
-    
-    def start_measurement_sequence(self):
-        """开始测量序列 - 修复版本"""
-        print("[Measurement] 开始测量序列")
-        self.measurement_state = "led_only"
-        self.measurement_count = 0
-        self.led_only_data = []
-        self.uv_only_data = []
-        self.led_uv_data = []
-        
-        # 记录当前UDP数据包计数，用于检测新数据
-        self.measurement_start_packet_count = 0
-        if self.data_processor.spectral_cache:
-            self.measurement_start_packet_count = self.data_processor.spectral_cache[-1].get("packetCount", 0)
-        
-        # 确保所有灯关闭
-        self.tcp_client.send_cmd({"as7341Led": False})
-        self.tcp_client.send_cmd({"uvLed": False})
-        
-        # 暂停数据流
-        self.pause_data_stream_for_measurement()
-        
-        # 等待设备响应
-        QTimer.singleShot(1000, self.start_led_only_measurement)
-
-    def start_led_only_measurement(self):
-        """开始LED only测量 - 修复版本"""
-        print("[Measurement] 开始LED only测量")
-        self.measurement_status_label.setText("测量状态: LED Only测量中...")
-        self.measurement_count = 0
-        
-        # 开启LED，关闭UV
-        self.tcp_client.send_cmd({"as7341Led": True})
-        self.tcp_client.send_cmd({"uvLed": False})
-        
-        # 等待LED稳定并开始收集数据
-        QTimer.singleShot(1000, self.begin_led_only_data_collection)
-
-    def begin_led_only_data_collection(self):
-        """开始LED only数据收集 - 修复版本"""
-        print("[Measurement] 开始收集LED only数据")
-        self.measurement_count = 0
-        self.led_only_data = []
-        
-        # 记录开始时的数据包计数
-        start_packet_count = 0
-        if self.data_processor.spectral_cache:
-            start_packet_count = self.data_processor.spectral_cache[-1].get("packetCount", 0)
-        
-        # 开始收集数据，等待UDP数据到来
-        self.collect_measurement_data("led_only", start_packet_count)
-
-    def collect_measurement_data(self, measurement_type, start_packet_count, retry_count=0):
-        """收集测量数据 - 修复版本：等待UDP数据"""
-        max_retries = 10  # 最大重试次数
-        retry_delay = 500  # 重试延迟(ms)
-        
-        # 检查是否有新数据
-        current_packet_count = 0
-        if self.data_processor.spectral_cache:
-            current_packet_count = self.data_processor.spectral_cache[-1].get("packetCount", 0)
-        
-        if current_packet_count > start_packet_count:
-            # 有新数据，收集它
-            latest_data = self.data_processor.spectral_cache[-1].copy()
-            latest_data["measurement_type"] = measurement_type
-            latest_data["measurement_index"] = self.measurement_count
-            
-            if measurement_type == "led_only":
-                self.led_only_data.append(latest_data)
-            elif measurement_type == "uv_only":
-                self.uv_only_data.append(latest_data)
-            elif measurement_type == "led_uv":
-                self.led_uv_data.append(latest_data)
-            
-            self.measurement_count += 1
-            print(f"[Measurement] {measurement_type} 收集到第 {self.measurement_count} 个数据点")
-            
-            if self.measurement_count < self.measurement_target:
-                # 继续收集下一个点
-                QTimer.singleShot(200, lambda: self.collect_measurement_data(
-                    measurement_type, current_packet_count, 0))
+        self.refresh_live_plot(force=True)
+
+    def change_history_span(self, index):
+        """切换实时绘图显示范围（绘图缓存或最近一段时间的历史）"""
+        self.history_span = HISTORY_SPANS[index][1]
+        if self.plot_view:
+            if self.history_span:
+                unit = "小时" if self.history_span >= 86400 else "分钟"
+                self.plot_view.setLabel("bottom", f"横轴: 时间（{unit}，相对当前）")
             else:
-                # 完成当前阶段测量
-                self.finish_measurement_stage(measurement_type)
+                self.plot_view.setLabel("bottom", f"横轴: {self.x_axis_mode}")
+        self.refresh_live_plot(force=True)
+
+    def on_live_range_changed(self, *args):
+        """实时绘图横轴范围变化：只有手动范围（LOD取数依赖可见范围）才重新渲染；
+        自动范围时的变化由 setData 本身引起，重新渲染只会重复一次相同的绘制"""
+        if self.history_span or not self.lod or self.plot_view.getViewBox().autoRangeEnabled()[0]:
+            return
+        self.refresh_live_plot(force=True)
+
+    def plot_live_lod(self):
+        """从 min/max 金字塔只取可见范围、按绘图宽度（像素）取样：自动范围时显示最近 MAX_DATA_CACHE 个点，
+        手动缩放/平移后显示当前可见的横轴范围（可回看绘图缓存之前的数据）"""
+        view_box = self.plot_view.getViewBox()
+        pixels = max(100, int(view_box.width()))
+        if view_box.autoRangeEnabled()[0]:
+            x_data, y_data = self.lod.query_last(MAX_DATA_CACHE, pixels, self.x_axis_mode)
         else:
-            # 没有新数据，重试或放弃
-            if retry_count < max_retries:
-                print(f"[Measurement] {measurement_type} 等待数据中... (重试 {retry_count + 1}/{max_retries})")
-                QTimer.singleShot(retry_delay, lambda: self.collect_measurement_data(
-                    measurement_type, start_packet_count, retry_count + 1))
+            x0, x1 = view_box.viewRange()[0]
+            x_data, y_data = self.lod.query_x_range(x0, x1, pixels, self.x_axis_mode)
+        for i, curve in enumerate(self.plot_curves):
+            if self.selected_channels[i]:
+                curve.setData(x_data, y_data[:, i])
             else:
-                print(f"[Measurement] {measurement_type} 数据收集超时")
-                self.finish_measurement_stage(measurement_type, timeout=True)
+                curve.clear()
 
+    def plot_history(self):
+        """按显示范围从历史中取数据（自动选择原始/秒/分钟/小时层级，点数有上限），绘制各通道均值"""
+        series = self.history.series(self.history_span)
+        scale = 3600 if self.history_span >= 86400 else 60
+        x_data = (series["time"] - time.time()) / scale
+        for i, curve in enumerate(self.plot_curves):
+            if self.selected_channels[i]:
+                curve.setData(x_data, series["mean"][:, i])
+            else:
+                curve.clear()
+    
     def finish_measurement_stage(self, measurement_type, timeout=False):
-        """完成测量阶段 - 修复版本"""
+        """完成测量阶段"""
         if measurement_type == "led_only":
             print(f"[Measurement] LED only测量完成，收集{len(self.led_only_data)}个数据点")
             self.tcp_client.send_cmd({"as7341Led": False})  # 关闭LED
             
             if timeout and len(self.led_only_data) == 0:
-                QMessageBox.warning(self, "测量失败", "LED Only测量超时，未收到任何数据！")
+                self.notify(LEVEL_ERROR, "测量失败", "LED Only测量超时，未收到任何数据！")
                 self.cancel_measurement_sequence()
                 return
                 
@@ -2578,7 +2267,7 @@ class SpectrometerUpperPC(QMainWindow):
             self.tcp_client.send_cmd({"uvLed": False})  # 关闭UV
             
             if timeout and len(self.uv_only_data) == 0:
-                QMessageBox.warning(self, "测量失败", "UV Only测量超时，未收到任何数据！")
+                self.notify(LEVEL_ERROR, "测量失败", "UV Only测量超时，未收到任何数据！")
                 self.cancel_measurement_sequence()
                 return
                 
@@ -2591,39 +2280,39 @@ class SpectrometerUpperPC(QMainWindow):
             self.tcp_client.send_cmd({"uvLed": False})
             
             if timeout and len(self.led_uv_data) == 0:
-                QMessageBox.warning(self, "测量失败", "LED+UV测量超时，未收到任何数据！")
+                self.notify(LEVEL_ERROR, "测量失败", "LED+UV测量超时，未收到任何数据！")
                 self.cancel_measurement_sequence()
                 return
             
-            # 保存测量数据
-            self.save_measurement_data()
-            
-            # 恢复数据流状态
-            if self.data_stream_active:
-                self.resume_data_stream_after_measurement()
+            # 保存本次测量数据到会话并更新测量绘图
+            self.save_single_measurement()
+            self.update_measurement_plots()
                 
             # 重置测量状态
             self.measurement_state = "idle"
             self.measurement_status_label.setText("测量状态: 完成")
+
+            # 更新统计信息
+            self.current_measurement_group += 1
+            self.measurement_stats_label.setText(f"已完成测量: {self.current_measurement_group}次")
             
             # 显示完成消息
             total_points = len(self.led_only_data) + len(self.uv_only_data) + len(self.led_uv_data)
-            status_msg = f"测量完成！共收集{total_points}个数据点"
+            status_msg = f"第{self.current_measurement_group}次测量完成！共收集{total_points}个数据点"
             if timeout:
                 status_msg += " (部分测量超时)"
             self.cmd_response_label.setText(f"指令响应: {status_msg}")
-            QMessageBox.information(self, "测量完成", status_msg)
+            self.notify(LEVEL_INFO, "测量完成", status_msg)
 
     def cancel_measurement_sequence(self):
         """取消测量序列"""
         print("[Measurement] 取消测量序列")
+        self.measurement_timeout_timer.stop()
+        self.pipeline.cancel_collection()
         # 关闭所有灯
-        self.tcp_client.send_cmd({"as7341Led": False})
-        self.tcp_client.send_cmd({"uvLed": False})
-        
-        # 恢复数据流状态
-        if self.data_stream_active:
-            self.resume_data_stream_after_measurement()
+        if self.tcp_client:
+            self.tcp_client.send_cmd({"as7341Led": False})
+            self.tcp_client.send_cmd({"uvLed": False})
             
         # 重置测量状态
         self.measurement_state = "idle"
@@ -2636,9 +2325,21 @@ class SpectrometerUpperPC(QMainWindow):
         self.timer_measurement_enabled = False
         if self.timer_measurement_timer.isActive():
             self.timer_measurement_timer.stop()
+        self.supervisor.stop()
         self.stop_network_services()
         self.connection_check_timer.stop()
         self.ui_update_timer.stop()
+        self.plot_refresh_timer.stop()
+        self.measurement_timeout_timer.stop()
+        self.pipeline.stop()
+        if self.discovery_thread:
+            self.discovery_thread.wait(3000)
+        if self.shm_ring is not None:
+            self.shm_ring.close()
+        if self.stream_server is not None:
+            self.stream_server.stop()
+        if self.session_db is not None:
+            self.session_db.close()
         event.accept()
 
 # ========================== 程序入口 ==========================
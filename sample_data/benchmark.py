@@ -0,0 +1,74 @@
+# benchmark.py
+# 对比逐通道 time_series_spike_filter 与向量化 spike_filter_frames 的耗时，并校验结果一致
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from process import (CHANNELS, CONDITION_FOLDERS, WINDOW_SIZE, JUMP_THRESHOLD,
+                     time_series_spike_filter, spike_filter_frames)
+
+# ---------------------- 1. Basic Configuration ----------------------
+DEFAULT_SIZES = [10**4, 10**5, 10**6, 10**7]  # 会话总行数
+BASELINE_LIMIT = 10**7   # 超过该行数不再运行逐通道版本（耗时过长）
+SPIKE_RATIO = 0.01       # 合成数据中的突变比例
+
+# ---------------------- 2. Synthetic session ----------------------
+def make_session(n_rows, seed=0):
+    """
+    生成合成会话：n_rows 行平均分到三个光照条件，每个条件一个 DataFrame（时间点 x 8通道），
+    数据为缓慢漂移 + 噪声 + 少量突变
+    """
+    rng = np.random.default_rng(seed)
+    n = max(1, n_rows // len(CONDITION_FOLDERS))
+    frames = []
+    for _ in CONDITION_FOLDERS:
+        trend = np.linspace(0, 50, n)[:, None] + rng.uniform(100, 1000, len(CHANNELS))[None, :]
+        values = trend + rng.normal(0, 3, (n, len(CHANNELS)))
+        spikes = rng.random(values.shape) < SPIKE_RATIO
+        values[spikes] *= rng.uniform(2, 5, spikes.sum())
+        frames.append(pd.DataFrame(np.round(values), columns=CHANNELS))
+    return frames
+
+# ---------------------- 3. Filters under test ----------------------
+def run_baseline(frames):
+    out = []
+    for f in frames:
+        f = f.copy()
+        for ch in CHANNELS:
+            f[ch] = time_series_spike_filter(f[ch], window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD)
+        out.append(f)
+    return out
+
+def run_vectorized(frames):
+    out = [f.astype(float) for f in frames]
+    return spike_filter_frames(out, CHANNELS, window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD)
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+# ---------------------- 4. Main ----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Spike filter benchmark (per-channel vs vectorized)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="session sizes in rows")
+    parser.add_argument("--baseline-limit", type=int, default=BASELINE_LIMIT,
+                        help="skip the per-channel filter above this many rows")
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'per-channel (s)':>16} {'vectorized (s)':>15} {'speedup':>8}  identical")
+    for n_rows in args.sizes:
+        frames = make_session(n_rows)
+        vectorized, t_vec = timed(run_vectorized, frames)
+
+        if n_rows <= args.baseline_limit:
+            baseline, t_base = timed(run_baseline, frames)
+            identical = all(np.array_equal(a[CHANNELS].to_numpy(), b[CHANNELS].to_numpy(), equal_nan=True)
+                            for a, b in zip(baseline, vectorized))
+            print(f"{n_rows:>10} {t_base:>16.3f} {t_vec:>15.3f} {t_base / t_vec:>7.1f}x  {identical}")
+        else:
+            print(f"{n_rows:>10} {'-':>16} {t_vec:>15.3f} {'-':>8}  -")
+
+if __name__ == "__main__":
+    main()
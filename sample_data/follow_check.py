@@ -0,0 +1,86 @@
+# follow_check.py
+# 回放校验 SessionFollower：模拟上位机每次测量后整体重写会话CSV（随机新增行数，重写过程中文件可能暂时变短、
+# 末行不完整），每次重写完成后比较增量结果与 load_and_preprocess_data 对同一文件的完整重算结果
+import os
+import io
+import sys
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+from process import CHANNELS, CONDITION_FOLDERS, DATA_PATH, SessionFollower, load_and_preprocess_data
+
+# ---------------------- 1. Basic Configuration ----------------------
+DEFAULT_RUNS = 5         # 回放次数（每次使用不同的随机种子）
+MAX_NEW_LINES = 200      # 每次重写最多新增的行数
+PARTIAL_RATIO = 0.5      # 重写前先写入不完整内容（截断/末行不完整）并轮询一次的概率
+
+# ---------------------- 2. Replay ----------------------
+def line_ends(content):
+    """各完整行末尾的字节偏移（第一项为表头结束处）"""
+    return (np.flatnonzero(np.frombuffer(content, dtype=np.uint8) == ord("\n")) + 1).tolist()
+
+def full_result(path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return load_and_preprocess_data(path)
+
+def same_frame(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return (len(a) == len(b)
+            and np.array_equal(a["measurement_time"].to_numpy(), b["measurement_time"].to_numpy())
+            and np.array_equal(a[CHANNELS].to_numpy(dtype=float), b[CHANNELS].to_numpy(dtype=float), equal_nan=True))
+
+def write_file(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+def replay(content, path, seed):
+    """回放一次，返回 (重写次数, 中途不完整写入次数, 不一致的重写次数)"""
+    rng = np.random.default_rng(seed)
+    ends = line_ends(content)
+    follower = SessionFollower(path)
+    write_file(path, b"")
+    line, steps, partials, mismatches = 0, 0, 0, 0
+    while line < len(ends) - 1:
+        line = min(len(ends) - 1, line + int(rng.integers(1, MAX_NEW_LINES + 1)))
+        new = content[:ends[line]]
+        if rng.random() < PARTIAL_RATIO:
+            write_file(path, new[:int(rng.integers(0, len(new)))])
+            follower.poll()
+            partials += 1
+        write_file(path, new)
+        follower.poll()
+        steps += 1
+
+        expected = full_result(path)
+        bad = [cond for cond in CONDITION_FOLDERS if not same_frame(follower.processed[cond], expected.get(cond))]
+        if bad:
+            mismatches += 1
+            print(f"  seed {seed}, {line} rows: follower differs from full reload for {bad}")
+    return steps, partials, mismatches
+
+# ---------------------- 3. Main ----------------------
+def main():
+    parser = argparse.ArgumentParser(description="Replay a session as incremental rewrites and check that "
+                                                 "SessionFollower matches a full reload after every rewrite")
+    parser.add_argument("session", nargs="?", default=DATA_PATH, help=f"session file (default: {DATA_PATH})")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS, help="replays with different random seeds")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the first replay")
+    args = parser.parse_args()
+
+    with open(args.session, "rb") as f:
+        content = f.read()
+    failed = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(args.session))
+        print(f"{'seed':>6} {'rewrites':>9} {'partial':>8}  identical")
+        for seed in range(args.seed, args.seed + args.runs):
+            steps, partials, mismatches = replay(content, path, seed)
+            failed += mismatches > 0
+            print(f"{seed:>6} {steps:>9} {partials:>8}  {mismatches == 0}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
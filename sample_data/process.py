@@ -1,10 +1,30 @@
 # spectral_filter_and_plot.py
+import io
 import os
+import sys
+import glob
+import html
+import json
+import time
+import codecs
+import hashlib
+import argparse
 import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+import matplotlib
+matplotlib.use("Agg")  # 只保存图片，不需要交互式窗口（渲染子进程中也无需GUI后端）
 import matplotlib.pyplot as plt
 
+# 仓库根目录下的 spectrometer 公共模块（与上位机共用的重复测量汇总）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from spectrometer.summary import (summarize_replicates, summary_columns, TRIM_FRACTION, OUTLIER_THRESHOLD,
+                                  OUTLIER_MIN_DELTA)
+from spectrometer.kinetics import (fit_all_models, kinetics_rows, MODEL_NAMES, MAX_ITERATIONS, CONVERGENCE_TOL,
+                                   MIN_FIT_POINTS)
+
 # Try to import SciPy smoothing tools; provide fallbacks if not available
 try:
     from scipy.signal import savgol_filter
@@ -16,6 +36,10 @@ except Exception:
 # ---------------------- 1. Basic Configuration ----------------------
 DATA_PATH = "measurement_session_20251005_153547.csv"  # <- 替换为你的文件路径
 ROOT_FOLDER = "measurement_curves_spectral_colors"
+CACHE_DIR = ".process_cache"    # 预处理结果缓存目录（None 表示不使用缓存）
+CACHE_MAX_BYTES = 512 * 2**20   # 缓存总大小上限，超出时删除最久未使用的条目
+CACHE_VERSION = 2               # 预处理逻辑或缓存内容变化时递增，使旧缓存失效
+CACHE_TABLES = ["replicates", "kinetics"]  # 与预处理结果一起缓存的分析结果表（重复测量汇总、生长曲线拟合）
 CONDITION_FOLDERS = ["LED Only", "UV Only", "LED+UV"]
 
 CHANNEL_CONFIG = {
@@ -29,11 +53,33 @@ CHANNEL_CONFIG = {
     "F8": {"range": "670-690nm", "color": "#ff0000", "name": "Red"}
 }
 CHANNELS = list(CHANNEL_CONFIG.keys())
+REQUIRED_COLUMNS = ["measurement_index", "measurement_time", "measurement_type", "data_index"] + CHANNELS
+LOAD_CHUNK_ROWS = 200_000  # CSV 分块读取的行数
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"  # 上位机写入的 measurement_time 格式
+
+# 紧凑的列类型：AS7341 通道为 16 位计数值，测量类型为固定的三个类别
+COLUMN_DTYPES = {
+    "measurement_index": "int32",
+    "data_index": "int32",
+    "measurement_type": pd.CategoricalDtype(CONDITION_FOLDERS),
+    **{ch: "uint16" for ch in CHANNELS},
+}
+RENDER_WORKERS = None    # 绘图进程数（None = CPU核数，1 = 在主进程中串行绘图）
+
+# 长序列绘图：限制画布尺寸并降采样（False = 画布宽度随点数增长、绘制全部点）
+BOUNDED_RENDER = True
+MAX_FIG_WIDTH = 24       # 单通道图最大宽度（英寸）
+MAX_PLOT_POINTS = 1500   # 每条曲线最多绘制的点数（超过时 LTTB 降采样）
+MARKER_POINTS = 300      # 绘制点数不超过该值时才画数据点标记
+PAGE_POINTS = None       # 单通道图每个分页面板的点数（None = 不分页）
+MAX_PAGES = 8            # 分页面板数上限（超过时增大每页点数）
 
 # ---------------------- 2. Filtering parameters ----------------------
 WINDOW_SIZE = 5          # 滑动中位数窗口（奇数最佳）
 JUMP_THRESHOLD = 3.0     # 突变检测阈值倍数（基于MAD）
 SECOND_SMOOTH = True     # 是否在绘图时对趋势做二次平滑（savgol / fallback）
+SMALL_WINDOW = 9         # 不超过该窗口时滑动中位数使用排序网络，否则使用 np.partition
+ROLLING_CHUNK_ROWS = 4096  # 向量化滤波按行分块，限制内存占用
 
 # ---------------------- 3. Utility: folders ----------------------
 def create_folders(root, subfolders):
@@ -78,40 +124,234 @@ def time_series_spike_filter(series, window_size=WINDOW_SIZE, jump_threshold=JUM
 
     return s_filtered
 
+def _window_medians(windows):
+    """windows: (时间点, 序列数, 窗口) 且不含 NaN，返回每个窗口的中位数"""
+    window_size = windows.shape[-1]
+    mid = window_size // 2
+    if window_size % 2:
+        return np.partition(windows, mid, axis=-1)[..., mid]
+    part = np.partition(windows, [mid - 1, mid], axis=-1)
+    return (part[..., mid] + part[..., mid - 1]) / 2
+
+def _network_medians(rows):
+    """
+    小窗口的排序网络（奇偶换位排序）：rows 为窗口内各位置的 (时间点, 序列数) 数组列表，
+    只用 np.minimum/np.maximum 整块运算，返回每个窗口的中位数（含 NaN 的窗口结果无意义，由调用方替换）
+    """
+    window_size = len(rows)
+    rows = [r.copy() for r in rows]
+    spare = np.empty_like(rows[0])
+    for phase in range(window_size):
+        for j in range(phase % 2, window_size - 1, 2):
+            np.minimum(rows[j], rows[j + 1], out=spare)
+            np.maximum(rows[j], rows[j + 1], out=rows[j + 1])
+            rows[j], spare = spare, rows[j]
+    mid = window_size // 2
+    if window_size % 2:
+        return rows[mid]
+    return (rows[mid] + rows[mid - 1]) / 2
+
+def rolling_median_2d(values, window_size=WINDOW_SIZE, chunk_rows=ROLLING_CHUNK_ROWS):
+    """
+    按列的居中滑动中位数（等价于 DataFrame.rolling(window, center=True, min_periods=1).median()）
+    按行分块计算以限制内存；无 NaN 的窗口整块计算，含 NaN 的窗口（首尾、补齐部分）单独忽略 NaN 计算
+    """
+    n_rows, n_cols = values.shape
+    left = window_size // 2
+    med = np.empty((n_rows, n_cols))
+
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(n_rows, start + chunk_rows)
+        # 当前块及其前后各半个窗口，超出序列首尾的部分补 NaN
+        lo, hi = start - left, stop + window_size - 1 - left
+        block = values[max(lo, 0):min(hi, n_rows)]
+        if lo < 0 or hi > n_rows:
+            block = np.pad(block, ((max(0, -lo), max(0, hi - n_rows)), (0, 0)), constant_values=np.nan)
+        shifted = [block[i:i + stop - start] for i in range(window_size)]
+        if window_size <= SMALL_WINDOW:
+            chunk_med = _network_medians(shifted)
+        else:
+            chunk_med = _window_medians(sliding_window_view(block, window_size, axis=0))
+
+        # 含 NaN 的窗口：忽略 NaN 取中位数，全部为 NaN 时结果为 NaN
+        nan_block = np.isnan(block)
+        nan_count = np.zeros(chunk_med.shape, dtype=np.int64)
+        for i in range(window_size):
+            nan_count += nan_block[i:i + stop - start]
+        partial = (nan_count > 0) & (nan_count < window_size)
+        if np.any(partial):
+            sorted_windows = np.sort(sliding_window_view(block, window_size, axis=0)[partial], axis=-1)  # NaN 排在末尾
+            count = window_size - nan_count[partial]
+            idx = np.arange(len(count))
+            chunk_med[partial] = (sorted_windows[idx, count // 2] + sorted_windows[idx, (count - 1) // 2]) / 2
+        chunk_med[nan_count == window_size] = np.nan
+        med[start:stop] = chunk_med
+    return med
+
+def spike_filter_2d(values, window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD, lengths=None, med=None):
+    """
+    time_series_spike_filter 的二维向量化版本：每一列是一条独立的时间序列，一次处理所有列
+    （结果与逐列调用 time_series_spike_filter 完全一致）
+      values:  2-D array，shape = (时间点, 序列数)
+      lengths: 每列的有效长度（长度不同的序列在末尾补 NaN 对齐），None 表示全部有效
+      med:     已算好的 rolling_median_2d(values, window_size)（会被原地改写），None 时在此计算
+    返回 float 类型的 2-D array，补齐部分保持 NaN
+    """
+    values = np.asarray(values, dtype=float)
+    n_rows, n_cols = values.shape
+    if n_rows == 0 or n_cols == 0:
+        return values.copy()
+    lengths = np.full(n_cols, n_rows) if lengths is None else np.asarray(lengths)
+
+    # rolling median (centered)；补齐的 NaN 在窗口中被忽略，等价于序列在末尾截断
+    if med is None:
+        med = rolling_median_2d(values, window_size)
+
+    diff = np.abs(values - med)
+    diff[np.isnan(diff)] = 0.0
+
+    # MAD：按有效长度分组取中位数（通常只有几种长度）
+    mad = np.full(n_cols, np.nan)
+    for length in np.unique(lengths[lengths > 0]):
+        cols = np.flatnonzero(lengths == length)
+        part = np.partition(diff[:length, cols], [(length - 1) // 2, length // 2], axis=0)
+        mad[cols] = (part[(length - 1) // 2] + part[length // 2]) / 2
+
+    # MAD 为 0 的列退化为平均差异（与逐列版本相同，逐列计算以保证结果一致）
+    for j in np.flatnonzero(mad == 0):
+        mean_diff = np.mean(diff[:lengths[j], j])
+        mad[j] = mean_diff if mean_diff > 0 else 1e-6
+
+    threshold = jump_threshold * 1.4826 * mad  # approximate std from MAD
+
+    # 非突变点恢复原值（直接写入 med，避免再分配一个同样大小的数组）
+    valid = np.arange(n_rows)[:, None] < lengths[None, :]
+    with np.errstate(invalid="ignore"):
+        keep = ~((diff > threshold[None, :]) & valid)
+    np.copyto(med, values, where=keep)
+    return med
+
+def spike_filter_frames(frames, columns=CHANNELS, window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD):
+    """
+    对多个 DataFrame（如三个光照条件或多个孔位）的所有通道一次性去突变：
+    按列拼成一个补齐的二维数组，调用 spike_filter_2d 后写回（原地修改并返回 frames）
+    """
+    frames = [f for f in frames if f is not None and len(f) > 0]
+    if not frames:
+        return frames
+    lengths = np.repeat([len(f) for f in frames], len(columns))
+    stacked = np.full((lengths.max(), len(lengths)), np.nan)
+    for i, f in enumerate(frames):
+        stacked[:len(f), i * len(columns):(i + 1) * len(columns)] = f[columns].to_numpy(dtype=float)
+
+    filtered = spike_filter_2d(stacked, window_size, jump_threshold, lengths=lengths)
+
+    for i, f in enumerate(frames):
+        f[columns] = filtered[:len(f), i * len(columns):(i + 1) * len(columns)]
+    return frames
+
 # ---------------------- 5. Load & preprocess ----------------------
-def load_and_preprocess_data(data_path):
-    # load
+def detect_csv_encoding(data_path, block_size=1 << 20):
+    """
+    按块增量解码判断文件是否为 UTF-8（不整体读入内存），否则按 GBK 处理
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(data_path, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                decoder.decode(block, final=not block)
+                if not block:
+                    return "utf-8"
+    except UnicodeDecodeError:
+        return "gbk"
+
+def detect_bytes_encoding(data):
+    """与 detect_csv_encoding 相同的规则判断一段内容的编码：能按 UTF-8 解码则为 UTF-8，否则按 GBK 处理"""
+    try:
+        data.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError:
+        return "gbk"
+
+def _iter_session_chunks(data_path, chunksize):
+    """
+    按块读取会话文件（只读取需要的列并使用紧凑类型）
+    """
     if data_path.endswith((".xlsx", ".xls")):
         df = pd.read_excel(data_path)
-    elif data_path.endswith(".csv"):
-        # try common encodings, fallback to default
-        try:
-            df = pd.read_csv(data_path, encoding="utf-8")
-        except Exception:
-            df = pd.read_csv(data_path, encoding="gbk", errors="replace")
-    else:
+        missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
+        if missing:
+            raise ValueError(f"Missing required columns: {missing}")
+        yield df[REQUIRED_COLUMNS].astype(COLUMN_DTYPES)
+        return
+    if not data_path.endswith(".csv"):
         raise ValueError("Only CSV/XLSX supported.")
 
-    required_cols = ["measurement_index", "measurement_time", "measurement_type", "data_index"] + CHANNELS
-    missing = [c for c in required_cols if c not in df.columns]
+    encoding = detect_csv_encoding(data_path)
+    header = pd.read_csv(data_path, nrows=0, encoding=encoding, encoding_errors="replace").columns
+    missing = [c for c in REQUIRED_COLUMNS if c not in header]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
+    with pd.read_csv(data_path, usecols=REQUIRED_COLUMNS, dtype=COLUMN_DTYPES, chunksize=chunksize,
+                     encoding=encoding, encoding_errors="replace") as reader:
+        yield from reader
 
+def split_session_chunk(chunk):
+    """
+    处理一个数据块：去掉全零行、解析时间、按光照条件拆分（只保留 measurement_time 和通道列）。
+    返回 (去全零行后的行数, 时间有效的行数, {cond: DataFrame}，只含有数据的条件)
+    """
     # drop rows where all channels are zero (噪声/无测量)
-    df["total_channels"] = df[CHANNELS].sum(axis=1)
-    df_valid = df[df["total_channels"] > 0].copy()
-    df_valid = df_valid.drop(columns=["total_channels"])
-    print(f"Loaded {len(df)} rows, {len(df_valid)} rows after removing all-zero rows.")
+    chunk = chunk[chunk[CHANNELS].sum(axis=1) > 0]
+
+    times = pd.to_datetime(chunk["measurement_time"], format=TIME_FORMAT, errors="coerce")
+    if times.isna().any():
+        # 非标准格式的时间再按通用解析尝试一次
+        retry = times.isna()
+        times[retry] = pd.to_datetime(chunk.loc[retry, "measurement_time"], errors="coerce")
+
+    parts = {}
+    for cond in CONDITION_FOLDERS:
+        mask = (chunk["measurement_type"] == cond).to_numpy() & times.notna().to_numpy()
+        if mask.any():
+            part = chunk.loc[mask, CHANNELS]
+            part.insert(0, "measurement_time", times[mask])
+            parts[cond] = part
+    return len(chunk), int(times.notna().sum()), parts
+
+def load_session_chunked(data_path, chunksize=LOAD_CHUNK_ROWS):
+    """
+    流式读取会话文件：逐块去掉全零行、解析时间并按光照条件拆分，只保留 measurement_time 和通道列。
+    返回 ({cond: DataFrame 或 None}, 原始行数, 去全零行后的行数, 时间有效的行数)
+    """
+    parts = {cond: [] for cond in CONDITION_FOLDERS}
+    n_total = n_nonzero = n_valid = 0
+    for chunk in _iter_session_chunks(data_path, chunksize):
+        n_total += len(chunk)
+        chunk_nonzero, chunk_valid, chunk_parts = split_session_chunk(chunk)
+        n_nonzero += chunk_nonzero
+        n_valid += chunk_valid
+        for cond, part in chunk_parts.items():
+            parts[cond].append(part)
+
+    frames = {cond: (pd.concat(p, ignore_index=True) if p else None) for cond, p in parts.items()}
+    return frames, n_total, n_nonzero, n_valid
 
-    # ensure time col is datetime
-    df_valid["measurement_time"] = pd.to_datetime(df_valid["measurement_time"], errors="coerce")
-    df_valid = df_valid.dropna(subset=["measurement_time"])
-    print(f"{len(df_valid)} rows after dropping invalid times.")
+def load_and_preprocess_data(data_path, stats=None):
+    """
+    读取并预处理会话文件，返回 {cond: DataFrame 或 None}；
+    传入 stats 字典时填入行数统计（rows / nonzero_rows / valid_rows / time_points）
+    """
+    # load (chunked, typed)
+    frames, n_total, n_nonzero, n_valid = load_session_chunked(data_path)
+    print(f"Loaded {n_total} rows, {n_nonzero} rows after removing all-zero rows.")
+    print(f"{n_valid} rows after dropping invalid times.")
 
     processed = {}
     for cond in CONDITION_FOLDERS:
-        cond_df = df_valid[df_valid["measurement_type"] == cond].copy()
-        if cond_df.empty:
+        cond_df = frames[cond]
+        if cond_df is None:
             print(f"Warning: no data for condition '{cond}'.")
             processed[cond] = None
             continue
@@ -121,15 +361,53 @@ def load_and_preprocess_data(data_path):
         # set index order
         grouped = grouped.reset_index(drop=True)
 
-        # Apply time-series filter to each channel
-        for ch in CHANNELS:
-            grouped[ch] = time_series_spike_filter(grouped[ch], window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD)
-
         processed[cond] = grouped
         print(f"Processed condition '{cond}': {len(grouped)} time points.")
 
+    # Apply time-series filter to all channels of all conditions in one pass
+    spike_filter_frames(list(processed.values()), CHANNELS, window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD)
+
+    if stats is not None:
+        stats.update(rows=n_total, nonzero_rows=n_nonzero, valid_rows=n_valid,
+                     time_points={cond: (0 if df is None else len(df)) for cond, df in processed.items()})
     return processed
 
+def summarize_session_file(data_path, chunksize=LOAD_CHUNK_ROWS):
+    """
+    按 (measurement_index, measurement_type) 汇总整个会话的重复测量（一次分组运算）：
+    每组一行，含各通道 median/mean/trimmed_mean/cv/min/max/outliers 以及重复次数、全零行数
+    """
+    index, types, values = [], [], []
+    for chunk in _iter_session_chunks(data_path, chunksize):
+        index.append(chunk["measurement_index"].to_numpy())
+        types.append(chunk["measurement_type"].astype(str).to_numpy())
+        values.append(chunk[CHANNELS].to_numpy())
+    if not index:
+        return pd.DataFrame()
+    summary = summarize_replicates(np.concatenate(index), np.concatenate(types), np.concatenate(values))
+    return pd.DataFrame(summary_columns(summary, CHANNELS))
+
+def fit_session_kinetics(processed, workers=1):
+    """
+    对每个 (条件, 通道) 的滤波后时间序列拟合 logistic / Gompertz / Baranyi 生长模型（批量向量化），
+    时间以会话第一个时间点为0（小时）。返回整洁 DataFrame：每个序列、每个模型一行
+    """
+    frames = {cond: df for cond, df in processed.items() if df is not None and len(df)}
+    if not frames:
+        return pd.DataFrame()
+    start = min(df["measurement_time"].iloc[0] for df in frames.values())
+    n_points = max(len(df) for df in frames.values())
+    t = np.full((len(frames) * len(CHANNELS), n_points), np.nan)
+    Y = np.full_like(t, np.nan)
+    labels = []
+    for i, (cond, df) in enumerate(frames.items()):
+        hours = (df["measurement_time"] - start).dt.total_seconds().to_numpy() / 3600
+        rows = slice(i * len(CHANNELS), (i + 1) * len(CHANNELS))
+        t[rows, :len(df)] = hours
+        Y[rows, :len(df)] = df[CHANNELS].to_numpy(dtype=float).T
+        labels.extend({"condition": cond, "channel": ch} for ch in CHANNELS)
+    return pd.DataFrame(kinetics_rows(labels, fit_all_models(t, Y, workers=workers)))
+
 # ---------------------- 6. Plotting helpers ----------------------
 def compute_ylim_with_margin(y, margin_ratio=0.10, min_margin=5.0):
     if np.all(np.isnan(y)):
@@ -142,9 +420,9 @@ def compute_ylim_with_margin(y, margin_ratio=0.10, min_margin=5.0):
     margin = max((ymax - ymin) * margin_ratio, min_margin)
     return (max(ymin - margin, 0), ymax + margin)
 
-def smooth_for_plot(y):
+def smooth_for_plot(y, max_points=MAX_PLOT_POINTS):
     """
-    返回用于绘图的更密集的平滑曲线 (x_smooth, y_smooth)
+    返回用于绘图的更密集的平滑曲线 (x_smooth, y_smooth)（BOUNDED_RENDER 时最多 max(max_points, len(y)) 个点）
     优先使用 SciPy 的 savgol + cubic spline，如果不可用退化到简单移动平均 + np.interp
     """
     x = np.arange(len(y))
@@ -167,7 +445,10 @@ def smooth_for_plot(y):
         y_sg = np.convolve(y, kernel, mode='same')
 
     # upsample and spline/interp
-    x_smooth = np.linspace(0, len(y) - 1, max(200, len(y) * 10))
+    n_dense = max(200, len(y) * 10)
+    if BOUNDED_RENDER:
+        n_dense = min(n_dense, max(max_points, len(y)))
+    x_smooth = np.linspace(0, len(y) - 1, n_dense)
     if SCIPY_AVAILABLE and len(y) >= 4:
         try:
             spline = make_interp_spline(x, y_sg, k=3)
@@ -180,6 +461,42 @@ def smooth_for_plot(y):
     y_smooth = np.interp(x_smooth, x, y_sg)
     return x_smooth, y_smooth
 
+def lttb_indices(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets 降采样：返回保留点的下标（含首尾点），
+    每个桶保留与前一保留点、下一桶均值构成三角形面积最大的点，保留峰谷形状
+    """
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # 中间 n_out-2 个桶的边界
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_hi = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[hi:nxt_hi].mean()
+        avg_y = y[hi:nxt_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        idx[i + 1] = a
+    return idx
+
+def plot_points(x, y, max_points=MAX_PLOT_POINTS):
+    """返回实际绘制的 (x, y)：BOUNDED_RENDER 时最多 max_points 个点"""
+    if not BOUNDED_RENDER or len(y) <= max_points:
+        return x, y
+    idx = lttb_indices(x, y, max_points)
+    return x[idx], y[idx]
+
+def page_ranges(n):
+    """单通道图的分页面板 [(start, stop), ...]，不分页时只有一个面板"""
+    if not BOUNDED_RENDER or not PAGE_POINTS or n <= PAGE_POINTS:
+        return [(0, n)]
+    per_page = max(PAGE_POINTS, -(-n // MAX_PAGES))
+    return [(start, min(n, start + per_page)) for start in range(0, n, per_page)]
+
 # ---------------------- 7. Plot single channel ----------------------
 def plot_single_channel(cond, channel, data, save_path):
     cfg = CHANNEL_CONFIG[channel]
@@ -188,44 +505,58 @@ def plot_single_channel(cond, channel, data, save_path):
     x = np.arange(len(y))
     time_labels = times.dt.strftime("%H:%M:%S").values
 
-    fig, ax = plt.subplots(figsize=(max(10, len(y) * 0.6), 6))
-
-    # Draw points (居中于 x ticks)
-    ax.plot(x, y, marker='o', linestyle='-', linewidth=1.6,
-            markersize=7, markeredgewidth=0.9, label=f"{channel} ({cfg['range']})",
-            color=cfg["color"], alpha=0.95)
+    pages = page_ranges(len(y))
+    width = max(10, len(y) * 0.6)
+    if BOUNDED_RENDER:
+        width = min(width, MAX_FIG_WIDTH)
+    height = 6 if len(pages) == 1 else 3.5 * len(pages)
+    fig, axes = plt.subplots(len(pages), 1, figsize=(width, height), squeeze=False)
 
-    # Smooth trend (dense curve)
+    # Smooth trend (dense curve) over the whole series, sliced per panel
     x_s, y_s = smooth_for_plot(y)
-    ax.plot(x_s, y_s, linestyle='--', linewidth=2.8, alpha=0.6, label="Smoothed trend", color=cfg["color"])
+    # Y limit with margin (same for all panels)
+    ymin, ymax = compute_ylim_with_margin(y, margin_ratio=0.12, min_margin=5.0)
 
-    # labels & xticks
-    ax.set_title(f"{cond} - {channel} ({cfg['range']}, {cfg['name']})", fontsize=14)
-    ax.set_xlabel("Measurement Time")
-    ax.set_ylabel("Mean Value")
-    ax.grid(alpha=0.3)
+    for ax, (start, stop) in zip(axes[:, 0], pages):
+        # Draw points (居中于 x ticks)
+        x_p, y_p = plot_points(x[start:stop], y[start:stop])
+        show_markers = not BOUNDED_RENDER or len(x_p) <= MARKER_POINTS
+        ax.plot(x_p, y_p, marker='o' if show_markers else None, linestyle='-', linewidth=1.6,
+                markersize=7, markeredgewidth=0.9, label=f"{channel} ({cfg['range']})",
+                color=cfg["color"], alpha=0.95)
 
-    # X ticks: show at every point but rotate; if too crowded show fewer
-    max_labels = 12
-    if len(x) <= max_labels:
-        tick_idx = x
-        tick_labels = time_labels
-    else:
-        step = max(1, len(x) // max_labels)
-        tick_idx = x[::step]
-        tick_labels = time_labels[::step]
-    ax.set_xticks(tick_idx)
-    ax.set_xticklabels(tick_labels, rotation=45, ha='right', fontsize=9)
+        in_page = (x_s >= start) & (x_s <= stop - 1)
+        x_sp, y_sp = plot_points(x_s[in_page], y_s[in_page])
+        ax.plot(x_sp, y_sp, linestyle='--', linewidth=2.8, alpha=0.6, label="Smoothed trend", color=cfg["color"])
 
-    # Y limit with margin
-    ymin, ymax = compute_ylim_with_margin(y, margin_ratio=0.12, min_margin=5.0)
-    ax.set_ylim(ymin, ymax)
+        # labels & xticks
+        title = f"{cond} - {channel} ({cfg['range']}, {cfg['name']})"
+        if len(pages) > 1:
+            title += f" [{start + 1}-{stop}/{len(y)}]"
+        ax.set_title(title, fontsize=14)
+        ax.set_xlabel("Measurement Time")
+        ax.set_ylabel("Mean Value")
+        ax.grid(alpha=0.3)
+
+        # X ticks: show at every point but rotate; if too crowded show fewer
+        page_x = x[start:stop]
+        page_labels = time_labels[start:stop]
+        max_labels = 12
+        if len(page_x) <= max_labels:
+            tick_idx = page_x
+            tick_labels = page_labels
+        else:
+            step = max(1, len(page_x) // max_labels)
+            tick_idx = page_x[::step]
+            tick_labels = page_labels[::step]
+        ax.set_xticks(tick_idx)
+        ax.set_xticklabels(tick_labels, rotation=45, ha='right', fontsize=9)
 
-    ax.legend(fontsize=9)
+        ax.set_ylim(ymin, ymax)
+        ax.legend(fontsize=9)
     plt.tight_layout()
     plt.savefig(save_path, dpi=300)
     plt.close()
-    print(f"Saved: {save_path}")
 
 # ---------------------- 8. Vertical comparison (8-subplots) ----------------------
 def plot_vertical_comparison(cond, data, save_path):
@@ -251,10 +582,12 @@ def plot_vertical_comparison(cond, data, save_path):
         cfg = CHANNEL_CONFIG[ch]
         y = data[ch].values
 
-        ax.plot(x, y, marker='o', markersize=5, linewidth=1.4,
+        x_p, y_p = plot_points(x, y)
+        show_markers = not BOUNDED_RENDER or len(x_p) <= MARKER_POINTS
+        ax.plot(x_p, y_p, marker='o' if show_markers else None, markersize=5, linewidth=1.4,
                 color=cfg['color'], label=f"{ch}: {cfg['range']} ({cfg['name']})", alpha=0.9)
         # smooth
-        x_s, y_s = smooth_for_plot(y)
+        x_s, y_s = plot_points(*smooth_for_plot(y))
         ax.plot(x_s, y_s, linestyle='--', linewidth=2.2, color=cfg['color'], alpha=0.6)
 
         ax.set_ylabel("Mean Value", fontsize=10)
@@ -272,33 +605,738 @@ def plot_vertical_comparison(cond, data, save_path):
     plt.subplots_adjust(top=0.97, hspace=0.3)
     plt.savefig(save_path, dpi=300)
     plt.close()
-    print(f"Saved: {save_path}")
 
-# ---------------------- 9. Main: process & plot ----------------------
-def main():
-    print("Scipy available for smoothing?" , SCIPY_AVAILABLE)
-    folder_paths = create_folders(ROOT_FOLDER, CONDITION_FOLDERS)
-    processed = load_and_preprocess_data(DATA_PATH)
+# ---------------------- 9. Rendering stage (process pool) ----------------------
+_render_data = None  # 渲染进程中的只读数据 {cond: DataFrame}，由进程池 initializer 设置
+
+def _init_render_worker(processed):
+    """
+    进程池 initializer：每个工作进程只接收一次数据（fork 时直接继承，不再序列化），
+    而不是每个绘图任务都把整个数据集 pickle 一遍
+    """
+    global _render_data
+    _render_data = processed
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+def _render_job(job):
+    kind, cond, channel, save_path = job
+    if kind == "single":
+        plot_single_channel(cond, channel, _render_data[cond], save_path)
+    else:
+        plot_vertical_comparison(cond, _render_data[cond], save_path)
+    return save_path
 
+def build_render_jobs(processed, folder_paths):
+    """
+    生成绘图任务列表 (kind, cond, channel, save_path)，顺序与输出路径固定
+    """
+    jobs = []
     for cond in CONDITION_FOLDERS:
-        df_cond = processed.get(cond)
-        if df_cond is None:
+        if processed.get(cond) is None:
             continue
         out_dir = folder_paths[cond]
-        print(f"Generating plots for '{cond}' ({len(df_cond)} points)...")
-
         # single channel plots
         for ch in CHANNELS:
             out_file = os.path.join(out_dir, f"{cond.replace(' ', '_')}_{ch}_{CHANNEL_CONFIG[ch]['range']}.png")
-            plot_single_channel(cond, ch, df_cond, out_file)
-
+            jobs.append(("single", cond, ch, out_file))
         # vertical comparison
         out_file2 = os.path.join(out_dir, f"{cond.replace(' ', '_')}_spectral_band_comparison.png")
-        plot_vertical_comparison(cond, df_cond, out_file2)
+        jobs.append(("comparison", cond, None, out_file2))
+    return jobs
+
+def _report_progress(processed, jobs, results):
+    current = None
+    for (_, cond, _, _), save_path in zip(jobs, results):
+        if cond != current:
+            current = cond
+            print(f"Generating plots for '{cond}' ({len(processed[cond])} points)...")
+        print(f"Saved: {save_path}")
+
+def render_figures(processed, jobs, workers=RENDER_WORKERS):
+    """
+    执行绘图任务：workers > 1 时分发到进程池，结果按任务顺序输出进度（与串行时一致）
+    """
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+    if workers <= 1:
+        _init_render_worker(processed)
+        results = map(_render_job, jobs)
+        _report_progress(processed, jobs, results)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_render_worker,
+                             initargs=(processed,)) as pool:
+        _report_progress(processed, jobs, pool.map(_render_job, jobs))
+
+# ---------------------- 10. Single-file report (PDF / HTML) ----------------------
+REPORT_FORMATS = ["pdf", "html"]
+REPORT_PAGE_SIZE = (11.69, 8.27)        # 单通道页（A4 横向，英寸）
+REPORT_COMPARISON_SIZE = (8.27, 11.69)  # 8 通道对比页（A4 纵向）
+REPORT_PREVIEW_POINTS = 400             # 预览模式每条曲线最多绘制的点数（预览不画数据点标记）
+REPORT_PREVIEW_RC = {"svg.fonttype": "none"}  # 预览模式 SVG 的文字保留为文本（不转换为字形路径）
+
+class ReportRenderer:
+    """
+    单文件报告的逐页绘制：单通道页与对比页各只创建一个 Figure，所有页面复用同一组 Axes/Line2D，
+    每页只更新数据、颜色、标题和坐标轴（不经过 pyplot，不重复创建/销毁图形，也不做 tight_layout）
+    """
+
+    def __init__(self, preview=False):
+        from matplotlib.figure import Figure
+        self.max_points = REPORT_PREVIEW_POINTS if preview else MAX_PLOT_POINTS
+        self.marker_points = 0 if preview else MARKER_POINTS
+
+        self.channel_fig = Figure(figsize=REPORT_PAGE_SIZE)
+        self.channel_fig.subplots_adjust(left=0.07, right=0.98, top=0.93, bottom=0.15)
+        self.channel_ax = self.channel_fig.add_subplot()
+        self.channel_lines = self._add_lines(self.channel_ax, linewidth=1.6, markersize=5)
+        self.channel_ax.set_xlabel("Measurement Time")
+        self.channel_ax.set_ylabel("Mean Value")
+        self.channel_ax.grid(alpha=0.3)
+
+        self.comparison_fig = Figure(figsize=REPORT_COMPARISON_SIZE)
+        self.comparison_fig.subplots_adjust(left=0.1, right=0.97, top=0.95, bottom=0.08, hspace=0.3)
+        self.comparison_axes = self.comparison_fig.subplots(len(CHANNELS), 1, sharex=True)
+        self.comparison_lines = []
+        for ax in self.comparison_axes:
+            self.comparison_lines.append(self._add_lines(ax, linewidth=1.2, markersize=3))
+            ax.set_ylabel("Mean Value", fontsize=8)
+            ax.tick_params(labelsize=7)
+            ax.grid(alpha=0.25)
+
+    @staticmethod
+    def _add_lines(ax, linewidth, markersize):
+        raw, = ax.plot([], [], marker='o', linestyle='-', linewidth=linewidth, markersize=markersize, alpha=0.9)
+        smooth, = ax.plot([], [], linestyle='--', linewidth=linewidth * 1.6, alpha=0.6)
+        return raw, smooth
+
+    def _draw_series(self, ax, lines, y, color, label):
+        raw, smooth = lines
+        x = np.arange(len(y))
+        x_p, y_p = plot_points(x, y, self.max_points)
+        raw.set_data(x_p, y_p)
+        raw.set_marker('o' if len(x_p) <= self.marker_points else 'None')
+        raw.set_color(color)
+        raw.set_label(label)
+        x_s, y_s = plot_points(*smooth_for_plot(y, self.max_points), self.max_points)
+        smooth.set_data(x_s, y_s)
+        smooth.set_color(color)
+        smooth.set_label("Smoothed trend")
+        ax.set_xlim(-0.5, max(len(y) - 0.5, 0.5))
+        ax.set_ylim(*compute_ylim_with_margin(y, margin_ratio=0.12, min_margin=5.0))
+
+    @staticmethod
+    def _set_time_ticks(ax, data, max_labels=12):
+        labels = data["measurement_time"].dt.strftime("%H:%M:%S").values
+        step = max(1, len(labels) // max_labels) if len(labels) > max_labels else 1
+        ticks = np.arange(0, len(labels), step)
+        ax.set_xticks(ticks)
+        ax.set_xticklabels(labels[::step], rotation=45, ha='right', fontsize=8)
+
+    def channel_page(self, cond, channel, data):
+        cfg = CHANNEL_CONFIG[channel]
+        ax = self.channel_ax
+        self._draw_series(ax, self.channel_lines, data[channel].values, cfg["color"], f"{channel} ({cfg['range']})")
+        ax.set_title(f"{cond} - {channel} ({cfg['range']}, {cfg['name']})", fontsize=13)
+        self._set_time_ticks(ax, data)
+        ax.legend(fontsize=9, loc="upper right")
+        return self.channel_fig
+
+    def comparison_page(self, cond, data):
+        for ax, lines, ch in zip(self.comparison_axes, self.comparison_lines, CHANNELS):
+            cfg = CHANNEL_CONFIG[ch]
+            self._draw_series(ax, lines, data[ch].values, cfg["color"], f"{ch}: {cfg['range']} ({cfg['name']})")
+            ax.legend(handles=[lines[0]], loc="upper right", fontsize=7)
+        self._set_time_ticks(self.comparison_axes[-1], data)
+        self.comparison_fig.suptitle(f"{cond} Spectral Band Comparison", fontsize=13)
+        return self.comparison_fig
+
+    def pages(self, processed):
+        """按 条件 -> 对比页、各通道页 的顺序生成 (标题, Figure)（同一 Figure 对象会被下一页复用）"""
+        for cond in CONDITION_FOLDERS:
+            data = processed.get(cond)
+            if data is None or len(data) == 0:
+                continue
+            yield f"{cond} - spectral band comparison", self.comparison_page(cond, data)
+            for ch in CHANNELS:
+                yield f"{cond} - {ch} ({CHANNEL_CONFIG[ch]['range']})", self.channel_page(cond, ch, data)
+
+def write_pdf_report(processed, path, title="", preview=False):
+    """所有条件、通道的图写入一个多页 PDF（矢量），返回页数"""
+    from matplotlib.backends.backend_pdf import PdfPages
+    renderer = ReportRenderer(preview)
+    n_pages = 0
+    with PdfPages(path, metadata={"Title": title or "Spectral report"}) as pdf:
+        for _, fig in renderer.pages(processed):
+            pdf.savefig(fig)
+            n_pages += 1
+    return n_pages
+
+def write_html_report(processed, path, title="", preview=False):
+    """
+    所有条件、通道的图写入一个自包含 HTML（内嵌 SVG 矢量图；预览模式点数更少、不画数据点标记、
+    文字保留为文本，绘制与文件都更轻），返回页数
+    """
+    renderer = ReportRenderer(preview)
+    toc, sections = [], []
+    with matplotlib.rc_context(REPORT_PREVIEW_RC if preview else {}):
+        for n, (page_title, fig) in enumerate(renderer.pages(processed)):
+            buf = io.BytesIO()
+            fig.savefig(buf, format="svg")
+            svg = buf.getvalue().decode("utf-8")
+            body = svg[svg.index("<svg"):]
+            toc.append(f'<li><a href="#page{n}">{html.escape(page_title)}</a></li>')
+            sections.append(f'<section id="page{n}"><h2>{html.escape(page_title)}</h2>{body}</section>')
+
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("<!DOCTYPE html>\n<html><head><meta charset=\"utf-8\">"
+                f"<title>{html.escape(title or 'Spectral report')}</title>"
+                "<style>body{font-family:sans-serif;margin:2em}section{margin-bottom:2em}"
+                "svg,img{max-width:100%;height:auto}</style></head><body>\n"
+                f"<h1>{html.escape(title or 'Spectral report')}</h1>\n<ul>{''.join(toc)}</ul>\n"
+                + "\n".join(sections) + "\n</body></html>\n")
+    return len(sections)
+
+def write_report(processed, path, fmt="pdf", title="", preview=False):
+    if fmt == "html":
+        return write_html_report(processed, path, title, preview)
+    return write_pdf_report(processed, path, title, preview)
+
+# ---------------------- 11. Preprocessing cache ----------------------
+def file_sha256(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cache_key(data_path):
+    """
+    缓存键：输入文件内容哈希 + 滤波参数 + 汇总/拟合参数 + 缓存格式版本（与文件名、修改时间无关）
+    """
+    params = {
+        "sha256": file_sha256(data_path),
+        "window_size": WINDOW_SIZE,
+        "jump_threshold": JUMP_THRESHOLD,
+        "channels": CHANNELS,
+        "conditions": CONDITION_FOLDERS,
+        "summary": [TRIM_FRACTION, OUTLIER_THRESHOLD, OUTLIER_MIN_DELTA],
+        "kinetics": [MODEL_NAMES, MAX_ITERATIONS, CONVERGENCE_TOL, MIN_FIT_POINTS],
+        "version": CACHE_VERSION,
+    }
+    digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode("utf-8")).hexdigest()
+    return digest, params
+
+def save_cache(cache_dir, key, params, processed, stats=None, tables=None):
+    """
+    将各条件的预处理结果与分析结果表 tables（{CACHE_TABLES中的名称: DataFrame}）写入 <key>.npz
+    （时间列与通道矩阵、表格各列为原生二进制数组，字符串列存为定长字符串，无需 pickle），
+    先写临时文件再替换，避免中断时留下不完整的缓存
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    arrays = {"meta": np.array(json.dumps({"key": key, "stats": stats or {}, **params}))}
+    for i, cond in enumerate(CONDITION_FOLDERS):
+        df = processed.get(cond)
+        if df is not None:
+            arrays[f"time_{i}"] = df["measurement_time"].to_numpy()
+            arrays[f"values_{i}"] = df[CHANNELS].to_numpy(dtype=float)
+    for name, table in (tables or {}).items():
+        arrays[f"{name}_columns"] = np.array(table.columns, dtype=str)
+        for j, col in enumerate(table.columns):
+            values = table[col].to_numpy()
+            arrays[f"{name}_{j}"] = values.astype(str) if values.dtype == object else values
+    path = os.path.join(cache_dir, f"{key}.npz")
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+    return path
+
+def load_cache(cache_dir, key, stats=None, tables=None):
+    """
+    读取并校验缓存：元数据中的键、各数组形状一致；损坏或不匹配时删除该条目并返回 None。
+    tables 为字典时同时读入 CACHE_TABLES 中的分析结果表
+    （并行处理时条目可能随时被其他进程淘汰，此时按未命中处理）
+    """
+    path = os.path.join(cache_dir, f"{key}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            meta = json.loads(str(npz["meta"]))
+            if meta.get("key") != key or meta.get("channels") != CHANNELS:
+                raise ValueError("cache key mismatch")
+            processed = {}
+            for i, cond in enumerate(CONDITION_FOLDERS):
+                if f"time_{i}" not in npz.files:
+                    processed[cond] = None
+                    continue
+                times, values = npz[f"time_{i}"], npz[f"values_{i}"]
+                if values.shape != (len(times), len(CHANNELS)):
+                    raise ValueError(f"bad shape for '{cond}'")
+                df = pd.DataFrame(values, columns=CHANNELS)
+                df.insert(0, "measurement_time", times)
+                processed[cond] = df
+            for name in (CACHE_TABLES if tables is not None else []):
+                if f"{name}_columns" not in npz.files:
+                    raise ValueError(f"missing table '{name}'")
+                columns = npz[f"{name}_columns"].tolist()
+                tables[name] = pd.DataFrame({col: npz[f"{name}_{j}"] for j, col in enumerate(columns)})
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Discarding invalid cache entry {path}: {e}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+    try:
+        os.utime(path)  # 记录最近使用时间，供按大小淘汰
+    except FileNotFoundError:
+        pass
+    if stats is not None:
+        stats.update(meta.get("stats", {}))
+    return processed
+
+def evict_cache(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """
+    按最近使用时间从旧到新删除缓存条目，直到总大小不超过 max_bytes
+    （并行处理时其他进程可能同时淘汰同一条目，已不存在的条目直接跳过）
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npz"):
+            try:
+                st = os.stat(os.path.join(cache_dir, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass
+        else:
+            print(f"Evicted cache entry {name}")
+        total -= size
+
+def analyze_session_cached(data_path, cache_dir=CACHE_DIR, stats=None, key_params=None, timings=None):
+    """
+    带缓存的会话分析，返回 (预处理结果, 重复测量汇总表, 生长曲线拟合表)：输入文件内容与参数不变时
+    三者都直接读取上次的结果，只改变绘图设置的重新运行不再读取CSV、也不重新拟合
+    （key_params 为已计算的 cache_key(data_path)，避免重复哈希文件；timings 中记录各步骤耗时）
+    """
+    stats = {} if stats is None else stats
+    timings = {} if timings is None else timings
+    t = time.perf_counter()
+    if cache_dir:
+        key, params = key_params or cache_key(data_path)
+        tables = {}
+        processed = load_cache(cache_dir, key, stats, tables)
+        if processed is not None:
+            print(f"Loaded preprocessed data and analysis tables from cache ({key[:12]}).")
+            timings["preprocess"] = time.perf_counter() - t
+            return processed, tables["replicates"], tables["kinetics"]
+
+    processed = load_and_preprocess_data(data_path, stats)
+    timings["preprocess"] = time.perf_counter() - t
+    t = time.perf_counter()
+    replicates = summarize_session_file(data_path)
+    timings["summary"] = time.perf_counter() - t
+    t = time.perf_counter()
+    kinetics = fit_session_kinetics(processed)
+    timings["kinetics"] = time.perf_counter() - t
+    if cache_dir:
+        save_cache(cache_dir, key, params, processed, stats, {"replicates": replicates, "kinetics": kinetics})
+        evict_cache(cache_dir)
+    return processed, replicates, kinetics
+
+# ---------------------- 12. Batch processing ----------------------
+SESSION_PATTERN = "measurement_session_*.csv"  # 目录参数下匹配的会话文件
+STAMP_FILE = ".process_stamp.json"  # 输出目录中的完成标记（输入内容+参数指纹、输出文件列表）
+REPLICATE_SUMMARY_FILE = "replicate_summary.csv"  # 每次测量各类型的重复测量统计
+KINETICS_FILE = "kinetics.csv"  # 各条件、通道的生长曲线拟合结果
+SUMMARY_FILE = "run_summary.json"
+
+def expand_inputs(inputs):
+    """
+    展开命令行输入：文件、glob 模式（Windows 命令行不会自动展开）或目录（匹配 SESSION_PATTERN），
+    去重并排序，保证输出顺序确定
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, SESSION_PATTERN))
+        elif glob.has_magic(item):
+            matches = glob.glob(item)
+        else:
+            matches = [item]
+        if not matches:
+            print(f"Warning: no sessions match '{item}'.")
+        paths.extend(matches)
+    return sorted({os.path.normpath(p) for p in paths})
+
+def session_output_dir(data_path, output_root, batch):
+    """单个会话直接输出到 output_root；批量处理时每个会话一个子目录（以文件名命名）"""
+    if not batch:
+        return output_root
+    return os.path.join(output_root, os.path.splitext(os.path.basename(data_path))[0])
+
+def render_fingerprint(report=None, preview=False):
+    """影响图片内容的绘图参数（及报告格式），变化后已有输出视为过期"""
+    return {
+        "report": report,
+        "preview": preview,
+        "preview_points": REPORT_PREVIEW_POINTS if preview else None,
+        "second_smooth": SECOND_SMOOTH,
+        "bounded_render": BOUNDED_RENDER,
+        "max_fig_width": MAX_FIG_WIDTH,
+        "max_plot_points": MAX_PLOT_POINTS,
+        "marker_points": MARKER_POINTS,
+        "page_points": PAGE_POINTS,
+        "max_pages": MAX_PAGES,
+    }
+
+def read_stamp(out_dir):
+    try:
+        with open(os.path.join(out_dir, STAMP_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_stamp(out_dir, key, outputs, stats, report=None, preview=False):
+    stamp = {"key": key, "render": render_fingerprint(report, preview), "outputs": outputs, "stats": stats}
+    with open(os.path.join(out_dir, STAMP_FILE), "w", encoding="utf-8") as f:
+        json.dump(stamp, f, ensure_ascii=False, indent=2)
+
+def is_up_to_date(out_dir, key, report=None, preview=False):
+    stamp = read_stamp(out_dir)
+    return (stamp is not None and stamp.get("key") == key and stamp.get("render") == render_fingerprint(report, preview)
+            and all(os.path.exists(p) for p in stamp.get("outputs", [])))
+
+def process_session(data_path, out_dir, render_workers=RENDER_WORKERS, force=False, cache_dir=CACHE_DIR,
+                    report=None, preview=False):
+    """
+    处理一个会话文件（预处理 + 绘图），report 为 "pdf"/"html" 时所有图写入单个报告文件而不是逐个PNG。
+    返回运行摘要：
+    {session, output_dir, status(ok/skipped/error), rows, nonzero_rows, valid_rows, time_points, figures, timings}
+    """
+    summary = {"session": data_path, "output_dir": out_dir, "status": "ok"}
+    timings = summary["timings"] = {}
+    t0 = time.perf_counter()
+    try:
+        key_params = cache_key(data_path)
+        key = key_params[0]
+        timings["hash"] = time.perf_counter() - t0
+        if not force and is_up_to_date(out_dir, key, report, preview):
+            summary.update(read_stamp(out_dir).get("stats", {}), status="skipped")
+            print(f"Skipping '{data_path}': outputs are up to date.")
+            return summary
+
+        stats = {}
+        processed, replicates, kinetics = analyze_session_cached(data_path, cache_dir, stats, key_params, timings)
+        summary.update(stats)
+
+        t = time.perf_counter()
+        if report:
+            os.makedirs(out_dir, exist_ok=True)
+            report_path = os.path.join(out_dir, f"report.{report}")
+            summary["figures"] = write_report(processed, report_path, report, os.path.basename(data_path), preview)
+            figure_paths = [report_path]
+            print(f"Saved: {report_path} ({summary['figures']} pages)")
+        else:
+            folder_paths = create_folders(out_dir, CONDITION_FOLDERS)
+            jobs = build_render_jobs(processed, folder_paths)
+            render_figures(processed, jobs, render_workers)
+            summary["figures"] = len(jobs)
+            figure_paths = [job[3] for job in jobs]
+        timings["render"] = time.perf_counter() - t
+
+        replicate_path = os.path.join(out_dir, REPLICATE_SUMMARY_FILE)
+        replicates.to_csv(replicate_path, index=False, float_format="%.6g")
+        if len(replicates):
+            summary["outliers"] = int(replicates.filter(like="_outliers").to_numpy().sum())
+        kinetics_path = os.path.join(out_dir, KINETICS_FILE)
+        kinetics.to_csv(kinetics_path, index=False, float_format="%.6g")
+
+        write_stamp(out_dir, key, figure_paths + [replicate_path, kinetics_path], stats, report, preview)
+    except Exception as e:
+        summary.update(status="error", error=f"{type(e).__name__}: {e}")
+        print(f"Error processing '{data_path}': {e}")
+    finally:
+        timings["total"] = time.perf_counter() - t0
+    return summary
+
+def _process_session_job(args):
+    warnings.filterwarnings("ignore", category=UserWarning)
+    return process_session(*args)
+
+def run_batch(paths, output_root, jobs=1, render_workers=RENDER_WORKERS, force=False, cache_dir=CACHE_DIR,
+              report=None, preview=False):
+    """
+    处理多个会话：jobs > 1 时按会话分发到进程池（此时每个会话内部串行绘图，避免嵌套进程池），
+    返回按输入顺序排列的摘要列表
+    """
+    batch = len(paths) > 1
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(paths)))
+    if jobs > 1:
+        render_workers = 1
+    tasks = [(p, session_output_dir(p, output_root, batch), render_workers, force, cache_dir, report, preview)
+             for p in paths]
+    if jobs == 1:
+        return [process_session(*task) for task in tasks]
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(_process_session_job, task): task[0] for task in tasks}
+        for future in as_completed(futures):
+            summary = future.result()
+            results[futures[future]] = summary
+            print(f"[{len(results)}/{len(tasks)}] {summary['status']}: {summary['session']}")
+    return [results[p] for p in paths]
+
+def write_run_summary(summaries, path, wall_time):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"wall_time": wall_time, "sessions": summaries}, f, ensure_ascii=False, indent=2)
+
+def print_run_summary(summaries, wall_time):
+    print(f"\n{'session':<44} {'status':>8} {'rows':>9} {'valid':>9} {'prep (s)':>9} {'render (s)':>10}")
+    for s in summaries:
+        t = s["timings"]
+        print(f"{os.path.basename(s['session']):<44} {s['status']:>8} {s.get('rows', '-'):>9} "
+              f"{s.get('valid_rows', '-'):>9} {t.get('preprocess', 0):>9.2f} {t.get('render', 0):>10.2f}")
+    counts = {status: sum(s["status"] == status for s in summaries) for status in ("ok", "skipped", "error")}
+    print(f"{len(summaries)} sessions ({counts['ok']} processed, {counts['skipped']} skipped, "
+          f"{counts['error']} failed) in {wall_time:.1f} s")
+
+# ---------------------- 13. Follow mode (session file still being written) ----------------------
+FOLLOW_POLL_INTERVAL = 2.0   # 跟踪模式下检查文件更新的间隔（秒）
+PREFIX_CHECK_BYTES = 4096    # 校验已解析内容未被改写时比较的字节数
+
+class FollowReset(Exception):
+    """新数据无法增量合并（时间倒序等），需要从头重新解析"""
+
+
+class SessionFollower:
+    """
+    增量分析仍在写入的会话文件。上位机每次测量后整体重写CSV，但已写入部分的内容不变，因此：
+      - 记录已解析到的文件偏移，每次只解析新增的完整行（校验偏移前的内容未变，否则从头解析）
+      - 只重新计算受影响时间点的分组中位数（保留最后一个时间点的原始行，可能仍有数据追加）
+      - 只重新计算末尾受影响窗口的滑动中值；MAD 阈值与突变替换在整列上向量化重算，
+        结果与 load_and_preprocess_data 完全一致
+    """
+
+    def __init__(self, data_path, window_size=WINDOW_SIZE, jump_threshold=JUMP_THRESHOLD):
+        self.data_path = data_path
+        self.window_size = window_size
+        self.jump_threshold = jump_threshold
+        self.reset()
+
+    def reset(self):
+        self.offset = 0          # 已解析到的文件偏移（完整行末尾）
+        self.header = None       # CSV 表头行（bytes）
+        self.prefix = b""        # 偏移之前的最后 PREFIX_CHECK_BYTES 字节
+        self.short_size = None   # 上次看到的比已解析部分短的文件大小
+        self.encoding = None     # 文件编码（读到第一段完整行时检测，规则与批处理的 detect_csv_encoding 一致）
+        self.stats = {"rows": 0, "nonzero_rows": 0, "valid_rows": 0}
+        self.grouped = {cond: None for cond in CONDITION_FOLDERS}    # 分组中位数（滤波前）
+        self.med = {cond: None for cond in CONDITION_FOLDERS}        # 滑动中值
+        self.tail = {cond: None for cond in CONDITION_FOLDERS}       # 最后一个时间点的原始行
+        self.processed = {cond: None for cond in CONDITION_FOLDERS}  # 滤波后的结果
+
+    def read_new_lines(self):
+        """
+        返回偏移之后新增的完整行（bytes）。文件比已解析部分短时视为正在重写，下次再读；
+        连续两次大小相同且仍然较短则认为内容已变，从头解析
+        """
+        try:
+            size = os.path.getsize(self.data_path)
+        except OSError:
+            return b""
+        if size < self.offset:
+            if size == self.short_size:
+                raise FollowReset("session file shrank")
+            self.short_size = size
+            return b""
+        self.short_size = None
+        with open(self.data_path, "rb") as f:
+            f.seek(self.offset - len(self.prefix))
+            if f.read(len(self.prefix)) != self.prefix:
+                raise FollowReset("session file was rewritten with different content")
+            data = f.read(size - self.offset)
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return b""
+        self.prefix = (self.prefix + data[:end])[-PREFIX_CHECK_BYTES:]
+        self.offset += end
+        return data[:end]
+
+    def poll(self):
+        """
+        解析新增数据并更新结果，返回 {cond: 发生变化的通道列表}（无变化时为空字典）
+        """
+        try:
+            return self._poll()
+        except FollowReset as e:
+            print(f"Reloading '{self.data_path}': {e}.")
+            self.reset()
+            return self._poll()
+
+    def _poll(self):
+        block = self.read_new_lines()
+        if block and self.encoding != "gbk":
+            encoding = detect_bytes_encoding(block)
+            if self.encoding is None:
+                self.encoding = encoding
+            elif encoding != self.encoding:  # 之前的内容恰好都能按 UTF-8 解码，需按 GBK 从头解析
+                raise FollowReset("session file is not UTF-8")
+        if self.header is None and block:
+            first = block.find(b"\n") + 1
+            self.header, block = block[:first], block[first:]
+            header = self.header.decode(self.encoding, errors="replace").strip().split(",")
+            missing = [c for c in REQUIRED_COLUMNS if c not in header]
+            if missing:
+                raise ValueError(f"Missing required columns: {missing}")
+        if not block:
+            return {}
+
+        chunk = pd.read_csv(io.BytesIO(self.header + block), usecols=REQUIRED_COLUMNS, dtype=COLUMN_DTYPES,
+                            encoding=self.encoding, encoding_errors="replace")
+        n_nonzero, n_valid, parts = split_session_chunk(chunk)
+        self.stats["rows"] += len(chunk)
+        self.stats["nonzero_rows"] += n_nonzero
+        self.stats["valid_rows"] += n_valid
+
+        changed = {}
+        for cond, part in parts.items():
+            channels = self._update_condition(cond, part)
+            if channels:
+                changed[cond] = channels
+        return changed
+
+    def _update_condition(self, cond, part):
+        grouped = self.grouped[cond]
+        tail = self.tail[cond]
+        if grouped is not None and part["measurement_time"].min() < grouped["measurement_time"].iloc[-1]:
+            raise FollowReset(f"rows for '{cond}' are out of time order")
+
+        # 受影响的时间点：最后一个已有时间点（可能有新行加入）及新出现的时间点
+        rows = part if tail is None else pd.concat([tail, part], ignore_index=True)
+        recomputed = rows.groupby("measurement_time")[CHANNELS].median().reset_index()
+        keep = 0 if grouped is None else len(grouped) - (tail is not None)
+        if grouped is None:
+            grouped = recomputed
+        else:
+            grouped = pd.concat([grouped.iloc[:keep], recomputed], ignore_index=True)
+        last_time = grouped["measurement_time"].iloc[-1]
+        self.tail[cond] = rows[rows["measurement_time"] == last_time]
+        self.grouped[cond] = grouped
+
+        # 只重算末尾窗口的滑动中值：第 keep 行之后变化，影响 keep-right 之后的中值
+        values = grouped[CHANNELS].to_numpy(dtype=float)
+        left = self.window_size // 2
+        right = self.window_size - 1 - left
+        start = max(0, keep - right)
+        source = max(0, start - left)
+        tail_med = rolling_median_2d(values[source:], self.window_size)[start - source:]
+        old_med = self.med[cond]
+        self.med[cond] = tail_med if old_med is None else np.concatenate([old_med[:start], tail_med])
+
+        filtered = spike_filter_2d(values, self.window_size, self.jump_threshold, med=self.med[cond].copy())
+        result = grouped.copy()
+        result[CHANNELS] = filtered
+
+        old = self.processed[cond]
+        self.processed[cond] = result
+        if old is None or len(old) != len(result):
+            return list(CHANNELS)
+        return [ch for ch in CHANNELS if not np.array_equal(old[ch].to_numpy(), result[ch].to_numpy(), equal_nan=True)]
+
+def follow_session(data_path, out_dir, poll_interval=FOLLOW_POLL_INTERVAL, render_workers=RENDER_WORKERS,
+                   idle_exit=0):
+    """
+    跟踪模式：轮询会话文件，增量更新结果，只重新绘制数据发生变化的图
+    （idle_exit > 0 时文件超过该秒数无新数据则退出；Ctrl+C 停止）
+    """
+    follower = SessionFollower(data_path)
+    folder_paths = create_folders(out_dir, CONDITION_FOLDERS)
+    print(f"Following '{data_path}' (Ctrl+C to stop)...")
+    last_change = time.monotonic()
+    try:
+        while True:
+            start = time.perf_counter()
+            changed = follower.poll()
+            if changed:
+                processed = follower.processed
+                jobs = [job for job in build_render_jobs(processed, folder_paths)
+                        if job[1] in changed and (job[0] == "comparison" or job[2] in changed[job[1]])]
+                render_figures(processed, jobs, render_workers)
+                points = ", ".join(f"{cond}: {len(processed[cond])}" for cond in changed)
+                print(f"Updated {len(jobs)} figures ({points} time points) in {time.perf_counter() - start:.2f} s.")
+                last_change = time.monotonic()
+            elif idle_exit and time.monotonic() - last_change >= idle_exit:
+                print(f"No new data for {idle_exit:g} s, stopping.")
+                break
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("Stopped following.")
+    return follower.processed
+
+# ---------------------- 14. Main: process & plot ----------------------
+def build_parser():
+    parser = argparse.ArgumentParser(description="Spectral session filtering & plotting (single file or batch)")
+    parser.add_argument("inputs", nargs="*", default=[DATA_PATH],
+                        help=f"session files, glob patterns or directories (default: {DATA_PATH})")
+    parser.add_argument("-o", "--output-root", default=ROOT_FOLDER,
+                        help="output folder; with several sessions each gets a subfolder named after the file")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="sessions processed in parallel (0 = CPU count)")
+    parser.add_argument("--render-workers", type=int, default=RENDER_WORKERS,
+                        help="figure rendering processes per session (ignored when --jobs > 1)")
+    parser.add_argument("--force", action="store_true", help="reprocess sessions even if outputs are up to date")
+    parser.add_argument("--no-cache", action="store_true", help="do not use the preprocessing cache")
+    parser.add_argument("--summary", help=f"run summary JSON path (default: <output-root>/{SUMMARY_FILE})")
+    parser.add_argument("--report", choices=REPORT_FORMATS,
+                        help="write all figures of a session into one multi-page PDF or self-contained HTML report")
+    parser.add_argument("--preview", action="store_true",
+                        help="report: fewer points per trace and no point markers (quicker, lighter draft)")
+    parser.add_argument("--follow", action="store_true",
+                        help="keep watching a single session that is still being written and update changed figures")
+    parser.add_argument("--poll", type=float, default=FOLLOW_POLL_INTERVAL,
+                        help=f"follow mode: seconds between file checks (default {FOLLOW_POLL_INTERVAL})")
+    parser.add_argument("--idle-exit", type=float, default=0,
+                        help="follow mode: stop after this many seconds without new data (0 = run until Ctrl+C)")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    print("Scipy available for smoothing?" , SCIPY_AVAILABLE)
+    paths = expand_inputs(args.inputs)
+    if not paths:
+        print("No session files to process.")
+        return 1
+    if args.follow:
+        if len(paths) != 1:
+            print("--follow takes exactly one session file.")
+            return 1
+        follow_session(paths[0], args.output_root, args.poll, args.render_workers, args.idle_exit)
+        return 0
+
+    start = time.perf_counter()
+    summaries = run_batch(paths, args.output_root, args.jobs, args.render_workers, args.force,
+                          None if args.no_cache else CACHE_DIR, args.report, args.preview)
+    wall_time = time.perf_counter() - start
 
+    os.makedirs(args.output_root, exist_ok=True)
+    write_run_summary(summaries, args.summary or os.path.join(args.output_root, SUMMARY_FILE), wall_time)
+    print_run_summary(summaries, wall_time)
     print("All done!")
+    return 1 if any(s["status"] == "error" for s in summaries) else 0
 
 if __name__ == "__main__":
     # Silence some matplotlib warnings in headless environments
     warnings.filterwarnings("ignore", category=UserWarning)
-    main()
+    sys.exit(main())
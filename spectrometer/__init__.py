@@ -0,0 +1 @@
+"""光谱仪上位机公共模块（不依赖PyQt5，可供GUI、命令行与分析脚本共用）"""
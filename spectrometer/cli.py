@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import json
+import signal
+import argparse
+import contextlib
+from datetime import datetime
+
+from .engine import AcquisitionEngine, StatusWriter
+from .protocol import MIN_STREAM_INTERVAL, is_valid_ipv4
+from .measurement import measurement_session_filename
+from .fanout import FanoutServer, FANOUT_PORT
+from .discovery import DeviceCache, discover_devices
+
+DEFAULT_LOCAL_IP = "192.168.137.1"  # 与GUI默认一致（Windows移动热点网关）
+DEFAULT_WAIT_DEVICE = 60            # 等待设备连接超时（秒）
+
+# 退出码
+EXIT_OK = 0
+EXIT_ERROR = 1
+EXIT_NO_DEVICE = 2
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m spectrometer",
+        description="光谱仪无界面采集工具：状态以JSON-lines输出到stdout，日志输出到stderr")
+    parser.add_argument("--local-ip", default=DEFAULT_LOCAL_IP, help="本机IP（6677/6699端口监听地址）")
+    parser.add_argument("--device-ip", help="设备IP（指定时直接连接，不等待6677连接通知）")
+    parser.add_argument("--status-file", help="状态输出文件（默认stdout，追加写入）")
+    parser.add_argument("--quiet", action="store_true", help="不输出日志（stderr）")
+    parser.add_argument("--wait-device", type=float, default=DEFAULT_WAIT_DEVICE,
+                        help=f"等待设备连接超时（秒，默认{DEFAULT_WAIT_DEVICE}）")
+    parser.add_argument("--interval", type=int, default=1000,
+                        help=f"数据流间隔（ms，最小{MIN_STREAM_INTERVAL}）")
+    parser.add_argument("--db", nargs="?", const=True, metavar="PATH",
+                        help="测量数据同时写入会话库（SQLite，路径默认与GUI相同：~/spectrometer_sessions.db）")
+    parser.add_argument("--shm-ring", nargs="?", const=True, metavar="NAME",
+                        help="实时数据发布到共享内存环形缓冲（名称默认与GUI相同），供本机其他进程读取")
+    parser.add_argument("--stream-server", nargs="?", type=int, const=FANOUT_PORT, metavar="PORT",
+                        help=f"启动本机数据分发服务（JSON-lines/WebSocket，端口默认 {FANOUT_PORT}）")
+
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_monitor = sub.add_parser("monitor", help="开启数据流并记录数据")
+    p_monitor.add_argument("--duration", type=float, default=0, help="运行时长（秒，0表示直到Ctrl+C）")
+    p_monitor.add_argument("--count", type=int, help="固定数量模式的数据包数（不指定为连续模式）")
+    p_monitor.add_argument("--output", help="记录数据保存路径（CSV，不指定则不记录）")
+
+    p_measure = sub.add_parser("measure", help="执行一次LED/UV测量")
+    p_measure.add_argument("--output-dir", default=".", help="测量会话CSV保存目录")
+
+    p_session = sub.add_parser("session", help="定时测量会话")
+    p_session.add_argument("--duration", type=float, required=True, help="会话时长（秒）")
+    p_session.add_argument("--every", type=float, required=True, help="测量间隔（秒）")
+    p_session.add_argument("--output-dir", default=".", help="测量会话CSV保存目录")
+    p_session.add_argument("--plate-map", help="孔板布局JSON文件（如 {\"A1\": \"control\"}），随会话写入会话库")
+
+    sub.add_parser("status", help="查询一次设备状态后退出")
+
+    p_discover = sub.add_parser("discover", help="扫描本机各网段，列出设备（6688端口）后退出")
+    p_discover.add_argument("--known-only", action="store_true", help="只探测缓存中的已知设备")
+    return parser
+
+
+def run_discover(status, args):
+    """搜索设备：每台设备输出一个 device_found 事件（含应绑定的本机IP）"""
+    start = time.perf_counter()
+    found = discover_devices(DeviceCache(), full_scan=not args.known_only)
+    for result in found:
+        status.emit("device_found", **result)
+    status.emit("discover_complete", count=len(found), elapsed=round(time.perf_counter() - start, 3))
+    return EXIT_OK if found else EXIT_NO_DEVICE
+
+
+def load_plate_map(path):
+    """读取孔板布局JSON（对象，如 {"A1": "control"}），文件缺失或格式错误时抛出 ValueError"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            plate_map = json.load(f)
+    except OSError as e:
+        raise ValueError(f"无法读取孔板布局文件: {e}") from e
+    except json.JSONDecodeError as e:
+        raise ValueError(f"孔板布局文件不是有效的JSON: {path}: {e}") from e
+    if not isinstance(plate_map, dict):
+        raise ValueError(f"孔板布局应为JSON对象（如 {{\"A1\": \"control\"}}）: {path}")
+    return plate_map
+
+
+def run_command(engine, args, plate_map=None):
+    """执行子命令，返回退出码"""
+    if args.command == "status":
+        engine.get_device_status()
+        deadline = time.time() + 5
+        while engine.device_status is None and time.time() < deadline:
+            time.sleep(0.1)
+        return EXIT_OK if engine.device_status is not None else EXIT_ERROR
+
+    if args.command == "monitor":
+        mode = "fixed" if args.count else "continuous"
+        if args.output and not engine.start_record(args.output):
+            return EXIT_ERROR
+        if not engine.start_stream(mode, args.interval, args.count):
+            return EXIT_ERROR
+        start_time = time.time()
+        while not engine.stop_requested.is_set():
+            if args.duration and time.time() - start_time >= args.duration:
+                break
+            if mode == "fixed" and engine.stream_complete_event.is_set():
+                break
+            time.sleep(0.2)
+        engine.stop_stream()
+        if args.output:
+            return EXIT_OK if engine.stop_record(args.output) else EXIT_ERROR
+        return EXIT_OK
+
+    if not engine.start_stream("continuous", args.interval):
+        return EXIT_ERROR
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.command == "measure":
+        measurement = engine.run_measurement()
+        success = measurement is not None
+        if success:
+            session_start = datetime.now().strftime("%Y%m%d_%H%M%S")
+            file_path = os.path.join(args.output_dir, measurement_session_filename(session_start))
+            success = engine.save_session([measurement], file_path)
+            session_id = engine.create_db_session(session_start, file_path=file_path)
+            if session_id is not None:
+                engine.save_to_database(session_id, measurement)
+            status_path = file_path if success else None
+            engine.status.emit("measurement_saved", ok=success, path=status_path, session_id=session_id)
+    else:
+        success = engine.run_timed_session(args.duration, args.every, args.output_dir, plate_map) is not None
+    engine.stop_stream()
+    return EXIT_OK if success else EXIT_ERROR
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.device_ip and not is_valid_ipv4(args.device_ip):
+        print(f"无效的设备IP: {args.device_ip}", file=sys.stderr)
+        return EXIT_ERROR
+
+    status_stream = open(args.status_file, "a", encoding="utf-8") if args.status_file else sys.stdout
+    log_stream = open(os.devnull, "w") if args.quiet else sys.stderr
+    status = StatusWriter(status_stream)
+
+    # 各模块日志使用print，重定向到stderr，保证stdout只有JSON-lines
+    with contextlib.redirect_stdout(log_stream):
+        if args.command == "discover":
+            exit_code = run_discover(status, args)
+            status.emit("exit", code=exit_code)
+            return exit_code
+        plate_map = None
+        if getattr(args, "plate_map", None):
+            try:
+                plate_map = load_plate_map(args.plate_map)
+            except ValueError as e:
+                status.emit("error", message=str(e))
+                status.emit("exit", code=EXIT_ERROR)
+                return EXIT_ERROR
+        ring = None
+        if args.shm_ring:
+            from .shm_ring import RingWriter, RingFormatError, RING_NAME  # 依赖numpy，只在使用时导入
+            try:
+                ring = RingWriter(RING_NAME if args.shm_ring is True else args.shm_ring)
+            except (OSError, RingFormatError) as e:
+                status.emit("error", message=f"无法创建共享内存环形缓冲: {e}")
+                status.emit("exit", code=EXIT_ERROR)
+                return EXIT_ERROR
+        database = None
+        if args.db:
+            from .sessiondb import SessionDatabase, DEFAULT_DB_PATH  # 依赖numpy/sqlite3，只在使用会话库时导入
+            database = SessionDatabase(DEFAULT_DB_PATH if args.db is True else args.db)
+            status.emit("session_db", path=os.path.abspath(database.path))
+        engine = AcquisitionEngine(args.local_ip, args.device_ip, status, args.interval, database)
+        if ring is not None:
+            engine.pipeline.sample_listeners.append(ring.add_sample)
+        stream_server = None
+        if args.stream_server:
+            stream_server = FanoutServer(port=args.stream_server)
+            stream_server.start()
+            engine.pipeline.sample_listeners.append(stream_server.publish_sample)
+            engine.network.event_listeners.append(stream_server.publish_event)
+
+        def on_signal(signum, frame):
+            status.emit("signal", signal=signum)
+            engine.request_stop()
+
+        signal.signal(signal.SIGINT, on_signal)
+        signal.signal(signal.SIGTERM, on_signal)
+
+        engine.start()
+        exit_code = EXIT_OK
+        try:
+            deadline = time.time() + args.wait_device
+            while not engine.stop_requested.is_set() and not engine.wait_for_device(0.2):
+                if time.time() >= deadline:
+                    status.emit("error", message="等待设备连接超时")
+                    exit_code = EXIT_NO_DEVICE
+                    break
+            if exit_code == EXIT_OK and not engine.stop_requested.is_set():
+                exit_code = run_command(engine, args, plate_map)
+        finally:
+            engine.stop()
+            if database is not None:
+                database.close()
+            if ring is not None:
+                ring.close()
+            if stream_server is not None:
+                stream_server.stop()
+            status.emit("exit", code=exit_code)
+            if args.status_file:
+                status_stream.close()
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,582 @@
+import json
+import queue
+import asyncio
+import threading
+from collections import deque
+
+from .protocol import (TCP_SERVER_PORT, UDP_SERVER_PORT, DEVICE_CMD_PORT, HEARTBEAT_INTERVAL, RECV_BUFFER_SIZE,
+                       MIN_STREAM_INTERVAL, HEARTBEAT_CMD, encode_cmd, normalize_spectral_packet, notification_kind)
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+CONNECT_TIMEOUT = 10         # 指令服务器连接超时（秒）
+RESPONSE_TIMEOUT = 3         # 等待指令响应的超时（秒）
+STATUS_TIMEOUT = 5           # 等待设备状态通知的超时（秒）
+SAMPLE_QUEUE_SIZE = 10000    # 每个数据订阅的队列长度（满时丢弃最旧数据）
+BRIGHTNESS_RANGE = (1, 20)   # LED 亮度范围
+NOTIFICATION_LINE_LIMIT = 64 * 1024
+
+# ========================== 设备协议客户端 ==========================
+# 不依赖 PyQt5 的设备协议库（指令见 doc/command_api_document.md）：
+#   AsyncSpectrometerHost：本机 6677 通知服务器 + 6699 光谱数据端点（同一本机IP只能有一个，例如不能与GUI同时运行），
+#                          管理任意数量设备，提供光谱数据的异步迭代器
+#   AsyncDevice：单台设备的 6688 指令连接，每个指令方法等待设备的 {"response": ...} 应答
+#   SpectrometerHost / Device：同步封装（后台线程运行事件循环），供批处理脚本使用
+#
+# 设备对每条指令（含心跳）按顺序返回一条应答：普通模式下经 6688 连接返回，数据流模式下经 6677 连接返回，
+# 因此应答按发送顺序与等待中的指令匹配。设备应答队列满时会丢弃应答，所以超时的指令即从等待队列中移除，
+# 避免之后的应答全部错位（代价是超时后才到达的迟到应答会被算作下一条指令的应答）。
+#
+# 示例（同步）：
+#     with SpectrometerHost("192.168.137.1") as host:
+#         device = host.device("192.168.137.50")
+#         device.set_led(True)
+#         device.set_interval(500)
+#         print(device.get_status())
+#         device.start_stream()
+#         for sample in device.samples(timeout=5, count=100):
+#             print(sample["packetCount"], sample["F1"])
+#         device.stop_stream()
+#
+# 示例（异步）：
+#     async with AsyncSpectrometerHost("192.168.137.1") as host:
+#         device = await host.device("192.168.137.50")
+#         await device.start_stream()
+#         async for sample in device.samples():
+#             ...
+
+class DeviceError(Exception):
+    """指令发送失败、连接断开或设备返回 ERROR 应答"""
+
+
+class CommandTimeout(DeviceError):
+    """等待设备应答或通知超时"""
+
+
+def parse_response(text):
+    """设备应答文本 → (是否成功, 消息)"""
+    if text.startswith("ERROR"):
+        return False, text.partition(":")[2].strip() or text
+    return True, text
+
+def spectral_sample(packet):
+    """标准化光谱数据包 → 数据点字典（字段与 SPECTRAL_FIELDS 一致，另含 device_ip）"""
+    sample = {"timestamp": packet["timestamp"], "packetCount": packet["packetCount"],
+              "streamCount": packet["streamCount"]}
+    for name, value in zip(CHANNEL_NAMES, packet["data"]):
+        sample[name] = value
+    sample["device_ip"] = packet["device_ip"]
+    return sample
+
+def _check_brightness(value):
+    if not BRIGHTNESS_RANGE[0] <= value <= BRIGHTNESS_RANGE[1]:
+        raise ValueError(f"亮度必须在 {BRIGHTNESS_RANGE[0]}-{BRIGHTNESS_RANGE[1]} 之间: {value}")
+    return int(value)
+
+def _offer(q, item):
+    """放入队列，满时丢弃最旧的一项（asyncio.Queue 与 queue.Queue 均可）；返回是否有丢弃"""
+    try:
+        q.put_nowait(item)
+        return False
+    except (asyncio.QueueFull, queue.Full):
+        try:
+            q.get_nowait()
+        except (asyncio.QueueEmpty, queue.Empty):
+            pass
+        q.put_nowait(item)
+        return True
+
+
+class AsyncDevice:
+    """单台设备的指令连接。指令方法均为协程，返回设备应答文本；ERROR 应答抛出 DeviceError，超时抛出 CommandTimeout"""
+
+    def __init__(self, device_ip, host=None, port=DEVICE_CMD_PORT):
+        self.device_ip = device_ip
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+        self.pending = deque()  # 等待应答的指令（按发送顺序）
+        self.receive_task = None
+        self.heartbeat_task = None
+        self.status = None  # 最近一次设备状态（status 字段）
+        self.device_info = None  # 最近一次连接通知
+        self.status_waiters = []
+        self.complete_waiters = []
+
+    # ---------------------- 连接 ----------------------
+    async def connect(self, timeout=CONNECT_TIMEOUT):
+        if self.connected:
+            return self
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.device_ip, self.port), timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise DeviceError(f"无法连接设备 {self.device_ip}:{self.port}: {e!r}") from None
+        self.receive_task = asyncio.ensure_future(self._receive_loop(self.reader))
+        self.heartbeat_task = asyncio.ensure_future(self._heartbeat_loop())
+        return self
+
+    @property
+    def connected(self):
+        return self.writer is not None and not self.writer.is_closing()
+
+    async def close(self):
+        for task in (self.heartbeat_task, self.receive_task):
+            if task:
+                task.cancel()
+        if self.writer:
+            self.writer.close()
+        self.writer = None
+        self._fail_pending(DeviceError("连接已关闭"))
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def _receive_loop(self, reader):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        try:
+            while True:
+                data = await reader.read(RECV_BUFFER_SIZE)
+                if not data:
+                    break
+                buffer += data.decode("utf-8", errors="ignore")
+                # 应答可能粘包或被拆分：逐个解析完整的JSON对象
+                while True:
+                    buffer = buffer.lstrip()
+                    if not buffer:
+                        break
+                    try:
+                        message, end = decoder.raw_decode(buffer)
+                    except json.JSONDecodeError:
+                        if len(buffer) > NOTIFICATION_LINE_LIMIT:
+                            buffer = ""
+                        break
+                    buffer = buffer[end:]
+                    if isinstance(message, dict) and "response" in message:
+                        self.handle_response(str(message["response"]))
+        except OSError:
+            pass
+        finally:
+            if self.writer:
+                self.writer.close()
+            self._fail_pending(DeviceError(f"设备 {self.device_ip} 已断开连接"))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                await self.command(HEARTBEAT_CMD)
+            except DeviceError:
+                pass
+
+    def _fail_pending(self, error):
+        while self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_exception(error)
+                future.exception()  # 无人等待时不报 "exception was never retrieved"
+
+    def handle_response(self, text):
+        """收到一条应答（来自6688连接，或数据流模式下经6677转来）：交给最早发出的等待中的指令"""
+        if self.pending:
+            future = self.pending.popleft()
+            if not future.done():
+                future.set_result(text)
+
+    # ---------------------- 指令 ----------------------
+    async def command(self, cmd, timeout=RESPONSE_TIMEOUT):
+        """发送一条指令（字典，可同时包含多个字段）并等待应答，返回应答文本"""
+        if not self.connected:
+            raise DeviceError(f"未连接设备 {self.device_ip}")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self.writer.write(encode_cmd(cmd))
+        try:
+            await self.writer.drain()
+            text = await asyncio.wait_for(asyncio.shield(future), timeout)
+        except asyncio.TimeoutError:
+            if future in self.pending:
+                self.pending.remove(future)
+            raise CommandTimeout(f"等待设备应答超时: {json.dumps(cmd)}") from None
+        except OSError as e:
+            raise DeviceError(f"指令发送失败: {e}") from None
+        ok, message = parse_response(text)
+        if not ok:
+            raise DeviceError(f"设备返回错误（{json.dumps(cmd)}）: {message}")
+        return text
+
+    async def configure(self, **fields):
+        """一次发送多个指令字段，如 configure(as7341Led=True, as7341Brightness=10, streamInterval=500)"""
+        return await self.command(fields)
+
+    async def start_stream(self):
+        return await self.command({"dataStream": True})
+
+    async def stop_stream(self):
+        return await self.command({"dataStream": False})
+
+    async def set_continuous(self):
+        return await self.command({"streamMode": "continuous"})
+
+    async def set_fixed_count(self, count):
+        return await self.command({"streamMode": "fixed", "streamCount": int(count)})
+
+    async def set_stream_count(self, count):
+        return await self.command({"streamCount": int(count)})
+
+    async def pause_stream(self):
+        return await self.command({"streamPause": True})
+
+    async def resume_stream(self):
+        return await self.command({"streamPause": False})
+
+    async def reset_stream_count(self):
+        return await self.command({"streamReset": True})
+
+    async def set_interval(self, interval_ms):
+        if interval_ms < MIN_STREAM_INTERVAL:
+            raise ValueError(f"数据流间隔不能小于 {MIN_STREAM_INTERVAL}ms: {interval_ms}")
+        return await self.command({"streamInterval": int(interval_ms)})
+
+    async def set_led(self, on):
+        return await self.command({"as7341Led": bool(on)})
+
+    async def set_led_brightness(self, value):
+        return await self.command({"as7341Brightness": _check_brightness(value)})
+
+    async def set_uv(self, on):
+        return await self.command({"uvLed": bool(on)})
+
+    async def set_uv_brightness(self, value):
+        return await self.command({"uvBrightness": _check_brightness(value)})
+
+    async def set_buzzer(self, on):
+        return await self.command({"buzzer": bool(on)})
+
+    async def reboot(self):
+        return await self.command({"reboot": True})
+
+    # ---------------------- 通知（需要 AsyncSpectrometerHost） ----------------------
+    def _require_host(self):
+        if self.host is None or not self.host.serving:
+            raise DeviceError("接收设备状态与光谱数据需要本机服务（AsyncSpectrometerHost）")
+
+    async def get_status(self, timeout=STATUS_TIMEOUT):
+        """请求并等待设备状态通知（经6677端口），返回 status 字典"""
+        self._require_host()
+        waiter = asyncio.get_running_loop().create_future()
+        self.status_waiters.append(waiter)
+        try:
+            await self.command({"getDeviceStatus": True})
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise CommandTimeout(f"等待设备状态超时: {self.device_ip}") from None
+        finally:
+            if waiter in self.status_waiters:
+                self.status_waiters.remove(waiter)
+
+    async def wait_stream_complete(self, timeout=None):
+        """等待固定数量模式的数据流完成通知，返回通知内容"""
+        self._require_host()
+        waiter = asyncio.get_running_loop().create_future()
+        self.complete_waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            raise CommandTimeout(f"等待数据流完成超时: {self.device_ip}") from None
+        finally:
+            if waiter in self.complete_waiters:
+                self.complete_waiters.remove(waiter)
+
+    def samples(self, queue_size=SAMPLE_QUEUE_SIZE):
+        """本设备光谱数据的异步迭代器"""
+        self._require_host()
+        return self.host.samples(self.device_ip, queue_size)
+
+    def handle_notification(self, kind, json_data):
+        if kind == "status":
+            self.status = json_data.get("status", json_data)
+            waiters, self.status_waiters = self.status_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(self.status)
+        elif kind == "connection":
+            self.device_info = json_data
+        elif kind == "stream_complete":
+            waiters, self.complete_waiters = self.complete_waiters, []
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(json_data)
+
+# ========================== 本机服务 ==========================
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, host):
+        self.host = host
+
+    def datagram_received(self, data, addr):
+        self.host.handle_datagram(data, addr[0])
+
+
+class AsyncSpectrometerHost:
+    """本机 6677 通知服务器与 6699 光谱数据端点，管理多台设备（AsyncDevice）"""
+
+    def __init__(self, local_ip, notification_port=TCP_SERVER_PORT, data_port=UDP_SERVER_PORT):
+        self.local_ip = local_ip
+        self.notification_port = notification_port
+        self.data_port = data_port
+        self.devices = {}
+        self.server = None
+        self.transport = None
+        self.subscriptions = []  # [设备IP或None, 队列]
+        self.notification_clients = {}  # 任务 -> 6677连接的writer
+        self.received_count = 0
+        self.dropped_count = 0   # 订阅队列满时丢弃的数据点数
+        self.serving = False
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_notification_client, self.local_ip,
+                                                 self.notification_port, reuse_address=True,
+                                                 limit=NOTIFICATION_LINE_LIMIT)
+        try:
+            self.transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _DatagramProtocol(self), local_addr=(self.local_ip, self.data_port))
+        except OSError:
+            self.server.close()
+            raise
+        self.serving = True
+        return self
+
+    async def close(self):
+        self.serving = False
+        for device in list(self.devices.values()):
+            await device.close()
+        if self.server:
+            self.server.close()
+            for writer in self.notification_clients.values():
+                writer.close()
+            await asyncio.gather(*self.notification_clients, return_exceptions=True)
+            await self.server.wait_closed()
+        if self.transport:
+            self.transport.close()
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def device(self, device_ip, connect=True, port=DEVICE_CMD_PORT):
+        """返回设备（首次调用时创建并连接6688指令服务器）"""
+        device = self.devices.get(device_ip)
+        if device is None:
+            device = self.devices[device_ip] = AsyncDevice(device_ip, self, port)
+        if connect:
+            await device.connect()
+        return device
+
+    async def _handle_notification_client(self, reader, writer):
+        device_ip = writer.get_extra_info("peername")[0]
+        task = asyncio.current_task()
+        self.notification_clients[task] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    json_data = json.loads(line)
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    continue
+                if isinstance(json_data, dict):
+                    self.handle_notification(json_data, device_ip)
+        except (OSError, ValueError):
+            pass
+        finally:
+            self.notification_clients.pop(task, None)
+            writer.close()
+
+    def handle_notification(self, json_data, device_ip):
+        device = self.devices.get(device_ip)
+        if device is None:
+            device = self.devices[device_ip] = AsyncDevice(device_ip, self)
+        if "response" in json_data:  # 数据流模式下指令应答经6677连接返回
+            device.handle_response(str(json_data["response"]))
+            return
+        kind = notification_kind(json_data)
+        if kind:
+            device.handle_notification(kind, json_data)
+
+    def handle_datagram(self, data, device_ip):
+        try:
+            json_data = json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            return
+        packet = normalize_spectral_packet(json_data, device_ip) if isinstance(json_data, dict) else None
+        if not packet:
+            return
+        self.received_count += 1
+        if not self.subscriptions:
+            return
+        sample = spectral_sample(packet)
+        for subscription_ip, q in self.subscriptions:
+            if subscription_ip is None or subscription_ip == device_ip:
+                if _offer(q, sample):
+                    self.dropped_count += 1
+
+    def subscribe(self, q, device_ip=None):
+        """把光谱数据放入队列 q（asyncio.Queue 或 queue.Queue，满时丢弃最旧数据），返回取消订阅的函数"""
+        subscription = [device_ip, q]
+        self.subscriptions.append(subscription)
+        return lambda: self.subscriptions.remove(subscription) if subscription in self.subscriptions else None
+
+    async def samples(self, device_ip=None, queue_size=SAMPLE_QUEUE_SIZE):
+        """光谱数据的异步迭代器（device_ip 为 None 时为所有设备）"""
+        q = asyncio.Queue(queue_size)
+        unsubscribe = self.subscribe(q, device_ip)
+        try:
+            while True:
+                yield await q.get()
+        finally:
+            unsubscribe()
+
+# ========================== 同步封装 ==========================
+class Device:
+    """AsyncDevice 的同步封装：方法与 AsyncDevice 相同，阻塞直到设备应答"""
+
+    def __init__(self, host, device):
+        self._host = host
+        self._device = device
+        self.device_ip = device.device_ip
+
+    @property
+    def status(self):
+        return self._device.status
+
+    def _run(self, name, *args, **kwargs):
+        return self._host.run(getattr(self._device, name)(*args, **kwargs))
+
+    def command(self, cmd, timeout=RESPONSE_TIMEOUT):
+        return self._run("command", cmd, timeout)
+
+    def configure(self, **fields):
+        return self._run("configure", **fields)
+
+    def start_stream(self):
+        return self._run("start_stream")
+
+    def stop_stream(self):
+        return self._run("stop_stream")
+
+    def set_continuous(self):
+        return self._run("set_continuous")
+
+    def set_fixed_count(self, count):
+        return self._run("set_fixed_count", count)
+
+    def set_stream_count(self, count):
+        return self._run("set_stream_count", count)
+
+    def pause_stream(self):
+        return self._run("pause_stream")
+
+    def resume_stream(self):
+        return self._run("resume_stream")
+
+    def reset_stream_count(self):
+        return self._run("reset_stream_count")
+
+    def set_interval(self, interval_ms):
+        return self._run("set_interval", interval_ms)
+
+    def set_led(self, on):
+        return self._run("set_led", on)
+
+    def set_led_brightness(self, value):
+        return self._run("set_led_brightness", value)
+
+    def set_uv(self, on):
+        return self._run("set_uv", on)
+
+    def set_uv_brightness(self, value):
+        return self._run("set_uv_brightness", value)
+
+    def set_buzzer(self, on):
+        return self._run("set_buzzer", on)
+
+    def reboot(self):
+        return self._run("reboot")
+
+    def get_status(self, timeout=STATUS_TIMEOUT):
+        return self._run("get_status", timeout)
+
+    def wait_stream_complete(self, timeout=None):
+        return self._run("wait_stream_complete", timeout)
+
+    def samples(self, timeout=None, count=None):
+        return self._host.samples(self.device_ip, timeout, count)
+
+    def close(self):
+        self._run("close")
+
+
+class SpectrometerHost:
+    """AsyncSpectrometerHost 的同步封装：事件循环在后台线程中运行。
+    local_ip 为 None 时不启动本机服务，只能发送指令（无法接收状态与光谱数据）"""
+
+    def __init__(self, local_ip=None, notification_port=TCP_SERVER_PORT, data_port=UDP_SERVER_PORT):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="SpectrometerHost", daemon=True)
+        self.thread.start()
+        self.host = AsyncSpectrometerHost(local_ip, notification_port, data_port)
+        if local_ip is not None:
+            try:
+                self.run(self.host.start())
+            except Exception:
+                self.close()
+                raise
+
+    def run(self, coro, timeout=None):
+        """在后台事件循环中执行协程并等待结果"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def device(self, device_ip, port=DEVICE_CMD_PORT):
+        return Device(self, self.run(self.host.device(device_ip, port=port)))
+
+    def samples(self, device_ip=None, timeout=None, count=None, queue_size=SAMPLE_QUEUE_SIZE):
+        """光谱数据生成器：timeout 秒内没有新数据或已返回 count 个数据点时结束"""
+        if not self.host.serving:
+            raise DeviceError("接收光谱数据需要本机服务（local_ip）")
+        q = queue.Queue(queue_size)
+        unsubscribe = self.run(self._subscribe(q, device_ip))
+        try:
+            returned = 0
+            while count is None or returned < count:
+                try:
+                    yield q.get(timeout=timeout)
+                except queue.Empty:
+                    return
+                returned += 1
+        finally:
+            self.loop.call_soon_threadsafe(unsubscribe)
+
+    async def _subscribe(self, q, device_ip):
+        return self.host.subscribe(q, device_ip)
+
+    def close(self):
+        if not self.loop.is_running():
+            return
+        self.run(self.host.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(CONNECT_TIMEOUT)
+        self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
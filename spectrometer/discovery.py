@@ -0,0 +1,207 @@
+import os
+import json
+import time
+import socket
+import asyncio
+import ipaddress
+
+from .protocol import DEVICE_CMD_PORT, HEARTBEAT_CMD, encode_cmd
+
+# ========================== 宏定义 ==========================
+DEFAULT_LOCAL_IP = "192.168.137.1"  # Windows移动热点网关（找不到合适网卡时使用）
+PROBE_TIMEOUT = 0.3          # 单个地址的6688端口连接超时（秒）
+IDENTIFY_TIMEOUT = 0.5       # 连接后等待设备应答心跳的超时（秒）
+PROBE_CONCURRENCY = 256      # 同时进行的探测数
+MAX_SCAN_PREFIX = 24         # 网段大于 /24 时只扫描本机所在的 /24
+DISCOVERY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".spectrometer_devices.json")
+
+# ========================== 本机网卡 ==========================
+def _route_source_ip(target_ip):
+    """系统路由到 target_ip 时使用的本机地址（UDP connect 不发送数据）"""
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            s.connect((target_ip, DEVICE_CMD_PORT))
+            return s.getsockname()[0]
+    except OSError:
+        return None
+
+def _linux_interfaces():
+    """Linux：通过 ioctl 读取各网卡的地址与子网掩码，返回 [(IP, 前缀长度)]"""
+    import fcntl
+    import struct
+    result = []
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+        for _, name in socket.if_nameindex():
+            request = struct.pack("256s", name.encode()[:15])
+            try:
+                ip = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x8915, request)[20:24])        # SIOCGIFADDR
+                netmask = socket.inet_ntoa(fcntl.ioctl(s.fileno(), 0x891B, request)[20:24])   # SIOCGIFNETMASK
+            except OSError:
+                continue
+            result.append((ip, ipaddress.IPv4Network(f"0.0.0.0/{netmask}").prefixlen))
+    return result
+
+def local_interfaces():
+    """本机IPv4地址列表 [(IP, 前缀长度)]（排除回环与链路本地地址；无法获取子网掩码时按 /24）"""
+    found = {}
+    if hasattr(socket, "if_nameindex") and os.name == "posix":
+        try:
+            found.update(_linux_interfaces())
+        except (ImportError, OSError):
+            pass
+    try:
+        for info in socket.getaddrinfo(socket.gethostname(), None, socket.AF_INET):
+            found.setdefault(info[4][0], 24)
+    except OSError:
+        pass
+    primary = _route_source_ip("10.255.255.255")
+    if primary:
+        found.setdefault(primary, 24)
+    result = []
+    for ip, prefix in found.items():
+        address = ipaddress.IPv4Address(ip)
+        if not (address.is_loopback or address.is_link_local or address.is_unspecified):
+            result.append((ip, prefix))
+    # 主路由网卡排在前面
+    result.sort(key=lambda item: item[0] != primary)
+    return result
+
+def scan_network(ip, prefix=24):
+    """ip 所在的待扫描网段（大于 /MAX_SCAN_PREFIX 时缩小为本机所在的 /MAX_SCAN_PREFIX）"""
+    return ipaddress.IPv4Interface(f"{ip}/{max(prefix, MAX_SCAN_PREFIX)}").network
+
+def local_network(local_ip, interfaces=None):
+    """本机IP所在的网段（网卡前缀长度未知时按 /24）"""
+    for ip, prefix in interfaces if interfaces is not None else local_interfaces():
+        if ip == local_ip:
+            return ipaddress.IPv4Interface(f"{ip}/{prefix}").network
+    return ipaddress.IPv4Interface(f"{local_ip}/24").network
+
+def local_ip_for(device_ip, interfaces=None):
+    """与设备同网段的本机IP（6677/6699服务应绑定的地址），找不到时使用系统路由选择的地址"""
+    address = ipaddress.IPv4Address(device_ip)
+    for ip, prefix in interfaces if interfaces is not None else local_interfaces():
+        if address in ipaddress.IPv4Interface(f"{ip}/{prefix}").network:
+            return ip
+    return _route_source_ip(device_ip)
+
+# ========================== 设备缓存 ==========================
+class DeviceCache:
+    """已知设备缓存（JSON文件）：按设备IP保存名称、对应的本机IP与最后发现时间，
+    启动与搜索时优先探测缓存中的地址，设备不换IP时无需扫描整个网段"""
+
+    def __init__(self, path=DISCOVERY_CACHE_FILE):
+        self.path = path
+        self.devices = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.devices = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def save(self):
+        try:
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(self.devices, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"[Discovery] 设备缓存保存失败: {e}")
+
+    def update(self, device_ip, name=None, local_ip=None):
+        entry = self.devices.setdefault(device_ip, {})
+        if name:
+            entry["name"] = name
+        if local_ip:
+            entry["local_ip"] = local_ip
+        entry["last_seen"] = time.time()
+        self.save()
+
+    def known_ips(self):
+        """按最后发现时间从新到旧排列的设备IP"""
+        return sorted(self.devices, key=lambda ip: -self.devices[ip].get("last_seen", 0))
+
+    def find(self, name):
+        """名称对应的最近一次发现的设备IP"""
+        for ip in self.known_ips():
+            if self.devices[ip].get("name") == name:
+                return ip
+        return None
+
+    def last_local_ip(self):
+        """最近发现的设备所用的本机IP（仍存在于本机网卡时）"""
+        current = {ip for ip, _ in local_interfaces()}
+        for ip in self.known_ips():
+            local_ip = self.devices[ip].get("local_ip")
+            if local_ip in current:
+                return local_ip
+        return None
+
+# ========================== 网段探测 ==========================
+async def probe(ip, port=DEVICE_CMD_PORT, timeout=PROBE_TIMEOUT, identify_timeout=IDENTIFY_TIMEOUT):
+    """探测 ip 的指令端口：端口不通返回None；连接成功后发送心跳，返回
+    {"ip", "rtt"（连接耗时ms）, "identified"（设备是否按协议应答）}。
+    设备同一时间只服务一个指令连接，已被其他程序连接的设备不会应答（identified 为 False）"""
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    rtt = (time.perf_counter() - start) * 1000
+    identified = False
+    try:
+        writer.write(encode_cmd(HEARTBEAT_CMD))
+        data = await asyncio.wait_for(reader.read(256), identify_timeout)
+        identified = b'"response"' in data
+    except (OSError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+    return {"ip": ip, "rtt": round(rtt, 1), "identified": identified}
+
+async def scan(hosts, port=DEVICE_CMD_PORT, timeout=PROBE_TIMEOUT, concurrency=PROBE_CONCURRENCY):
+    """并发探测地址列表，返回开放指令端口的地址（按IP排序）"""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited(ip):
+        async with semaphore:
+            return await probe(ip, port, timeout)
+
+    results = await asyncio.gather(*(limited(str(ip)) for ip in hosts))
+    return sorted((r for r in results if r), key=lambda r: ipaddress.IPv4Address(r["ip"]))
+
+async def discover(cache=None, interfaces=None, port=DEVICE_CMD_PORT, timeout=PROBE_TIMEOUT, exclude=(),
+                   full_scan=True):
+    """搜索设备：探测缓存中的已知地址，full_scan 时同时并发扫描本机各网卡所在网段。
+    返回 [{"ip", "rtt", "identified", "local_ip", "name", "cached"}]，并更新缓存；
+    exclude 为不探测的地址（如已连接的设备，避免占用其唯一的指令连接）"""
+    interfaces = local_interfaces() if interfaces is None else interfaces
+    own = {ip for ip, _ in interfaces}
+    skip = own | set(exclude)
+    known = [ip for ip in (cache.known_ips() if cache else []) if ip not in skip]
+    hosts = list(known)
+    for ip, prefix in interfaces if full_scan else ():
+        hosts += [str(h) for h in scan_network(ip, prefix).hosts() if str(h) not in skip]
+    hosts = list(dict.fromkeys(hosts))  # 去重，保持已知地址在前
+    found = await scan(hosts, port, timeout)
+    for result in found:
+        result["local_ip"] = local_ip_for(result["ip"], interfaces)
+        result["cached"] = result["ip"] in known
+        result["name"] = cache.devices.get(result["ip"], {}).get("name") if cache else None
+        if cache and result["identified"]:
+            cache.update(result["ip"], local_ip=result["local_ip"])
+    return found
+
+def discover_devices(cache=None, **kwargs):
+    """discover() 的同步版本（在调用线程中运行新的事件循环）"""
+    return asyncio.run(discover(cache, **kwargs))
+
+def auto_local_ip(cache=None):
+    """启动时选择本机IP：最近发现设备所用的网卡 > 192.168.137.x 热点网卡 > 主路由网卡 > DEFAULT_LOCAL_IP"""
+    if cache:
+        local_ip = cache.last_local_ip()
+        if local_ip:
+            return local_ip
+    interfaces = local_interfaces()
+    for ip, _ in interfaces:
+        if ip.startswith("192.168.137."):
+            return ip
+    return interfaces[0][0] if interfaces else DEFAULT_LOCAL_IP
@@ -0,0 +1,453 @@
+import os
+import sys
+import json
+import time
+import threading
+from datetime import datetime
+
+from .notifications import NotificationCenter, LEVEL_WARNING, LEVEL_ERROR
+from .pipeline import DataProcessor, PipelineWorker
+from .protocol import MIN_STREAM_INTERVAL, is_valid_ipv4
+from .netcore import NetworkCore, dispatch_events
+from .supervisor import acquisition_supervisor, summarize_report
+from .measurement import (MeasurementSequence, MeasurementError, MEASUREMENT_TARGET,
+                          write_measurement_session_csv, measurement_session_filename)
+
+# ========================== 宏定义 ==========================
+STATUS_QUERY_INTERVAL = 10   # 设备状态查询间隔（秒）
+STATS_INTERVAL = 10          # 统计信息输出间隔（秒）
+
+# ========================== 状态输出模块 ==========================
+class StatusWriter:
+    """JSON-lines状态输出：每个事件一行 {"ts": ..., "event": ..., ...}（线程安全）"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "event": event}
+        record.update(fields)
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+# ========================== 无界面采集引擎 ==========================
+class AcquisitionEngine:
+    """无界面采集引擎：设备连接、数据流控制、LED/UV测量、定时测量与数据记录
+
+    与GUI使用同一套网络核心、处理线程与测量流程，但不依赖PyQt5/pyqtgraph。
+    所有状态变化通过 StatusWriter 以JSON-lines输出。
+    """
+
+    def __init__(self, local_ip, device_ip=None, status=None, stream_interval=1000, database=None):
+        self.local_ip = local_ip
+        self.database = database  # 可选的 SessionDatabase：定时会话的每次测量同时写入会话库
+        self.status = status or StatusWriter()
+        self.stream_interval = stream_interval
+        self.device_ip = device_ip
+        self.device_info = None
+        self.device_status = None
+        self.data_normal = None
+        self.running = False
+        self.stop_requested = threading.Event()  # 外部请求结束当前任务（如Ctrl+C）
+
+        # 通知：错误去重限流后输出为状态事件
+        self.notifications = NotificationCenter()
+        self.notifications.add_listener(self.on_notification)
+
+        # 数据处理线程
+        self.processor = DataProcessor()
+        self.pipeline = PipelineWorker(self.processor)
+        self.pipeline.on_parse_error = lambda err_msg: self.notify(
+            LEVEL_ERROR, "光谱数据解析错误", err_msg, key="spectral_parse_error")
+
+        # 网络核心：光谱数据直接入队处理线程，其余事件由分发线程处理
+        self.network = NetworkCore(local_ip, data_sink=self.pipeline.submit)
+        self.network_handlers = {
+            "device_connected": self.on_device_connected,
+            "device_status": self.on_device_status,
+            "stream_complete": self.on_stream_complete,
+            "server_status": self.on_server_status,
+            "json_parse_error": self.on_json_parse_error,
+            "data_status": self.on_data_status,
+            "connection_established": self.on_client_connected,
+            "client_status": self.on_client_status,
+            "cmd_response": self.on_cmd_response,
+            "cmd_send_error": self.on_cmd_send_error
+        }
+        self.dispatch_thread = None
+
+        # 监控网络与处理线程：故障时自动重启，记录中断区间与重启次数
+        self.supervisor = acquisition_supervisor(self.network, self.pipeline, self.on_worker_event)
+
+        self.tcp_client = None
+        self.client_connected = threading.Event()
+        self.stream_complete_event = threading.Event()
+        self.stats_thread = None
+
+        # 数据流与测量状态
+        self.data_stream_active = False
+        self.stream_paused = False
+        self.current_measurement = None
+        self.measurement_session = None
+        self.streaming_record = None  # 边记录边写入的文件路径
+
+    # ---------------------- 生命周期 ----------------------
+    def start(self):
+        """启动处理线程与网络服务；指定设备IP时直接连接指令服务器"""
+        self.running = True
+        self.pipeline.start()
+        self.dispatch_thread = threading.Thread(
+            target=dispatch_events, args=(self.network.events, self.network_handlers, lambda: self.device_ip),
+            name="EngineEvents", daemon=True)
+        self.dispatch_thread.start()
+        self.network.start()
+        self.supervisor.start()
+        self.stats_thread = threading.Thread(target=self.stats_loop, name="EngineStats", daemon=True)
+        self.stats_thread.start()
+        self.status.emit("engine_started", local_ip=self.local_ip, pid=os.getpid())
+        if self.device_ip:
+            self.connect_device(self.device_ip)
+
+    def stop(self):
+        """停止所有线程（关闭数据流与灯光后退出）"""
+        if not self.running:
+            return
+        self.running = False
+        if self.current_measurement:
+            self.current_measurement.cancel()
+        if self.is_connected():
+            if self.data_stream_active:
+                self.tcp_client.send_cmd({"dataStream": False})
+            for cmd in ({"as7341Led": False}, {"uvLed": False}):
+                self.tcp_client.send_cmd(cmd)
+        self.supervisor.stop()
+        self.network.stop()
+        self.dispatch_thread.join(5)
+        self.pipeline.stop()
+        self.status.emit("engine_stopped", **self.stats())
+
+    def request_stop(self):
+        """请求结束当前任务（可在信号处理函数中调用），随后由调用方执行stop()"""
+        self.stop_requested.set()
+        if self.current_measurement:
+            self.current_measurement.cancel()
+
+    def notify(self, level, title, message, key=None):
+        self.notifications.post(level, title, message, key)
+
+    def on_notification(self, entry, shown):
+        if shown:
+            self.status.emit("notification", level=entry.level, title=entry.title,
+                             message=entry.message, count=entry.count)
+
+    # ---------------------- 设备连接 ----------------------
+    def connect_device(self, device_ip):
+        """连接设备6688指令服务器（同一设备已连接时忽略）"""
+        if self.tcp_client and self.tcp_client.device_ip == device_ip:
+            return
+        if self.tcp_client:
+            self.tcp_client.stop()
+        self.device_ip = device_ip
+        self.client_connected.clear()
+        self.status.emit("device_connecting", device_ip=device_ip)
+        self.tcp_client = self.network.connect_device(device_ip)
+
+    def wait_for_device(self, timeout=None):
+        """等待指令服务器连接成功"""
+        return self.client_connected.wait(timeout)
+
+    def is_connected(self):
+        return self.tcp_client is not None and self.tcp_client.is_connected()
+
+    def send_cmd(self, cmd_dict):
+        if not self.tcp_client:
+            self.notify(LEVEL_ERROR, "指令发送错误", "指令发送失败：未连接设备", key="cmd_send_error")
+            return False
+        return self.tcp_client.send_cmd(cmd_dict)
+
+    # ---------------------- 网络事件 ----------------------
+    def on_device_connected(self, device_info):
+        self.device_info = device_info
+        device_ip = device_info.get("ip", "") or device_info.get("device_ip", "")
+        self.status.emit("device_found", device_ip=device_ip, device=device_info.get("device"),
+                         rssi=device_info.get("rssi"), info=device_info.get("status"))
+        if device_ip and is_valid_ipv4(device_ip):
+            self.connect_device(device_ip)
+
+    def on_device_status(self, device_status):
+        self.device_status = device_status
+        self.status.emit("device_status", status=device_status.get("status", {}))
+
+    def on_stream_complete(self, stream_data):
+        self.processor.mark_stream_complete()
+        self.stream_paused = True
+        self.stream_complete_event.set()
+        self.status.emit("stream_complete", total_packets=stream_data.get("total_packets", 0),
+                         target_count=stream_data.get("target_count", 0),
+                         actual_count=stream_data.get("actual_count", 0))
+
+    def on_server_status(self, is_success, status_msg):
+        if is_success:
+            self.status.emit("server_status", ok=True, message=status_msg)
+        else:
+            self.notify(LEVEL_ERROR, "服务启动失败", status_msg, key="server_status_error")
+
+    def on_json_parse_error(self, err_msg):
+        self.notify(LEVEL_ERROR, "JSON解析错误", err_msg, key="json_parse_error")
+
+    def on_data_status(self, is_normal):
+        # 只在状态变化时输出
+        if is_normal != self.data_normal:
+            self.data_normal = is_normal
+            self.status.emit("data_status", normal=is_normal)
+
+    def on_client_connected(self, device_ip):
+        self.client_connected.set()
+        self.status.emit("device_online", device_ip=device_ip)
+        self.send_cmd({"getDeviceStatus": True})
+
+    def on_client_status(self, connected, device_ip):
+        if not connected:
+            self.client_connected.clear()
+            self.status.emit("device_offline", device_ip=device_ip)
+
+    def on_cmd_response(self, response):
+        try:
+            response_json = json.loads(response)
+        except json.JSONDecodeError:
+            response_json = None
+        if isinstance(response_json, dict) and "response" in response_json:
+            self.status.emit("cmd_response", response=response_json["response"])
+        else:
+            self.status.emit("cmd_response", response=response)
+
+    def on_cmd_send_error(self, err_msg):
+        self.notify(LEVEL_ERROR, "指令发送错误", err_msg, key="cmd_send_error")
+
+    def on_worker_event(self, event, name, info):
+        """Supervisor 事件（监控线程中调用）：worker_down / worker_restarted / worker_restart_failed / worker_recovered"""
+        self.status.emit(event, worker=name, **info)
+
+    # ---------------------- 数据流控制 ----------------------
+    def start_stream(self, mode="continuous", interval=None, count=None, paused=False):
+        """开启数据流（与GUI相同：先以暂停状态开启，再按需继续）"""
+        interval = max(interval or self.stream_interval, MIN_STREAM_INTERVAL)
+        self.stream_interval = interval
+        cmd = {"dataStream": True, "streamPause": True, "streamMode": mode, "streamInterval": interval}
+        if mode == "fixed":
+            cmd["streamCount"] = count or 100
+        if not self.send_cmd(cmd):
+            return False
+        self.data_stream_active = True
+        self.stream_paused = True
+        self.stream_complete_event.clear()
+        self.status.emit("stream_started", mode=mode, interval=interval, count=cmd.get("streamCount"))
+        return paused or self.resume_stream()
+
+    def stop_stream(self):
+        if not self.send_cmd({"dataStream": False}):
+            return False
+        self.data_stream_active = False
+        self.stream_paused = False
+        self.status.emit("stream_stopped")
+        return True
+
+    def pause_stream(self):
+        if self.send_cmd({"streamPause": True}):
+            self.stream_paused = True
+            self.status.emit("stream_paused")
+            return True
+        return False
+
+    def resume_stream(self):
+        if self.send_cmd({"streamPause": False}):
+            self.stream_paused = False
+            self.status.emit("stream_resumed")
+            return True
+        return False
+
+    def reset_stream_count(self):
+        return self.send_cmd({"streamReset": True})
+
+    def set_stream_interval(self, interval):
+        if interval < MIN_STREAM_INTERVAL:
+            self.notify(LEVEL_WARNING, "间隔过小", f"数据流最小间隔为 {MIN_STREAM_INTERVAL} ms")
+            return False
+        if self.send_cmd({"streamInterval": interval}):
+            self.stream_interval = interval
+            return True
+        return False
+
+    # ---------------------- 设备参数控制 ----------------------
+    def set_as7341_led(self, on):
+        return self.send_cmd({"as7341Led": bool(on)})
+
+    def set_as7341_brightness(self, value):
+        return self.send_cmd({"as7341Brightness": value})
+
+    def set_uv_led(self, on):
+        return self.send_cmd({"uvLed": bool(on)})
+
+    def set_uv_brightness(self, value):
+        return self.send_cmd({"uvBrightness": value})
+
+    def set_buzzer(self, on):
+        return self.send_cmd({"buzzer": bool(on)})
+
+    def get_device_status(self):
+        return self.send_cmd({"getDeviceStatus": True})
+
+    def reboot(self):
+        return self.send_cmd({"reboot": True})
+
+    # ---------------------- 数据记录 ----------------------
+    def start_record(self, file_path=None):
+        """开始记录，指定文件路径时边记录边写入CSV（带稀疏索引）"""
+        if not self.processor.start_record(file_path):
+            self.notify(LEVEL_ERROR, "记录失败", f"无法创建记录文件: {file_path}")
+            return False
+        self.streaming_record = file_path
+        self.status.emit("record_started", path=file_path)
+        return True
+
+    def stop_record(self, file_path=None):
+        """停止记录，指定文件路径时保存为CSV（已边记录边写入同一文件时不再重写）"""
+        record_data, record_count = self.processor.stop_record()
+        self.status.emit("record_stopped", count=record_count)
+        if file_path and file_path == self.streaming_record:
+            self.streaming_record = None
+            self.status.emit("record_saved", ok=True, message=f"保存成功: {file_path}", path=file_path)
+            return True
+        if file_path:
+            success, msg = self.processor.save_to_csv(record_data, file_path)
+            self.status.emit("record_saved", ok=success, message=msg, path=file_path)
+            return success
+        return True
+
+    # ---------------------- 测量 ----------------------
+    def run_measurement(self, measurement_index=0):
+        """执行一次LED/UV测量（阻塞），失败时返回None"""
+        if not self.is_connected():
+            self.notify(LEVEL_WARNING, "警告", "未连接设备，无法开始测量！")
+            return None
+        if not self.data_stream_active or self.stream_paused:
+            self.notify(LEVEL_WARNING, "警告", "数据流未开启或处于暂停状态，无法开始测量！")
+            return None
+
+        def on_stage(measurement_type, samples, timeout):
+            self.status.emit("measurement_stage", index=measurement_index, type=measurement_type,
+                             samples=len(samples), timeout=timeout)
+
+        self.current_measurement = MeasurementSequence(
+            self.send_cmd, self.pipeline, MEASUREMENT_TARGET, self.stream_interval, on_stage)
+        try:
+            measurement = self.current_measurement.run(measurement_index)
+        except MeasurementError as e:
+            self.notify(LEVEL_ERROR, "测量失败", str(e))
+            return None
+        finally:
+            self.current_measurement = None
+
+        total_points = sum(len(measurement[key]) for key in ("led_only", "uv_only", "led_uv"))
+        self.status.emit("measurement_complete", index=measurement_index, points=total_points,
+                         partial_timeout=measurement["timeout"])
+        return measurement
+
+    def run_timed_session(self, duration, interval, output_dir=".", plate_map=None):
+        """定时测量会话（阻塞）：每interval秒测量一次，共duration秒；
+        每次测量后整体重写会话CSV（并写入会话库），返回会话文件路径"""
+        session_start = datetime.now().strftime("%Y%m%d_%H%M%S")
+        file_path = os.path.join(output_dir, measurement_session_filename(session_start))
+        measurements = []
+        self.measurement_session = {"session_start": session_start, "measurements": measurements}
+        session_id = self.create_db_session(session_start, interval, file_path, plate_map)
+        supervision_mark = self.supervisor.mark()
+        self.status.emit("session_started", duration=duration, interval=interval, path=file_path,
+                         session_id=session_id)
+
+        start_time = time.time()
+        next_time = start_time
+        while not self.stop_requested.is_set() and time.time() - start_time < duration:
+            if time.time() < next_time:
+                time.sleep(min(0.5, next_time - time.time()))
+                continue
+            next_time += interval
+
+            measurement = self.run_measurement(len(measurements))
+            if measurement is None:
+                continue
+            measurements.append(measurement)
+            self.save_session(measurements, file_path)
+            if session_id is not None:
+                self.save_to_database(session_id, measurement)
+            self.status.emit("session_progress", completed=len(measurements),
+                             elapsed=round(time.time() - start_time, 1), duration=duration)
+
+        supervision = self.supervisor.report(supervision_mark)
+        if supervision["outages"] or supervision["lost_packets"]:
+            self.notify(LEVEL_WARNING, "会话期间数据中断", summarize_report(supervision))
+        self.status.emit("session_complete", measurements=len(measurements), path=file_path,
+                         supervision=supervision)
+        return file_path if measurements else None
+
+    def save_session(self, measurements, file_path):
+        try:
+            write_measurement_session_csv(measurements, file_path)
+            return True
+        except Exception as e:
+            self.notify(LEVEL_ERROR, "保存失败", f"保存测量数据失败: {e}")
+            return False
+
+    def create_db_session(self, session_start, interval=None, file_path=None, plate_map=None):
+        """在会话库中新建会话（记录设备、固件、亮度与间隔），未配置会话库或失败时返回None"""
+        if self.database is None:
+            return None
+        info = dict(self.device_info or {}, **(self.device_status or {}))
+        device_status = info.get("status") if isinstance(info.get("status"), dict) else {}
+        try:
+            return self.database.create_session(
+                session_start, device=info.get("device"), device_ip=self.device_ip, firmware=info.get("firmware"),
+                led_brightness=device_status.get("as7341_bright"), uv_brightness=device_status.get("uv_bright"),
+                interval=interval, stream_interval=self.stream_interval, plate_map=plate_map,
+                source=file_path and os.path.abspath(file_path))
+        except Exception as e:
+            self.notify(LEVEL_ERROR, "会话库错误", f"创建会话记录失败: {e}", key="session_db_error")
+            return None
+
+    def save_to_database(self, session_id, measurement):
+        try:
+            self.database.add_measurement(session_id, measurement)
+            return True
+        except Exception as e:
+            self.notify(LEVEL_ERROR, "会话库错误", f"写入会话库失败: {e}", key="session_db_error")
+            return False
+
+    # ---------------------- 统计 ----------------------
+    def stats(self):
+        supervision = self.supervisor.report()
+        return {
+            "received": self.pipeline.received_count,
+            "processed": self.pipeline.processed_count,
+            "dropped": self.pipeline.dropped_count,
+            "lost": self.pipeline.lost_packet_count,
+            "parse_errors": self.pipeline.parse_error_count,
+            "recorded": self.processor.get_record_count(),
+            "restarts": sum(supervision["restarts"].values()),
+            "downtime": supervision["total_downtime"]
+        }
+
+    def stats_loop(self):
+        """周期性输出统计信息并查询设备状态"""
+        last_query = last_stats = time.time()
+        while self.running:
+            time.sleep(1)
+            now = time.time()
+            if now - last_query >= STATUS_QUERY_INTERVAL and self.is_connected() and not self.current_measurement:
+                self.tcp_client.send_cmd({"getDeviceStatus": True})
+                last_query = now
+            if now - last_stats >= STATS_INTERVAL:
+                self.status.emit("stats", **self.stats())
+                last_stats = now
@@ -0,0 +1,379 @@
+import json
+import time
+import base64
+import asyncio
+import hashlib
+import threading
+from collections import deque
+
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+FANOUT_HOST = "127.0.0.1"    # 只在本机监听
+FANOUT_PORT = 6710           # 数据分发服务端口（JSON-lines 与 WebSocket 共用）
+FANOUT_QUEUE_SIZE = 1000     # 每个订阅者默认队列长度
+FANOUT_MAX_QUEUE = 100000    # 订阅者可申请的最大队列长度
+FANOUT_PENDING_MAX = 100000  # 等待分发的数据上限（分发线程跟不上时丢弃最旧数据）
+FANOUT_HELLO_TIMEOUT = 0.5   # 等待客户端首行（订阅请求或WebSocket握手）的时间（秒），超时按默认订阅
+FANOUT_LINE_LIMIT = 64 * 1024  # 客户端单行/单帧长度上限
+FANOUT_STOP_TIMEOUT = 5
+FANOUT_POLICIES = ["drop_oldest", "decimate"]
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+# ========================== 分发协议 ==========================
+# 客户端连接 FANOUT_HOST:FANOUT_PORT 后，服务器按行（JSON-lines）或按 WebSocket 文本帧（首行为 "GET ..." 时）
+# 发送消息，每条消息一个 JSON 对象：
+#   {"type": "sample", "device_ip": ..., "recv_time": ..., "timestamp": ..., "packetCount": ..., "streamCount": ..., "F1": ...}
+#   {"type": "event", "event": "device_status", "device_ip": ..., "args": [...]}   （NetworkCore 事件）
+#   {"type": "dropped", "count": 本次报告的丢弃数, "total": 累计丢弃数}             （队列溢出后，恢复发送前报告）
+#   {"type": "subscribed", ...}  /  {"type": "error", "message": ...}               （订阅请求的应答）
+# 客户端可随时发送订阅请求（一行 JSON 或一个文本帧），未给出的字段保持不变：
+#   {"devices": ["192.168.137.50"] 或 null, "channels": ["F1", "F4"] 或 null, "samples": true, "events": true,
+#    "every": 1（每 N 个数据点发送一个）, "policy": "drop_oldest" | "decimate", "queue": 1000}
+# 队列满时：drop_oldest 丢弃最旧的数据点；decimate 把队列中的数据点隔一个丢一个（均匀抽稀，事件不丢弃）。
+# 每个订阅者有独立的队列和发送协程，慢速订阅者只会丢失自己的数据，不影响采集与其他订阅者。
+
+class _Item:
+    """待分发的一条消息（各订阅者共享，按通道过滤后的编码结果缓存）"""
+    __slots__ = ("kind", "device_ip", "message", "encoded")
+
+    def __init__(self, kind, device_ip, message):
+        self.kind = kind
+        self.device_ip = device_ip
+        self.message = message
+        self.encoded = {}
+
+    def encode(self, channels=None):
+        key = tuple(channels) if channels is not None else None
+        data = self.encoded.get(key)
+        if data is None:
+            message = self.message
+            if key is not None and self.kind == "sample":
+                message = {k: v for k, v in message.items() if k not in CHANNEL_NAMES or k in channels}
+            data = json.dumps(message, ensure_ascii=False, default=str).encode("utf-8")
+            self.encoded[key] = data
+        return data
+
+
+class Subscriber:
+    """一个订阅连接：过滤条件、有界队列与丢弃统计（只在分发线程的事件循环中访问）"""
+
+    def __init__(self, peer, writer):
+        self.peer = peer
+        self.writer = writer
+        self.websocket = False
+        self.devices = None
+        self.channels = None
+        self.samples = True
+        self.events = True
+        self.every = 1
+        self.policy = "drop_oldest"
+        self.queue_size = FANOUT_QUEUE_SIZE
+        self.queue = deque()
+        self.replies = []  # 订阅请求的应答（不受队列上限影响）
+        self.ready = asyncio.Event()
+        self.sample_index = 0
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.sent = 0
+
+    def subscribe(self, request):
+        """应用订阅请求（字典），参数无效时抛出 ValueError"""
+        if not isinstance(request, dict):
+            raise ValueError("订阅请求必须是JSON对象")
+        if "devices" in request:
+            devices = request["devices"]
+            self.devices = None if devices is None else set(str(d) for d in devices)
+        if "channels" in request:
+            channels = request["channels"]
+            if channels is not None:
+                unknown = [c for c in channels if c not in CHANNEL_NAMES]
+                if unknown:
+                    raise ValueError(f"未知通道: {unknown}")
+                channels = [c for c in CHANNEL_NAMES if c in channels]
+            self.channels = channels
+        if "policy" in request:
+            if request["policy"] not in FANOUT_POLICIES:
+                raise ValueError(f"未知策略: {request['policy']}（可选 {FANOUT_POLICIES}）")
+            self.policy = request["policy"]
+        if "every" in request:
+            self.every = max(1, int(request["every"]))
+        if "queue" in request:
+            self.queue_size = min(FANOUT_MAX_QUEUE, max(1, int(request["queue"])))
+        self.samples = bool(request.get("samples", self.samples))
+        self.events = bool(request.get("events", self.events))
+        self.trim()
+
+    def status(self):
+        return {"type": "subscribed", "devices": sorted(self.devices) if self.devices is not None else None,
+                "channels": self.channels, "samples": self.samples, "events": self.events, "every": self.every,
+                "policy": self.policy, "queue": self.queue_size}
+
+    def accepts(self, item):
+        if self.devices is not None and item.device_ip and item.device_ip not in self.devices:
+            return False
+        if item.kind == "sample":
+            if not self.samples:
+                return False
+            self.sample_index += 1
+            return (self.sample_index - 1) % self.every == 0
+        return self.events
+
+    def offer(self, item):
+        if not self.accepts(item):
+            return
+        self.queue.append(item)
+        self.trim()
+        self.ready.set()
+
+    def trim(self):
+        """队列超过上限时按策略丢弃"""
+        if len(self.queue) <= self.queue_size:
+            return
+        if self.policy == "decimate":
+            kept, samples = deque(), 0
+            for item in self.queue:
+                if item.kind == "sample":
+                    samples += 1
+                    if samples % 2 == 0:
+                        self.dropped += 1
+                        continue
+                kept.append(item)
+            self.queue = kept
+        while len(self.queue) > self.queue_size:
+            self.queue.popleft()
+            self.dropped += 1
+
+    def take(self):
+        """取出队列中全部消息（编码后），有新的丢弃时在前面加一条 dropped 报告"""
+        chunks = [json.dumps(reply, ensure_ascii=False).encode("utf-8") for reply in self.replies]
+        self.replies = []
+        if self.dropped > self.reported_dropped:
+            report = {"type": "dropped", "count": self.dropped - self.reported_dropped, "total": self.dropped}
+            chunks.append(json.dumps(report).encode("utf-8"))
+            self.reported_dropped = self.dropped
+        while self.queue:
+            chunks.append(self.queue.popleft().encode(self.channels))
+        self.ready.clear()
+        self.sent += len(chunks)
+        return chunks
+
+# ========================== WebSocket（RFC 6455，仅文本帧） ==========================
+def websocket_accept(key):
+    return base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+
+def websocket_frame(payload, opcode=0x1):
+    """服务器端帧（不加掩码）"""
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x80 | opcode, length])
+    elif length < 65536:
+        header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, "big")
+    return header + payload
+
+async def read_websocket_frame(reader):
+    """读取一个客户端帧，返回 (opcode, 去掩码后的数据)"""
+    first, second = await reader.readexactly(2)
+    opcode = first & 0x0F
+    length = second & 0x7F
+    if length == 126:
+        length = int.from_bytes(await reader.readexactly(2), "big")
+    elif length == 127:
+        length = int.from_bytes(await reader.readexactly(8), "big")
+    if length > FANOUT_LINE_LIMIT:
+        raise ValueError(f"WebSocket帧过长: {length}")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+    return opcode, payload
+
+# ========================== 数据分发服务 ==========================
+class FanoutServer:
+    """本机数据分发服务：把光谱数据与设备事件分发给任意数量的订阅者（JSON-lines 或 WebSocket）。
+
+    在独立的事件循环线程中运行。publish_sample()（PipelineWorker 数据监听器）与 publish_event()
+    （NetworkCore 事件监听器）可在任意线程调用，只做一次入队，不等待任何订阅者。
+    """
+
+    def __init__(self, host=FANOUT_HOST, port=FANOUT_PORT):
+        self.host = host
+        self.port = port
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.subscribers = set()
+        self.pending = deque(maxlen=FANOUT_PENDING_MAX)
+        self.wakeup_scheduled = False
+        self.published_count = 0
+
+    # ---------------------- 生命周期 ----------------------
+    def start(self):
+        """启动事件循环线程并开始监听，失败时抛出 OSError"""
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self.thread = threading.Thread(target=self.run_loop, args=(started,), name="FanoutServer", daemon=True)
+        self.thread.start()
+        started.wait()
+        future = asyncio.run_coroutine_threadsafe(
+            asyncio.start_server(self.handle_client, self.host, self.port, reuse_address=True,
+                                 limit=FANOUT_LINE_LIMIT), self.loop)
+        try:
+            self.server = future.result(FANOUT_STOP_TIMEOUT)
+        except Exception:
+            self.stop()
+            raise
+        self.port = self.server.sockets[0].getsockname()[1]
+        print(f"[Fanout] 数据分发服务已启动: {self.host}:{self.port}")
+
+    def run_loop(self, started):
+        asyncio.set_event_loop(self.loop)
+        self.loop.call_soon(started.set)
+        self.loop.run_forever()
+
+    def stop(self):
+        if not self.loop or not self.thread.is_alive():
+            return
+        asyncio.run_coroutine_threadsafe(self.shutdown(), self.loop).result(FANOUT_STOP_TIMEOUT)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(FANOUT_STOP_TIMEOUT)
+        self.loop.close()
+        print("[Fanout] 数据分发服务已停止")
+
+    async def shutdown(self):
+        if self.server:
+            self.server.close()
+            self.server = None
+        for subscriber in list(self.subscribers):
+            subscriber.writer.close()
+
+    # ---------------------- 发布（任意线程） ----------------------
+    def publish_sample(self, spectral_data, device_ip=""):
+        """PipelineWorker 数据监听器"""
+        if not self.subscribers:
+            return
+        message = {"type": "sample", "device_ip": device_ip, "recv_time": time.time()}
+        message.update(spectral_data)
+        self._publish(_Item("sample", device_ip, message))
+
+    def publish_event(self, event, device_ip, args):
+        """NetworkCore 事件监听器"""
+        if not self.subscribers:
+            return
+        self._publish(_Item("event", device_ip, {"type": "event", "event": event, "device_ip": device_ip,
+                                                  "args": list(args)}))
+
+    def _publish(self, item):
+        self.pending.append(item)
+        self.published_count += 1
+        if not self.wakeup_scheduled:
+            self.wakeup_scheduled = True
+            try:
+                self.loop.call_soon_threadsafe(self._distribute)
+            except RuntimeError:  # 事件循环已关闭
+                pass
+
+    def _distribute(self):
+        """把待分发数据放入各订阅者队列（事件循环线程）"""
+        self.wakeup_scheduled = False
+        pending = self.pending
+        while pending:
+            item = pending.popleft()
+            for subscriber in self.subscribers:
+                subscriber.offer(item)
+
+    # ---------------------- 订阅连接 ----------------------
+    async def handle_client(self, reader, writer):
+        peer = writer.get_extra_info("peername")
+        subscriber = Subscriber(peer, writer)
+        try:
+            try:
+                first = await asyncio.wait_for(reader.readline(), FANOUT_HELLO_TIMEOUT)
+            except asyncio.TimeoutError:
+                first = b""
+            if first.startswith(b"GET "):
+                if not await self.websocket_handshake(reader, writer):
+                    return
+                subscriber.websocket = True
+            elif first.strip():
+                self.handle_request(subscriber, first)
+            print(f"[Fanout] 订阅者连接: {peer}（{'WebSocket' if subscriber.websocket else 'JSON-lines'}）")
+            self.subscribers.add(subscriber)
+            sender = asyncio.ensure_future(self.send_loop(subscriber))
+            try:
+                if subscriber.websocket:
+                    await self.websocket_receive_loop(subscriber, reader)
+                else:
+                    while True:
+                        line = await reader.readline()
+                        if not line:
+                            break
+                        if line.strip():
+                            self.handle_request(subscriber, line)
+            finally:
+                sender.cancel()
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            print(f"[Fanout] 订阅者连接错误 {peer}: {e}")
+        finally:
+            self.subscribers.discard(subscriber)
+            writer.close()
+            print(f"[Fanout] 订阅者断开: {peer}（已发送 {subscriber.sent} 条，丢弃 {subscriber.dropped} 条）")
+
+    def handle_request(self, subscriber, data):
+        try:
+            subscriber.subscribe(json.loads(data))
+            reply = subscriber.status()
+        except (ValueError, TypeError) as e:
+            reply = {"type": "error", "message": str(e)}
+        subscriber.replies.append(reply)
+        subscriber.ready.set()
+
+    async def send_loop(self, subscriber):
+        """订阅者的发送协程：等待队列有数据，整批写出后等待对方接收（只阻塞本协程）"""
+        writer = subscriber.writer
+        try:
+            while True:
+                await subscriber.ready.wait()
+                chunks = subscriber.take()
+                if subscriber.websocket:
+                    writer.write(b"".join(websocket_frame(chunk) for chunk in chunks))
+                else:
+                    writer.write(b"\n".join(chunks) + b"\n")
+                await writer.drain()
+        except (OSError, ConnectionError) as e:
+            print(f"[Fanout] 发送失败 {subscriber.peer}: {e}")
+            writer.close()
+
+    async def websocket_handshake(self, reader, writer):
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line or line in (b"\r\n", b"\n"):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get("sec-websocket-key")
+        if not key:
+            writer.write(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            await writer.drain()
+            return False
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {websocket_accept(key)}\r\n\r\n").encode())
+        await writer.drain()
+        return True
+
+    async def websocket_receive_loop(self, subscriber, reader):
+        while True:
+            try:
+                opcode, payload = await read_websocket_frame(reader)
+            except asyncio.IncompleteReadError:  # 对方直接断开
+                break
+            if opcode == 0x8:  # close
+                subscriber.writer.write(websocket_frame(payload[:2], 0x8))
+                break
+            if opcode == 0x9:  # ping
+                subscriber.writer.write(websocket_frame(payload, 0xA))
+            elif opcode == 0x1 and payload.strip():
+                self.handle_request(subscriber, payload)
@@ -0,0 +1,176 @@
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+HISTORY_RAW_SECONDS = 600     # 原始数据保留时长（秒）
+HISTORY_RAW_MAX = 20000       # 原始数据最多保留点数（最小间隔400ms时约2小时）
+# 汇总层级：(名称, 每个桶的秒数, 保留时长秒数)，依次由上一层级关闭的桶合并而来
+HISTORY_TIERS = [
+    ("second", 1, 6 * 3600),
+    ("minute", 60, 7 * 86400),
+    ("hour", 3600, 365 * 86400),
+]
+HISTORY_MAX_POINTS = 4000     # 单条曲线最多绘制的点数（决定选用哪一层级）
+
+# ========================== 汇总层级 ==========================
+class RollupTier:
+    """固定桶宽的汇总环形缓冲：每个桶保存各通道 min/sum/max 与点数（均值 = sum / count）。
+
+    桶按 floor(时间 / 桶宽) 对齐；add() 合并一个点或一个下层桶，跨入新桶时返回刚关闭的桶
+    (start, count, min, sum, max)，供上一层级合并。容量 = 保留时长 / 桶宽，满后覆盖最旧的桶。
+    """
+
+    def __init__(self, name, width, retention, n_channels=len(CHANNEL_NAMES)):
+        self.name = name
+        self.width = width
+        self.capacity = max(1, int(retention // width))
+        self.start = np.zeros(self.capacity)
+        self.count = np.zeros(self.capacity, dtype=np.int64)
+        self.min = np.zeros((self.capacity, n_channels))
+        self.sum = np.zeros((self.capacity, n_channels))
+        self.max = np.zeros((self.capacity, n_channels))
+        self.size = 0
+        self.head = 0  # 下一个写入位置
+        self.open = None  # 未关闭的桶 [start, count, min, sum, max]
+
+    def add(self, t, count, minimum, total, maximum):
+        bucket_start = (t // self.width) * self.width
+        closed = None
+        if self.open is not None and bucket_start != self.open[0]:
+            closed = self.close()
+        if self.open is None:
+            self.open = [bucket_start, count, np.array(minimum, dtype=float), np.array(total, dtype=float),
+                         np.array(maximum, dtype=float)]
+        else:
+            self.open[1] += count
+            np.minimum(self.open[2], minimum, out=self.open[2])
+            self.open[3] += total
+            np.maximum(self.open[4], maximum, out=self.open[4])
+        return closed
+
+    def close(self):
+        """关闭当前桶写入环形缓冲，返回该桶"""
+        bucket, self.open = self.open, None
+        i = self.head
+        self.start[i], self.count[i], self.min[i], self.sum[i], self.max[i] = bucket
+        self.head = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return bucket
+
+    def _ordered(self):
+        """环形缓冲中各桶的下标（按时间顺序）"""
+        first = (self.head - self.size) % self.capacity
+        return (first + np.arange(self.size)) % self.capacity
+
+    def oldest(self):
+        if self.size:
+            return self.start[(self.head - self.size) % self.capacity]
+        return self.open[0] if self.open is not None else None
+
+    def view(self, since=None, pending=()):
+        """返回 (桶中心时间, min, mean, max, count)，包含未关闭的桶；since 指定起始时间，
+        pending 为下层级尚未关闭（因此还未合并到本层级）的桶，按时间先后给出"""
+        idx = self._ordered()
+        start, count = self.start[idx], self.count[idx]
+        minimum, total, maximum = self.min[idx], self.sum[idx], self.max[idx]
+        tail = []  # 未关闭的桶（副本，不修改本层级状态）
+        for bucket in ([self.open] if self.open is not None else []) + list(pending):
+            bucket_start = (bucket[0] // self.width) * self.width
+            if tail and tail[-1][0] == bucket_start:
+                last = tail[-1]
+                last[1] += bucket[1]
+                last[2], last[3], last[4] = (np.minimum(last[2], bucket[2]), last[3] + bucket[3],
+                                             np.maximum(last[4], bucket[4]))
+            else:
+                tail.append([bucket_start, bucket[1], bucket[2], bucket[3], bucket[4]])
+        if tail:
+            start = np.append(start, [b[0] for b in tail])
+            count = np.append(count, [b[1] for b in tail])
+            minimum = np.vstack([minimum] + [b[2] for b in tail])
+            total = np.vstack([total] + [b[3] for b in tail])
+            maximum = np.vstack([maximum] + [b[4] for b in tail])
+        if since is not None:
+            keep = start + self.width > since
+            start, count, minimum, total, maximum = start[keep], count[keep], minimum[keep], total[keep], maximum[keep]
+        return start + self.width / 2, minimum, total / count[:, None], maximum, count
+
+# ========================== 多分辨率历史 ==========================
+class History:
+    """长时间监测的多分辨率历史：最近 HISTORY_RAW_SECONDS 内保留原始数据，所有数据同时增量汇总为
+    每秒/每分钟/每小时的 min/mean/max/count。各层级容量固定，内存占用有上限（默认层级约8MB）。
+
+    可作为 PipelineWorker.sample_listeners 的监听器（在处理线程中写入），GUI读取时内部加锁。
+    """
+
+    def __init__(self, raw_seconds=HISTORY_RAW_SECONDS, raw_max=HISTORY_RAW_MAX, tiers=HISTORY_TIERS,
+                 channels=CHANNEL_NAMES):
+        self.raw_seconds = raw_seconds
+        self.channels = list(channels)
+        self.raw = deque(maxlen=raw_max)  # (时间, 各通道值)
+        self.tiers = [RollupTier(name, width, retention, len(self.channels)) for name, width, retention in tiers]
+        self.lock = threading.Lock()
+        self.total_count = 0
+
+    def add(self, t, values):
+        """加入一个数据点：t 为时间（秒，time.time()），values 为各通道值"""
+        values = np.asarray(values, dtype=float)
+        with self.lock:
+            self.raw.append((t, values))
+            while self.raw and self.raw[0][0] < t - self.raw_seconds:
+                self.raw.popleft()
+            self.total_count += 1
+            bucket = (t, 1, values, values, values)
+            for tier in self.tiers:
+                bucket = tier.add(*bucket)
+                if bucket is None:
+                    break
+
+    def add_sample(self, spectral_data, device_ip=""):
+        """PipelineWorker 数据监听器：以接收时间记录一个光谱数据点"""
+        self.add(time.time(), [spectral_data[name] for name in self.channels])
+
+    def clear(self):
+        with self.lock:
+            self.raw.clear()
+            self.tiers = [RollupTier(t.name, t.width, t.capacity * t.width, len(self.channels)) for t in self.tiers]
+            self.total_count = 0
+
+    def select_level(self, span, max_points=HISTORY_MAX_POINTS, now=None):
+        """为时间跨度 span（秒）选择层级："raw"（原始数据保留窗口覆盖 span 且点数不超过 max_points），
+        否则为桶数不超过 max_points 且保留时长覆盖 span 的最细层级"""
+        now = time.time() if now is None else now
+        with self.lock:
+            if span <= self.raw_seconds:
+                raw_points = len(self.raw)
+                if raw_points > max_points:
+                    raw_points = sum(1 for t, _ in self.raw if t >= now - span)
+                if raw_points <= max_points:
+                    return "raw"
+        for tier in self.tiers:
+            if span / tier.width <= max_points and tier.capacity * tier.width >= span:
+                return tier.name
+        return self.tiers[-1].name
+
+    def series(self, span, max_points=HISTORY_MAX_POINTS, now=None):
+        """最近 span 秒的数据，自动选择层级。返回字典：
+          level: "raw" 或层级名；time: (点数,) 时间（秒）；mean/min/max: (点数, 通道数)；count: 每点包含的原始点数
+        """
+        now = time.time() if now is None else now
+        level = self.select_level(span, max_points, now)
+        since = now - span
+        with self.lock:
+            if level == "raw":
+                points = [(t, v) for t, v in self.raw if t >= since]
+                times = np.array([t for t, _ in points], dtype=float)
+                values = np.array([v for _, v in points], dtype=float).reshape(-1, len(self.channels))
+                return {"level": level, "time": times, "mean": values, "min": values, "max": values,
+                        "count": np.ones(len(times), dtype=np.int64)}
+            i = next(i for i, t in enumerate(self.tiers) if t.name == level)
+            pending = [t.open for t in reversed(self.tiers[:i]) if t.open is not None]
+            times, minimum, mean, maximum, count = self.tiers[i].view(since, pending)
+        return {"level": level, "time": times, "mean": mean, "min": minimum, "max": maximum, "count": count}
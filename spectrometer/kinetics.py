@@ -0,0 +1,216 @@
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ========================== 宏定义 ==========================
+MODEL_NAMES = ["logistic", "gompertz", "baranyi"]
+MAX_ITERATIONS = 200       # Levenberg-Marquardt 最大迭代次数
+CONVERGENCE_TOL = 1e-9     # 相对残差平方和下降小于该值视为收敛
+FIT_BATCH_SIZE = 4096      # 每批同时拟合的序列数（进程池按批分发）
+MIN_FIT_POINTS = 5         # 有效点数少于该值的序列不拟合
+FD_STEP = 1e-6             # 数值雅可比的相对差分步长
+PARAM_NAMES = ["y0", "amplitude", "max_rate", "lag_time"]
+
+# ========================== 生长模型 ==========================
+# 统一使用 Zwietering 参数化：y0 起始值、amplitude 增幅（平台 = y0 + amplitude，可为负表示下降曲线）、
+# max_rate 最大斜率（单位/小时，与 amplitude 同号）、lag_time 迟滞期（小时）
+# 参数均为 (序列数, 1) 数组，t 为 (1, 点数) 或 (序列数, 点数)
+
+def _safe_amplitude(amplitude):
+    """避免 amplitude 为 0 时除零（保留符号）"""
+    return np.where(np.abs(amplitude) < 1e-12, np.where(amplitude < 0, -1e-12, 1e-12), amplitude)
+
+def logistic(t, y0, amplitude, max_rate, lag_time):
+    amplitude = _safe_amplitude(amplitude)
+    return y0 + amplitude / (1 + np.exp(4 * max_rate / amplitude * (lag_time - t) + 2))
+
+def gompertz(t, y0, amplitude, max_rate, lag_time):
+    amplitude = _safe_amplitude(amplitude)
+    return y0 + amplitude * np.exp(-np.exp(max_rate * np.e / amplitude * (lag_time - t) + 1))
+
+def baranyi(t, y0, amplitude, max_rate, lag_time):
+    """Baranyi-Roberts 模型（对 |amplitude|、|max_rate| 计算，再按 amplitude 的符号取方向）"""
+    mu = np.maximum(np.abs(max_rate), 1e-12)
+    span = np.abs(amplitude)
+    h0 = mu * lag_time
+    tau = np.maximum(t, 0) * np.ones_like(mu)
+    # A(t) = t + ln(exp(-mu t) + exp(-h0) - exp(-mu t - h0)) / mu，用 logaddexp 保持数值稳定（t=0 时 log1p(-1) = -inf）
+    with np.errstate(divide="ignore"):
+        adjusted = tau + np.logaddexp(-mu * tau, -h0 + np.log1p(-np.exp(-mu * tau))) / mu
+    growth = mu * adjusted - np.logaddexp(np.log1p(-np.exp(-span)), mu * adjusted - span)
+    return y0 + np.sign(amplitude) * growth
+
+MODELS = {"logistic": logistic, "gompertz": gompertz, "baranyi": baranyi}
+
+# ========================== 批量拟合 ==========================
+def initial_guess(t, Y):
+    """由数据估计初值：起始/末尾中位数确定 y0 与增幅，平滑后最大斜率点确定 max_rate 与 lag_time"""
+    n_series = Y.shape[0]
+    t = np.broadcast_to(t, Y.shape)
+    valid = np.isfinite(Y)
+    filled = np.where(valid, Y, np.nan)
+
+    # 前/后各 3 个有效点的中位数
+    order = np.argsort(~valid, axis=1, kind="stable")  # 有效点在前
+    count = valid.sum(axis=1)
+    rows = np.arange(n_series)[:, None]
+    head = filled[rows, order[:, :3]]
+    tail_idx = np.clip(count[:, None] - 1 - np.arange(3)[None, :], 0, None)
+    tail = filled[rows, order[rows, tail_idx]]
+    y0 = np.nanmedian(head, axis=1)
+    amplitude = np.nanmedian(tail, axis=1) - y0
+
+    # 5点滑动平均后按增幅方向找最大斜率
+    padded = np.pad(filled, ((0, 0), (2, 2)), constant_values=np.nan)
+    smooth = np.nanmean(sliding_window_view(padded, 5, axis=1), axis=-1)
+    dt = np.diff(t, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope = np.diff(smooth, axis=1) / dt
+    directed = np.where(np.isfinite(slope), slope * np.sign(amplitude)[:, None], -np.inf)
+    k = np.argmax(directed, axis=1)
+    max_rate = slope[np.arange(n_series), k]
+    max_rate = np.where(np.isfinite(max_rate) & (max_rate * amplitude > 0), max_rate,
+                        amplitude / np.maximum(np.nanmax(t, axis=1) - np.nanmin(t, axis=1), 1e-9))
+    t_k = t[np.arange(n_series), k]
+    y_k = smooth[np.arange(n_series), k]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lag_time = t_k - (y_k - y0) / max_rate
+    lag_time = np.where(np.isfinite(lag_time), np.maximum(lag_time, 0), 0)
+    p0 = np.stack([y0, amplitude, max_rate, lag_time], axis=1)
+    return np.where(np.isfinite(p0), p0, 0.0)
+
+def _residuals(model, t, Y, valid, params):
+    y = model(t, *(params[:, i:i + 1] for i in range(params.shape[1])))
+    return np.where(valid, y - np.where(valid, Y, 0), 0)
+
+def levenberg_marquardt(model, t, Y, p0, max_iter=MAX_ITERATIONS, tol=CONVERGENCE_TOL):
+    """对所有序列同时做 Levenberg-Marquardt（每条序列各自的阻尼与接受判断，
+    雅可比用前向差分、4x4 法方程批量求解）；已收敛的序列不再参与计算。
+    返回 (参数 (序列数, 4), 残差平方和, 是否收敛)"""
+    n_series, n_params = p0.shape
+    valid = np.isfinite(Y)
+    params = p0.astype(float).copy()
+    t = np.broadcast_to(t, Y.shape)
+    cost = np.sum(_residuals(model, t, Y, valid, params) ** 2, axis=1)
+    damping = np.full(n_series, 1e-3)
+    converged = np.zeros(n_series, dtype=bool)
+    active = np.flatnonzero(np.isfinite(cost))
+    eye = np.eye(n_params)
+
+    for _ in range(max_iter):
+        if len(active) == 0:
+            break
+        p, ta, Ya, va = params[active], t[active], Y[active], valid[active]
+        r = _residuals(model, ta, Ya, va, p)
+        step = FD_STEP * np.maximum(np.abs(p), 1e-3)
+        J = np.empty(r.shape + (n_params,))
+        for i in range(n_params):
+            shifted = p.copy()
+            shifted[:, i] += step[:, i]
+            J[..., i] = (_residuals(model, ta, Ya, va, shifted) - r) / step[:, i:i + 1]
+        J = np.nan_to_num(J, nan=0.0, posinf=0.0, neginf=0.0)
+        JTJ = np.einsum("snk,snl->skl", J, J)
+        gradient = np.einsum("snk,sn->sk", J, r)
+        scale = np.einsum("skk->sk", JTJ)[:, :, None] * eye
+        system = JTJ + damping[active, None, None] * (scale + 1e-12 * eye)
+        try:
+            delta = np.linalg.solve(system, -gradient[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            delta = np.stack([np.linalg.lstsq(a, -g, rcond=None)[0] for a, g in zip(system, gradient)])
+
+        trial = p + delta
+        trial_cost = np.sum(_residuals(model, ta, Ya, va, trial) ** 2, axis=1)
+        better = np.isfinite(trial_cost) & (trial_cost < cost[active])
+        improvement = np.where(better, cost[active] - trial_cost, 0)
+
+        idx = active[better]
+        params[idx] = trial[better]
+        cost[idx] = trial_cost[better]
+        damping[idx] = np.maximum(damping[idx] / 3, 1e-12)
+        damping[active[~better]] *= 4
+
+        done = (better & (improvement <= tol * np.maximum(cost[active], 1e-300))) | (damping[active] > 1e12)
+        converged[active[done & better]] = True
+        converged[active[done & ~better]] = True  # 阻尼过大：已在局部极小附近
+        active = active[~done]
+    return params, cost, converged
+
+def _fit_batch(args):
+    model_name, t, Y, max_iter = args
+    model = MODELS[model_name]
+    with warnings.catch_warnings(), np.errstate(all="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)
+        p0 = initial_guess(t, Y)
+        params, cost, converged = levenberg_marquardt(model, t, Y, p0, max_iter)
+    return params, cost, converged
+
+def fit_growth_curves(t, Y, model="gompertz", max_iter=MAX_ITERATIONS, workers=1, batch_size=FIT_BATCH_SIZE):
+    """批量拟合生长曲线
+
+      t: 时间（小时），shape = (点数,) 或 (序列数, 点数)
+      Y: 各序列数据，shape = (序列数, 点数)，缺失或补齐部分为 NaN
+      workers > 1 时按 batch_size 分批交给进程池（每批内部仍为向量化拟合）
+    返回字典（各项为 (序列数,) 数组）：
+      y0, plateau, max_rate, lag_time, r2, rmse, n_points, converged
+    """
+    Y = np.atleast_2d(np.asarray(Y, dtype=float))
+    t = np.asarray(t, dtype=float)
+    t = np.broadcast_to(t if t.ndim == 2 else t[None, :], Y.shape)
+    n_series = Y.shape[0]
+    n_points = np.sum(np.isfinite(Y) & np.isfinite(t), axis=1)
+    fit_rows = np.flatnonzero(n_points >= MIN_FIT_POINTS)
+    Y_fit = np.where(np.isfinite(t), Y, np.nan)[fit_rows]
+    t_fit = np.where(np.isfinite(t), t, 0)[fit_rows]
+
+    batches = [(model, t_fit[i:i + batch_size], Y_fit[i:i + batch_size], max_iter)
+               for i in range(0, len(fit_rows), batch_size)]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches))) as pool:
+            results = list(pool.map(_fit_batch, batches))
+    else:
+        results = [_fit_batch(batch) for batch in batches]
+
+    params = np.full((n_series, len(PARAM_NAMES)), np.nan)
+    cost = np.full(n_series, np.nan)
+    converged = np.zeros(n_series, dtype=bool)
+    if results:
+        params[fit_rows] = np.concatenate([r[0] for r in results])
+        cost[fit_rows] = np.concatenate([r[1] for r in results])
+        converged[fit_rows] = np.concatenate([r[2] for r in results])
+    if model == "baranyi":
+        params[:, 2] = np.copysign(np.abs(params[:, 2]), params[:, 1])  # 模型只使用 |max_rate|，统一为与增幅同号
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nanmean(np.where(n_points[:, None] > 0, Y, 0), axis=1)
+        total = np.nansum((Y - mean[:, None]) ** 2, axis=1)
+        r2 = 1 - cost / total
+        rmse = np.sqrt(cost / n_points)
+    return {
+        "y0": params[:, 0],
+        "plateau": params[:, 0] + params[:, 1],
+        "max_rate": params[:, 2],
+        "lag_time": params[:, 3],
+        "r2": r2,
+        "rmse": rmse,
+        "n_points": n_points,
+        "converged": converged,
+    }
+
+def fit_all_models(t, Y, models=MODEL_NAMES, **kwargs):
+    """用多个模型拟合同一批序列，返回 {模型名: fit_growth_curves 结果}"""
+    return {model: fit_growth_curves(t, Y, model, **kwargs) for model in models}
+
+def kinetics_rows(labels, results):
+    """整洁表格行：labels 为每条序列的标签字典（如 {"condition": ..., "channel": ...}），
+    每条序列、每个模型一行"""
+    rows = []
+    for model, result in results.items():
+        for s, label in enumerate(labels):
+            row = dict(label, model=model)
+            for key, values in result.items():
+                value = values[s]
+                row[key] = bool(value) if key == "converged" else (int(value) if key == "n_points" else float(value))
+            rows.append(row)
+    return rows
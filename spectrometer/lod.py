@@ -0,0 +1,175 @@
+import threading
+
+import numpy as np
+
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+LOD_FACTOR = 4               # 金字塔每层的合并倍数
+LOD_CAPACITY = 2_000_000     # 最多保留的数据点数（超出时丢弃最旧的一半）
+LOD_INITIAL_SIZE = 4096      # 数组初始容量（按需倍增）
+LOD_X_FIELDS = ["packetCount", "timestamp"]
+
+# ========================== min/max 金字塔 ==========================
+class MinMaxPyramid:
+    """绘图用的多层 min/max 金字塔（按数据到达顺序）：第 k 层每个块覆盖 LOD_FACTOR**k 个原始点，
+    保存各通道的最小值与最大值。追加数据时只更新受影响的末尾块（增量维护）。
+
+    query() 按可见范围和屏幕像素数选择层级，每个像素最多返回一对 (min, max) 点，
+    因此绘图开销与绘图宽度成正比，与历史数据量无关。横轴可以是 LOD_X_FIELDS 中任一字段。
+    """
+
+    def __init__(self, channels=CHANNEL_NAMES, x_fields=LOD_X_FIELDS, factor=LOD_FACTOR, capacity=LOD_CAPACITY):
+        self.channels = list(channels)
+        self.x_fields = list(x_fields)
+        self.factor = factor
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.size = 0
+            self.x = {field: np.empty(LOD_INITIAL_SIZE) for field in self.x_fields}
+            self.x_envelope = {field: np.empty(LOD_INITIAL_SIZE) for field in self.x_fields}  # 横轴累计最大值
+            self.y = np.empty((LOD_INITIAL_SIZE, len(self.channels)))
+            self.levels = []  # [(min数组, max数组)]，第 i 项为第 i+1 层
+
+    # ---------------------- 写入 ----------------------
+    def add_sample(self, spectral_data, device_ip=""):
+        """PipelineWorker 数据监听器：追加一个光谱数据点"""
+        self.extend({field: [spectral_data[field]] for field in self.x_fields},
+                    [[spectral_data[name] for name in self.channels]])
+
+    def extend(self, x, y):
+        """追加一批数据：x 为 {横轴字段: 数组}，y 为 (点数, 通道数)"""
+        y = np.asarray(y, dtype=float).reshape(-1, len(self.channels))
+        x = {field: np.asarray(x[field], dtype=float) for field in self.x_fields}
+        if len(y) > self.capacity:
+            y = y[-self.capacity:]
+            x = {field: values[-self.capacity:] for field, values in x.items()}
+        n = len(y)
+        if n == 0:
+            return
+        with self.lock:
+            if self.size + n > self.capacity:
+                self._drop_oldest(self.size + n - self.capacity // 2)
+            self._reserve(self.size + n)
+            start = self.size
+            for field in self.x_fields:
+                values = x[field]
+                self.x[field][start:start + n] = values
+                previous = self.x_envelope[field][start - 1] if start else -np.inf
+                self.x_envelope[field][start:start + n] = np.maximum.accumulate(np.maximum(values, previous))
+            self.y[start:start + n] = y
+            self.size += n
+            self._update_levels(start)
+
+    def _reserve(self, size):
+        if size <= len(self.y):
+            return
+        capacity = max(size, 2 * len(self.y))
+        for arrays in (self.x, self.x_envelope):
+            for field in self.x_fields:
+                grown = np.empty(capacity)
+                grown[:self.size] = arrays[field][:self.size]
+                arrays[field] = grown
+        grown = np.empty((capacity, len(self.channels)))
+        grown[:self.size] = self.y[:self.size]
+        self.y = grown
+
+    def _drop_oldest(self, count):
+        """丢弃最旧的 count 个点并重建金字塔"""
+        count = min(count, self.size)
+        keep = self.size - count
+        for arrays in (self.x, self.x_envelope):
+            for field in self.x_fields:
+                arrays[field][:keep] = arrays[field][count:self.size]
+        self.y[:keep] = self.y[count:self.size]
+        self.size = keep
+        self.levels = []
+        self._update_levels(0)
+
+    def _update_levels(self, first):
+        """原始数据从第 first 个点起有变化：逐层重算受影响的块（含末尾未满的块）"""
+        lower_min = lower_max = self.y[:self.size]
+        lower_size = self.size
+        first_changed = first
+        level = 0
+        while lower_size > 1:
+            block_first = first_changed // self.factor
+            block_count = -(-lower_size // self.factor)
+            if level == len(self.levels):
+                self.levels.append((np.empty((0, len(self.channels))), np.empty((0, len(self.channels)))))
+            level_min, level_max = self.levels[level]
+            if len(level_min) < block_count:
+                capacity = max(block_count, 2 * len(level_min))
+                grown_min = np.empty((capacity, len(self.channels)))
+                grown_max = np.empty((capacity, len(self.channels)))
+                grown_min[:block_first] = level_min[:block_first]
+                grown_max[:block_first] = level_max[:block_first]
+                level_min, level_max = grown_min, grown_max
+                self.levels[level] = (level_min, level_max)
+
+            # 重算 [block_first, block_count) 块：完整块 reshape 后归约，末尾不满的块单独计算
+            lo = block_first * self.factor
+            full_end = min(block_count, lower_size // self.factor)
+            if full_end > block_first:
+                hi = full_end * self.factor
+                shape = (full_end - block_first, self.factor, len(self.channels))
+                level_min[block_first:full_end] = lower_min[lo:hi].reshape(shape).min(axis=1)
+                level_max[block_first:full_end] = lower_max[lo:hi].reshape(shape).max(axis=1)
+            if block_count > full_end:
+                tail = full_end * self.factor
+                level_min[full_end] = lower_min[tail:lower_size].min(axis=0)
+                level_max[full_end] = lower_max[tail:lower_size].max(axis=0)
+
+            lower_min, lower_max = level_min[:block_count], level_max[:block_count]
+            lower_size = block_count
+            first_changed = block_first
+            level += 1
+        del self.levels[level:]
+
+    # ---------------------- 查询 ----------------------
+    def index_range(self, x0, x1, x_field="packetCount"):
+        """横轴范围 [x0, x1] 对应的数据下标范围 [i0, i1)（按横轴累计最大值查找，
+        横轴因数据流重置而回退时，回退后的点归入回退前的位置）"""
+        with self.lock:
+            envelope = self.x_envelope[x_field][:self.size]
+            i0 = int(np.searchsorted(envelope, x0, side="left"))
+            i1 = int(np.searchsorted(envelope, x1, side="right"))
+        # 两端各多取一个点，使曲线延伸到可见区域边缘
+        return max(0, i0 - 1), min(self.size, i1 + 1)
+
+    def query(self, i0, i1, pixels, x_field="packetCount"):
+        """返回下标 [i0, i1) 的绘图数据 (x, y)，y 为 (点数, 通道数)：原始点数不超过 2 * pixels 时返回原始数据，
+        否则选用每块不少于 (点数 / pixels) 个原始点的层级，每块输出 (min, max) 两个点"""
+        pixels = max(1, int(pixels))
+        with self.lock:
+            i0, i1 = max(0, i0), min(self.size, i1)
+            n = i1 - i0
+            x = self.x[x_field]
+            if n <= 2 * pixels or not self.levels:
+                return x[i0:i1].copy(), self.y[i0:i1].copy()
+            level, block = 0, 1
+            while level < len(self.levels) and n / block > pixels:
+                level += 1
+                block *= self.factor
+            level_min, level_max = self.levels[level - 1]
+            b0, b1 = i0 // block, -(-i1 // block)
+            # 每块取块起点横坐标，(min, max) 两点共用，形成一条竖线
+            starts = np.arange(b0, b1) * block
+            x_out = np.repeat(x[starts], 2)
+            y_out = np.empty((2 * (b1 - b0), len(self.channels)))
+            y_out[0::2] = level_min[b0:b1]
+            y_out[1::2] = level_max[b0:b1]
+        return x_out, y_out
+
+    def query_x_range(self, x0, x1, pixels, x_field="packetCount"):
+        """可见横轴范围 [x0, x1] 的绘图数据"""
+        i0, i1 = self.index_range(x0, x1, x_field)
+        return self.query(i0, i1, pixels, x_field)
+
+    def query_last(self, count, pixels, x_field="packetCount"):
+        """最近 count 个点的绘图数据"""
+        return self.query(self.size - count, self.size, pixels, x_field)
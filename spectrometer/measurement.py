@@ -0,0 +1,156 @@
+import csv
+import threading
+from datetime import datetime
+
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+MEASUREMENT_TARGET = 5       # 每组测量采集次数
+LIGHT_SETTLE_DELAY = 1.0     # 切换灯光后等待稳定（秒）
+STAGE_GAP_DELAY = 1.0        # 测量阶段之间的间隔（秒）
+MEASUREMENT_TIMEOUT_MARGIN = 5000  # 测量采集超时余量（ms）
+
+# 测量阶段：(测量类型, CSV中的类型名, 开始时依次发送的灯光指令, 结束时依次发送的关灯指令)
+MEASUREMENT_STAGES = [
+    ("led_only", "LED Only", [{"as7341Led": True}, {"uvLed": False}], [{"as7341Led": False}]),
+    ("uv_only", "UV Only", [{"uvLed": True}, {"as7341Led": False}], [{"uvLed": False}]),
+    ("led_uv", "LED+UV", [{"as7341Led": True}, {"uvLed": True}], [{"as7341Led": False}, {"uvLed": False}]),
+]
+LIGHTS_OFF_CMDS = [{"as7341Led": False}, {"uvLed": False}]
+
+SESSION_FIELDS = ["measurement_index", "measurement_time", "measurement_type", "data_index"] + CHANNEL_NAMES
+
+# ========================== 测量会话文件 ==========================
+def measurement_session_filename(session_start):
+    """测量会话文件名（包含会话开始时间）"""
+    return f"measurement_session_{session_start}.csv"
+
+def collection_timeout(target, stream_interval_ms):
+    """测量采集超时（秒）：按数据流间隔估算，并加上固定余量"""
+    return (target * stream_interval_ms + MEASUREMENT_TIMEOUT_MARGIN) / 1000.0
+
+def write_measurement_session_csv(measurements, file_path):
+    """将整个测量会话写入CSV（每次测量完成后整体重写，格式与分析脚本一致）"""
+    with open(file_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SESSION_FIELDS)
+        writer.writeheader()
+
+        for measurement in measurements:
+            for measurement_type, type_name, _, _ in MEASUREMENT_STAGES:
+                for i, data in enumerate(measurement[measurement_type]):
+                    row_data = {
+                        "measurement_index": measurement["measurement_index"],
+                        "measurement_time": measurement["measurement_time"],
+                        "measurement_type": type_name,
+                        "data_index": i
+                    }
+                    for name in CHANNEL_NAMES:
+                        row_data[name] = data[name]
+                    writer.writerow(row_data)
+
+# ========================== 测量序列模块 ==========================
+class MeasurementError(Exception):
+    """测量阶段超时且未收到任何数据"""
+
+
+class MeasurementSequence:
+    """LED Only -> UV Only -> LED+UV 三阶段测量（阻塞执行，不依赖Qt）
+
+    与GUI的测量流程一致：关灯 -> 逐阶段开灯、等待稳定、由处理线程采集
+    MEASUREMENT_TARGET个新数据点 -> 关灯；某阶段超时且无数据时关闭所有灯并中止。
+    cancel() 可在其他线程（或信号处理函数）中调用：立即打断等待，关闭所有灯并抛出 MeasurementError。
+    """
+
+    def __init__(self, send_cmd, pipeline, target=MEASUREMENT_TARGET, stream_interval_ms=1000,
+                 on_stage=None):
+        self.send_cmd = send_cmd
+        self.pipeline = pipeline
+        self.target = target
+        self.stream_interval_ms = stream_interval_ms
+        self.on_stage = on_stage  # 回调：on_stage(measurement_type, samples, timeout)
+        self.cancelled = threading.Event()
+        self.stage_done = None  # 当前阶段的唤醒事件（采集完成或取消时设置）
+
+    def send_all(self, cmds):
+        for cmd in cmds:
+            self.send_cmd(cmd)
+
+    def pause(self, seconds):
+        """等待seconds秒，期间被取消时抛出 MeasurementError"""
+        if self.cancelled.wait(seconds):
+            raise MeasurementError("测量已取消")
+
+    def collect(self, measurement_type):
+        """采集一个阶段的数据，返回 (samples, timeout)；被取消时抛出 MeasurementError"""
+        done = self.stage_done = threading.Event()
+        result = {}
+
+        def on_complete(m_type, samples):
+            result["samples"] = samples
+            done.set()
+
+        self.pipeline.start_collection(measurement_type, self.target, on_complete)
+        if self.cancelled.is_set():
+            done.set()  # cancel() 发生在设置 stage_done 之前
+        timeout = collection_timeout(self.target, self.stream_interval_ms)
+        finished = done.wait(timeout)
+        if self.cancelled.is_set():
+            self.pipeline.cancel_collection()
+            raise MeasurementError("测量已取消")
+        if finished:
+            return result["samples"], False
+
+        cancelled = self.pipeline.cancel_collection()
+        if cancelled is None:  # 超时的同时刚好采集完成，完成回调随即在处理线程中触发
+            done.wait(timeout)
+            if "samples" not in result:
+                raise MeasurementError("测量已取消" if self.cancelled.is_set() else
+                                       f"{measurement_type} 采集完成但未收到数据")
+            return result["samples"], False
+        print(f"[Measurement] {measurement_type} 数据收集超时")
+        return cancelled[1], True
+
+    def run(self, measurement_index=0):
+        """执行一次完整测量，返回会话记录 {measurement_index, measurement_time, led_only, uv_only, led_uv}"""
+        print("[Measurement] 开始单次测量")
+        try:
+            return self.run_stages(measurement_index)
+        except MeasurementError:
+            self.send_all(LIGHTS_OFF_CMDS)
+            raise
+
+    def run_stages(self, measurement_index):
+        measurement = {"measurement_index": measurement_index, "timeout": False}
+
+        # 确保所有灯关闭
+        self.send_all(LIGHTS_OFF_CMDS)
+        self.pause(LIGHT_SETTLE_DELAY)
+
+        for stage_no, (measurement_type, type_name, on_cmds, off_cmds) in enumerate(MEASUREMENT_STAGES):
+            if stage_no > 0:
+                self.pause(STAGE_GAP_DELAY)
+
+            print(f"[Measurement] 开始{type_name}测量")
+            self.send_all(on_cmds)
+            self.pause(LIGHT_SETTLE_DELAY)
+
+            samples, timeout = self.collect(measurement_type)
+            print(f"[Measurement] {type_name}测量完成，收集{len(samples)}个数据点")
+            self.send_all(off_cmds)
+            if self.on_stage:
+                self.on_stage(measurement_type, samples, timeout)
+
+            if timeout and not samples:
+                raise MeasurementError(f"{type_name}测量超时，未收到任何数据！")
+            measurement[measurement_type] = samples
+            measurement["timeout"] = measurement["timeout"] or timeout
+
+        measurement["measurement_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return measurement
+
+    def cancel(self):
+        """取消测量（可在其他线程中调用）：打断当前等待，run() 随即关灯并抛出 MeasurementError"""
+        self.cancelled.set()
+        self.pipeline.cancel_collection()
+        if self.stage_done is not None:
+            self.stage_done.set()
@@ -0,0 +1,604 @@
+import json
+import time
+import queue
+import socket
+import asyncio
+import ipaddress
+import threading
+
+from .protocol import (TCP_SERVER_PORT, UDP_SERVER_PORT, DEVICE_CMD_PORT, HEARTBEAT_INTERVAL,
+                       RECV_BUFFER_SIZE, DATA_TIMEOUT, HEARTBEAT_CMD, encode_cmd,
+                       normalize_spectral_packet, notification_kind)
+from .discovery import local_network
+
+# ========================== 宏定义 ==========================
+CONNECT_TIMEOUT = 10         # 指令服务器连接超时（秒）
+RECONNECT_DELAY = 5          # 指令服务器重连间隔（秒）
+STATUS_CHECK_INTERVAL = 3    # 数据流状态检查间隔（秒）
+NOTIFICATION_LINE_LIMIT = 64 * 1024  # 6677端口单行通知长度上限
+SEND_BUFFER_LIMIT = 64 * 1024        # 指令发送缓冲上限（设备不读取时拒绝继续写入）
+START_TIMEOUT = 5            # 等待事件循环执行启动/停止操作的超时（秒）
+BIND_ALL_IP = "0.0.0.0"      # 监听所有网卡（bind_all 模式；作为本机IP时不按网卡过滤）
+LOOP_HEARTBEAT_INTERVAL = 1.0  # 事件循环心跳间隔（秒）
+HEARTBEAT_TIMEOUT = 5.0        # 超过该时间无心跳判定为无响应（秒）
+
+# 指令客户端事件：只应交给当前设备的处理函数（切换设备后旧连接可能还有迟到的事件）
+CLIENT_EVENTS = ("cmd_response", "client_status", "cmd_send_error",
+                 "heartbeat_sent", "connection_established")
+
+# ========================== 设备指令客户端 ==========================
+class DeviceClient:
+    """单台设备的6688指令连接（在NetworkCore的事件循环中运行，send_cmd可在任意线程调用）"""
+
+    def __init__(self, core, device_ip):
+        self.core = core
+        self.device_ip = device_ip
+        self.running = True
+        self.connected = False
+        self.writer = None
+        self.task = None
+        self.reconnect_count = 0
+
+    def is_connected(self):
+        """检查连接状态"""
+        return self.running and self.connected and self.writer is not None
+
+    def send_cmd(self, cmd_dict):
+        """发送控制指令（支持所有设备协议指令）：在事件循环中写入，写入失败以cmd_send_error事件通知"""
+        if not self.is_connected():
+            self.core.post("cmd_send_error", self.device_ip, "指令发送失败：未连接设备")
+            return False
+        writer = self.writer
+        if writer.transport.get_write_buffer_size() > SEND_BUFFER_LIMIT:
+            self.core.post("cmd_send_error", self.device_ip, "指令发送失败：发送缓冲区已满，设备无响应")
+            return False
+        self.core.loop.call_soon_threadsafe(self.write, writer, encode_cmd(cmd_dict))
+        print(f"[TCP Client] 发送指令: {json.dumps(cmd_dict)}")
+        return True
+
+    def write(self, writer, data):
+        if writer is not self.writer or writer.is_closing():
+            self.core.post("cmd_send_error", self.device_ip, "指令发送错误: 连接已断开")
+            return
+        try:
+            writer.write(data)
+        except Exception as e:
+            err_msg = f"指令发送错误: {e}"
+            print(f"[TCP Client] {err_msg}")
+            self.core.post("cmd_send_error", self.device_ip, err_msg)
+            writer.close()
+
+    async def run(self):
+        """连接、接收响应、心跳；断开后每RECONNECT_DELAY秒重连，直到stop()"""
+        print(f"[TCP Client] 启动，目标设备: {self.device_ip}:{DEVICE_CMD_PORT}")
+        while self.running:
+            self.reconnect_count += 1
+            print(f"[TCP Client] 第{self.reconnect_count}次尝试连接: {self.device_ip}")
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.device_ip, DEVICE_CMD_PORT), CONNECT_TIMEOUT)
+            except asyncio.TimeoutError:
+                print(f"[TCP Client] 连接超时: {self.device_ip}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            except OSError as e:
+                print(f"[TCP Client] 连接错误: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+
+            self.writer = writer
+            self.connected = True
+            self.reconnect_count = 0
+            print(f"[TCP Client] 连接成功: {self.device_ip}:{DEVICE_CMD_PORT}")
+            self.core.post("connection_established", self.device_ip, self.device_ip)
+            self.core.post("client_status", self.device_ip, True, self.device_ip)
+
+            heartbeat = asyncio.ensure_future(self.heartbeat(writer))
+            try:
+                while True:
+                    data = await reader.read(RECV_BUFFER_SIZE)
+                    if not data:
+                        print(f"[TCP Client] 设备关闭连接: {self.device_ip}")
+                        break
+                    response = data.decode("utf-8", errors="ignore").strip()
+                    if response:
+                        print(f"[TCP Client] 收到响应: {response}")
+                        self.core.post("cmd_response", self.device_ip, response)
+            except OSError as e:
+                print(f"[TCP Client] 读取数据错误: {e}")
+            finally:
+                heartbeat.cancel()
+                self.connected = False
+                self.writer = None
+                writer.close()
+
+            if self.running:
+                print(f"[TCP Client] 连接丢失，尝试重连")
+                self.core.post("client_status", self.device_ip, False, self.device_ip)
+                await asyncio.sleep(RECONNECT_DELAY)
+
+    async def heartbeat(self, writer):
+        """每HEARTBEAT_INTERVAL秒发送设备可识别的心跳指令，写入失败时关闭连接触发重连"""
+        while True:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            try:
+                writer.write(encode_cmd(HEARTBEAT_CMD))
+                await writer.drain()
+            except Exception as e:
+                print(f"[TCP Client] 心跳发送失败: {e}")
+                writer.close()
+                return
+            print(f"[TCP Client] 发送心跳: {json.dumps(HEARTBEAT_CMD)}")
+            self.core.post("heartbeat_sent", self.device_ip, f"心跳发送成功: {self.device_ip}")
+
+    def stop(self):
+        """断开并停止重连（可在任意线程调用）"""
+        self.core.disconnect_device(self.device_ip)
+
+# ========================== UDP数据报端点 ==========================
+class SpectralDatagramProtocol(asyncio.DatagramProtocol):
+    """6699端口光谱数据报：直接交给NetworkCore解析"""
+
+    def __init__(self, core):
+        self.core = core
+
+    def datagram_received(self, data, addr):
+        self.core.handle_datagram(data, addr[0])
+
+    def error_received(self, exc):
+        print(f"[UDP Server] 接收错误: {exc}")
+
+    def connection_lost(self, exc):
+        if exc is not None:
+            print(f"[UDP Server] 数据端点异常关闭: {exc}")
+
+# ========================== 网络核心 ==========================
+class NetworkCore:
+    """单一asyncio事件循环（一个后台线程）承载全部网络角色：
+    6677通知服务器（可同时接受多台设备）、6699光谱数据报端点、任意数量设备的6688指令客户端。
+
+    事件以 (事件名, 设备IP, 参数元组) 放入一个线程安全队列 events，由界面/引擎在自己的线程中
+    取出分发；光谱数据若设置了 data_sink（如 PipelineWorker.submit）则在事件循环中直接交给它，
+    不经过事件队列。stop() 结束时向队列放入None，通知消费者退出。
+    event_listeners 中的回调 listener(事件名, 设备IP, 参数元组) 在放入事件时同步调用（不得阻塞）。
+
+    切换本机IP（rebind_servers）不停止事件循环与设备指令连接：默认先在新IP上绑定，成功后再关闭旧监听；
+    bind_all 为 True 时6677/6699只在 0.0.0.0 上绑定一次，切换本机IP只改变网卡过滤条件
+    （6677按连接的本机地址、6699按数据来源所在网段过滤），不涉及任何套接字操作。
+
+    check_*() / restart_*() 供 Supervisor 监控与重启各部分（可在任意线程调用）：
+    事件循环每 LOOP_HEARTBEAT_INTERVAL 秒更新一次 heartbeat，线程退出后 restart_loop() 重建事件循环，
+    设备连接、数据时间戳等状态保留在本对象中，不随重启丢失。
+    """
+
+    def __init__(self, local_ip, events=None, data_sink=None, bind_all=False):
+        self.local_ip = local_ip
+        self.bind_all = bind_all
+        self.accept_network = None  # bind_all 模式下接受6699数据的来源网段（None表示不过滤）
+        self.accepted_sources = {}  # 数据来源IP -> 是否属于 accept_network（避免每个数据报解析地址）
+        self.filtered_count = 0     # bind_all 模式下因不属于当前网卡而丢弃的连接与数据报数
+        self.events = events if events is not None else queue.SimpleQueue()
+        self.data_sink = data_sink
+        self.loop = None
+        self.thread = None
+        self.tcp_server = None
+        self.udp_transport = None
+        self.status_task = None
+        self.notification_writers = set()
+        self.devices = {}  # 设备IP -> DeviceClient
+        self.last_data_time = time.time()  # 最后收到光谱数据的时间戳
+        self.device_data_time = {}  # 设备IP -> 最后收到光谱数据的时间戳
+        self.data_normal = None
+        self.event_listeners = []
+        self.heartbeat = None  # 事件循环最近一次心跳（time.monotonic()）
+
+    # ---------------------- 生命周期 ----------------------
+    def start(self):
+        """启动事件循环线程，并在本机IP上启动6677/6699服务"""
+        self.loop = asyncio.new_event_loop()
+        self.heartbeat = time.monotonic()
+        self.thread = threading.Thread(target=self.run_loop, name="NetworkCore", daemon=True)
+        self.thread.start()
+        self.call(self.start_servers(self.local_ip))
+
+    def run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        print("[NetCore] 事件循环已启动")
+        self.loop.call_soon(self.beat)
+        self.loop.run_forever()
+        print("[NetCore] 事件循环已退出")
+
+    def beat(self):
+        self.heartbeat = time.monotonic()
+        self.loop.call_later(LOOP_HEARTBEAT_INTERVAL, self.beat)
+
+    def call(self, coro, timeout=START_TIMEOUT):
+        """在事件循环中执行协程并等待结果（供其他线程调用）"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            print(f"[NetCore] 操作失败: {e}")
+            return None
+
+    def stop(self):
+        """断开所有设备、关闭服务并结束事件循环线程；无论事件循环是否仍在运行，都向事件队列放入None"""
+        if self.loop and not self.loop.is_closed():
+            print("[NetCore] 正在停止...")
+            if self.thread.is_alive():
+                self.call(self.shutdown())
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.thread.join(START_TIMEOUT)
+            else:
+                # 事件循环线程已退出（如异常终止）：在当前线程中运行该循环，关闭其上的连接与服务
+                try:
+                    self.loop.run_until_complete(self.shutdown())
+                    self.loop.run_until_complete(self.abandon_loop())
+                except Exception as e:
+                    print(f"[NetCore] 清理已退出的事件循环失败: {e}")
+            self.loop.close()
+            print("[NetCore] 已停止")
+        self.events.put(None)
+
+    async def shutdown(self):
+        for client in list(self.devices.values()):
+            await self.stop_client(client)
+        self.devices.clear()
+        await self.close_servers()
+
+    def post(self, event, device_ip, *args):
+        """放入一个事件（线程安全）"""
+        self.events.put((event, device_ip, args))
+        for listener in list(self.event_listeners):
+            try:
+                listener(event, device_ip, args)
+            except Exception as e:
+                print(f"[NetCore] 事件监听器错误: {e}")
+
+    # ---------------------- 6677/6699服务 ----------------------
+    async def start_servers(self, local_ip):
+        self.set_local_ip(local_ip)
+        self.tcp_server, self.udp_transport = await self.bind_servers(self.bind_address())
+        self.last_data_time = time.time()
+        self.data_normal = None
+        self.status_task = asyncio.ensure_future(self.check_data_status())
+
+    async def bind_servers(self, bind_ip):
+        """在 bind_ip 上启动6677/6699服务，返回 (tcp_server, udp_transport)，失败的一项为None"""
+        return await self.bind_notification_server(bind_ip), await self.bind_data_endpoint(bind_ip)
+
+    async def bind_notification_server(self, bind_ip):
+        try:
+            tcp_server = await asyncio.start_server(
+                self.handle_notification_client, bind_ip, TCP_SERVER_PORT,
+                reuse_address=True, limit=NOTIFICATION_LINE_LIMIT)
+        except OSError as e:
+            err_msg = f"启动失败: {e}（IP: {bind_ip}，端口: {TCP_SERVER_PORT}）"
+            print(f"[TCP Server] {err_msg}")
+            self.post("server_status", "", False, err_msg)
+            return None
+        status_msg = f"TCP Server启动成功: {bind_ip}:{TCP_SERVER_PORT}"
+        print(f"[TCP Server] {status_msg}")
+        self.post("server_status", "", True, status_msg)
+        return tcp_server
+
+    async def bind_data_endpoint(self, bind_ip):
+        try:
+            udp_transport, _ = await self.loop.create_datagram_endpoint(
+                lambda: SpectralDatagramProtocol(self), local_addr=(bind_ip, UDP_SERVER_PORT))
+        except OSError as e:
+            err_msg = f"启动失败: {e}（IP: {bind_ip}，端口: {UDP_SERVER_PORT}）"
+            print(f"[UDP Server] {err_msg}")
+            self.post("server_status", "", False, err_msg)
+            return None
+        status_msg = f"UDP Server启动成功: {bind_ip}:{UDP_SERVER_PORT}"
+        print(f"[UDP Server] {status_msg}")
+        self.post("server_status", "", True, status_msg)
+        return udp_transport
+
+    def bind_address(self):
+        return BIND_ALL_IP if self.bind_all else self.local_ip
+
+    def set_local_ip(self, local_ip):
+        """更新本机IP与 bind_all 模式的网卡过滤条件"""
+        self.local_ip = local_ip
+        self.accepted_sources = {}
+        if self.bind_all and local_ip != BIND_ALL_IP:
+            self.accept_network = local_network(local_ip)
+        else:
+            self.accept_network = None
+
+    async def close_servers(self):
+        if self.status_task:
+            self.status_task.cancel()
+            self.status_task = None
+        for writer in list(self.notification_writers):
+            writer.close()
+        if self.tcp_server:
+            self.tcp_server.close()
+            await self.tcp_server.wait_closed()
+            self.tcp_server = None
+            print("[TCP Server] 已停止")
+        if self.udp_transport:
+            self.udp_transport.close()
+            self.udp_transport = None
+            print("[UDP Server] 已停止")
+
+    async def rebind_servers(self, local_ip):
+        """切换本机IP，返回是否成功。新监听全部启动成功后才关闭旧监听，失败时保留旧监听与原IP；
+        已建立的6677连接、设备指令连接与数据状态检查均不受影响"""
+        if self.bind_all and self.tcp_server and self.udp_transport:
+            try:
+                # 确认是本机地址（不占用端口）
+                with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+                    probe.bind((local_ip, 0))
+            except OSError as e:
+                err_msg = f"切换本机IP失败: {e}（IP: {local_ip}），继续使用: {self.local_ip}"
+                print(f"[NetCore] {err_msg}")
+                self.post("server_status", "", False, err_msg)
+                return False
+            self.set_local_ip(local_ip)
+            scope = "不过滤" if self.accept_network is None else f"只接受 {self.accept_network}"
+            status_msg = f"本机IP已切换: {local_ip}（监听所有网卡，{scope}）"
+            print(f"[NetCore] {status_msg}")
+            self.post("server_status", "", True, status_msg)
+            return True
+
+        tcp_server, udp_transport = await self.bind_servers(BIND_ALL_IP if self.bind_all else local_ip)
+        if (tcp_server is None or udp_transport is None) and self.tcp_server and self.udp_transport:
+            if tcp_server:
+                tcp_server.close()
+            if udp_transport:
+                udp_transport.close()
+            err_msg = f"切换本机IP失败，继续使用: {self.local_ip}"
+            print(f"[NetCore] {err_msg}")
+            self.post("server_status", "", False, err_msg)
+            return False
+
+        # 只关闭监听套接字：正在传输的6677连接自然结束
+        if self.tcp_server:
+            self.tcp_server.close()
+        if self.udp_transport:
+            self.udp_transport.close()
+        self.tcp_server, self.udp_transport = tcp_server, udp_transport
+        self.set_local_ip(local_ip)
+        if self.status_task is None:
+            self.status_task = asyncio.ensure_future(self.check_data_status())
+        return tcp_server is not None and udp_transport is not None
+
+    def restart_servers(self, local_ip):
+        """切换本机IP（可在任意线程调用，设备连接不受影响），返回是否成功"""
+        return bool(self.call(self.rebind_servers(local_ip)))
+
+    # ---------------------- 监控与重启 ----------------------
+    def check_loop(self):
+        if self.thread is None or not self.thread.is_alive():
+            return "事件循环线程已退出"
+        silence = time.monotonic() - self.heartbeat
+        if silence > HEARTBEAT_TIMEOUT:
+            return f"事件循环无响应（{silence:.0f}秒无心跳）"
+        return None
+
+    def restart_loop(self):
+        """事件循环线程退出后重建事件循环，重新启动6677/6699服务与设备指令连接"""
+        if self.thread.is_alive():
+            raise RuntimeError("事件循环线程仍在运行（阻塞），无法重启")
+        # 旧线程已退出：在当前线程中运行旧事件循环，关闭其上的套接字与任务，释放端口
+        old_loop = self.loop
+        try:
+            old_loop.run_until_complete(self.abandon_loop())
+        except Exception as e:
+            print(f"[NetCore] 清理旧事件循环失败: {e}")
+        finally:
+            old_loop.close()
+        for client in self.devices.values():
+            client.connected = False
+            client.writer = None
+            client.task = None
+        self.start()
+        self.call(self.start_device_clients())
+
+    async def abandon_loop(self):
+        await self.close_servers()
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def check_notification_server(self):
+        if self.tcp_server is None or not self.tcp_server.is_serving():
+            return "6677通知服务器未运行"
+        return None
+
+    def restart_notification_server(self):
+        async def reopen():
+            if self.tcp_server:
+                self.tcp_server.close()
+            self.tcp_server = await self.bind_notification_server(self.bind_address())
+            return self.tcp_server is not None
+        if not self.call(reopen()):
+            raise OSError(f"无法在 {self.bind_address()}:{TCP_SERVER_PORT} 上启动")
+
+    def check_data_endpoint(self):
+        if self.udp_transport is None or self.udp_transport.is_closing():
+            return "6699数据端点已关闭"
+        return None
+
+    def restart_data_endpoint(self):
+        async def reopen():
+            if self.udp_transport:
+                self.udp_transport.close()
+            self.udp_transport = await self.bind_data_endpoint(self.bind_address())
+            return self.udp_transport is not None
+        if not self.call(reopen()):
+            raise OSError(f"无法在 {self.bind_address()}:{UDP_SERVER_PORT} 上启动")
+
+    def check_device_clients(self):
+        failed = [client.device_ip for client in list(self.devices.values())
+                  if client.running and client.task is not None and client.task.done()]
+        if failed:
+            return f"设备指令连接任务已退出: {', '.join(failed)}"
+        return None
+
+    def restart_device_clients(self):
+        self.call(self.start_device_clients())
+
+    async def start_device_clients(self):
+        """为没有运行中任务的设备重新启动指令连接任务"""
+        for client in list(self.devices.values()):
+            if not client.running or (client.task is not None and not client.task.done()):
+                continue
+            if client.task is not None and not client.task.cancelled() and client.task.exception():
+                print(f"[TCP Client] 连接任务异常退出: {client.device_ip}（{client.task.exception()!r}）")
+            client.connected = False
+            client.writer = None
+            client.task = asyncio.ensure_future(client.run())
+
+    async def handle_notification_client(self, reader, writer):
+        """6677端口：逐行接收设备通知（每台设备一个连接，互不阻塞）"""
+        client_ip = writer.get_extra_info("peername")[0]
+        if self.accept_network is not None and writer.get_extra_info("sockname")[0] != self.local_ip:
+            self.filtered_count += 1
+            writer.close()
+            return
+        print(f"[TCP Server] 设备连接: {client_ip}")
+        self.notification_writers.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    print(f"[TCP Server] 设备主动断开: {client_ip}")
+                    # 注意：不发送断开事件，因为6677端口断开是正常行为
+                    break
+                line = line.strip()
+                if line:
+                    self.handle_notification(line, client_ip)
+        except ValueError as e:  # 单行超过NOTIFICATION_LINE_LIMIT
+            print(f"[TCP Server] 通知数据过长，断开: {client_ip}（{e}）")
+        except OSError as e:
+            print(f"[TCP Server] 客户端数据接收错误: {e}")
+        finally:
+            self.notification_writers.discard(writer)
+            writer.close()
+            print(f"[TCP Server] 客户端处理结束: {client_ip}")
+
+    def handle_notification(self, line, client_ip):
+        """解析一行JSON通知并发出对应事件"""
+        try:
+            json_str = line.decode("utf-8", errors="ignore")
+            print(f"[TCP Server] 收到数据: {json_str}")
+            json_data = json.loads(json_str)
+        except json.JSONDecodeError as e:
+            err_msg = f"JSON解析失败: {e}，原始数据: {line}"
+            print(f"[TCP Server] {err_msg}")
+            self.post("json_parse_error", client_ip, err_msg)
+            return
+
+        kind = notification_kind(json_data)
+        if kind == "connection":
+            print(f"[TCP Server] 发送设备连接信号")
+            self.post("device_connected", client_ip, json_data)
+        elif kind == "status":
+            self.post("device_status", client_ip, json_data)
+        elif kind == "stream_complete":
+            self.post("stream_complete", client_ip, json_data)
+
+    def handle_datagram(self, data, device_ip):
+        """解析一个UDP数据报：光谱数据交给data_sink（或放入事件队列）"""
+        if self.accept_network is not None:
+            accepted = self.accepted_sources.get(device_ip)
+            if accepted is None:
+                accepted = self.accepted_sources[device_ip] = ipaddress.IPv4Address(device_ip) in self.accept_network
+            if not accepted:
+                self.filtered_count += 1
+                return
+        try:
+            json_data = json.loads(data)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            err_msg = f"JSON解析失败: {e}，原始数据: {data[:200]}"
+            print(f"[UDP Server] {err_msg}")
+            self.post("json_parse_error", device_ip, err_msg)
+            return
+
+        normalized_data = normalize_spectral_packet(json_data, device_ip) if isinstance(json_data, dict) else None
+        if not normalized_data:
+            print(f"[UDP Server] 忽略无效数据（缺少必要字段）: {data[:200]}")
+            return
+
+        now = time.time()
+        self.last_data_time = now
+        self.device_data_time[device_ip] = now
+        if self.data_sink:
+            self.data_sink(normalized_data)
+        else:
+            self.post("spectral_data", device_ip, normalized_data)
+        # 只在状态变化时发出数据状态事件
+        if not self.data_normal:
+            self.data_normal = True
+            self.post("data_status", device_ip, True)
+
+    async def check_data_status(self):
+        """DATA_TIMEOUT秒无光谱数据则判定为中断"""
+        while True:
+            await asyncio.sleep(STATUS_CHECK_INTERVAL)
+            if time.time() - self.last_data_time > DATA_TIMEOUT and self.data_normal is not False:
+                self.data_normal = False
+                self.post("data_status", "", False)
+
+    # ---------------------- 设备指令客户端 ----------------------
+    def connect_device(self, device_ip):
+        """连接设备6688指令服务器（已存在时返回原连接），返回DeviceClient"""
+        client = self.devices.get(device_ip)
+        if client:
+            return client
+        client = DeviceClient(self, device_ip)
+        self.devices[device_ip] = client
+
+        def start_client():
+            client.task = asyncio.ensure_future(client.run())
+        self.loop.call_soon_threadsafe(start_client)
+        return client
+
+    def disconnect_device(self, device_ip):
+        """断开设备指令连接并停止重连"""
+        client = self.devices.pop(device_ip, None)
+        if client:
+            self.call(self.stop_client(client))
+
+    async def stop_client(self, client):
+        print(f"[TCP Client] 正在停止: {client.device_ip}")
+        client.running = False
+        if client.task:
+            client.task.cancel()
+            try:
+                await client.task
+            except asyncio.CancelledError:
+                pass
+        if client.writer:
+            client.writer.close()
+        client.connected = False
+        client.writer = None
+        print(f"[TCP Client] 已停止: {client.device_ip}")
+
+    def device(self, device_ip):
+        return self.devices.get(device_ip)
+
+
+def dispatch_events(events, handlers, current_device=None):
+    """从事件队列取出事件并调用 handlers[事件名](*参数)，取到None时返回（在调用者的线程中阻塞运行）
+
+    current_device：返回当前设备IP的函数，指定时丢弃其他设备的指令客户端事件
+    """
+    while True:
+        item = events.get()
+        if item is None:
+            return
+        event, device_ip, args = item
+        if current_device and event in CLIENT_EVENTS and device_ip != current_device():
+            continue
+        handler = handlers.get(event)
+        if handler:
+            try:
+                handler(*args)
+            except Exception as e:
+                print(f"[NetCore] 事件处理错误({event}): {e}")
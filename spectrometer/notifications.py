@@ -0,0 +1,126 @@
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+# ========================== 宏定义 ==========================
+LEVEL_INFO = "info"
+LEVEL_WARNING = "warning"
+LEVEL_ERROR = "error"
+LEVEL_NAMES = {LEVEL_INFO: "信息", LEVEL_WARNING: "警告", LEVEL_ERROR: "错误"}
+
+DEDUP_WINDOW = 5.0        # 去重窗口（秒）：窗口内相同通知只累加计数
+RATE_LIMIT_COUNT = 3      # 限流：每个限流窗口内同一通知最多展示次数
+RATE_LIMIT_WINDOW = 30.0  # 限流窗口（秒）
+MAX_HISTORY = 500         # 事件日志最大条数
+
+# ========================== 通知模块 ==========================
+class Notification:
+    """单条通知记录（重复通知合并到同一条记录并累加计数）"""
+    __slots__ = ("id", "level", "title", "message", "key", "count",
+                 "first_time", "last_time", "suppressed")
+
+    def __init__(self, notify_id, level, title, message, key, now):
+        self.id = notify_id
+        self.level = level
+        self.title = title
+        self.message = message
+        self.key = key
+        self.count = 1
+        self.first_time = now
+        self.last_time = now
+        self.suppressed = 0  # 被限流而未展示的次数
+
+    def time_str(self):
+        return datetime.fromtimestamp(self.last_time).strftime("%H:%M:%S")
+
+    def to_dict(self):
+        return {
+            "id": self.id, "level": self.level, "title": self.title,
+            "message": self.message, "key": self.key, "count": self.count,
+            "suppressed": self.suppressed,
+            "first_time": self.first_time, "last_time": self.last_time
+        }
+
+
+class NotificationCenter:
+    """非阻塞通知中心：按级别分发、去重、限流，不依赖任何GUI
+
+    post() 可在任意线程调用，立即返回；监听器在调用线程中被回调，
+    GUI需要自行转发到主线程（例如通过Qt信号）。
+    """
+
+    def __init__(self, dedup_window=DEDUP_WINDOW, rate_limit_count=RATE_LIMIT_COUNT,
+                 rate_limit_window=RATE_LIMIT_WINDOW, max_history=MAX_HISTORY, clock=time.time):
+        self.dedup_window = dedup_window
+        self.rate_limit_count = rate_limit_count
+        self.rate_limit_window = rate_limit_window
+        self.clock = clock
+        self.history = deque(maxlen=max_history)  # 事件日志
+        self.listeners = []
+        self.lock = threading.Lock()
+        self._next_id = 1
+        self._latest = {}       # key -> 最近一条Notification
+        self._shown_times = {}  # key -> 限流窗口内的展示时间戳
+
+    def add_listener(self, callback):
+        """注册监听器：callback(notification, is_new)"""
+        self.listeners.append(callback)
+
+    def post(self, level, title, message, key=None):
+        """发布通知，返回 (notification, shown)
+
+        shown=False 表示被去重或限流，只更新了事件日志中的计数。
+        """
+        key = key or f"{level}:{title}:{message}"
+        with self.lock:
+            now = self.clock()
+            entry = self._latest.get(key)
+
+            # 去重：窗口内的重复通知只累加计数
+            if entry is not None and now - entry.last_time <= self.dedup_window:
+                entry.count += 1
+                entry.last_time = now
+                entry.message = message
+                is_new = False
+                shown = False
+            else:
+                entry = Notification(self._next_id, level, title, message, key, now)
+                self._next_id += 1
+                self._latest[key] = entry
+                self.history.append(entry)
+                is_new = True
+                shown = self._allow_show(key, now)
+                if not shown:
+                    entry.suppressed += 1
+
+        print(f"[Notify] [{LEVEL_NAMES.get(level, level)}] {title}: {message}"
+              + ("" if is_new else f" (x{entry.count})"))
+        for callback in list(self.listeners):
+            try:
+                callback(entry, is_new and shown)
+            except Exception as e:
+                print(f"[Notify] 监听器错误: {e}")
+        return entry, is_new and shown
+
+    def _allow_show(self, key, now):
+        """限流：同一key在限流窗口内最多展示 rate_limit_count 次"""
+        times = self._shown_times.setdefault(key, deque())
+        while times and now - times[0] > self.rate_limit_window:
+            times.popleft()
+        if len(times) >= self.rate_limit_count:
+            return False
+        times.append(now)
+        return True
+
+    def clear(self):
+        """清空事件日志"""
+        with self.lock:
+            self.history.clear()
+            self._latest.clear()
+            self._shown_times.clear()
+
+    def snapshot(self):
+        """返回事件日志副本（按时间顺序）"""
+        with self.lock:
+            return list(self.history)
@@ -0,0 +1,370 @@
+import time
+import queue
+import threading
+from collections import deque
+from datetime import datetime
+
+# ========================== 宏定义 ==========================
+MAX_DATA_CACHE = 1000        # 最大绘图缓存
+PIPELINE_QUEUE_SIZE = 10000  # 处理队列上限（满时丢弃最旧数据，不阻塞接收线程）
+PIPELINE_BATCH_SIZE = 256    # 单次批量处理的最大数据包数
+PIPELINE_HEARTBEAT_TIMEOUT = 5.0  # 处理线程超过该时间无心跳判定为无响应（秒）
+CHANNEL_NAMES = ["F1", "F2", "F3", "F4", "F5", "F6", "F7", "F8"]
+SPECTRAL_FIELDS = ["timestamp", "packetCount", "streamCount"] + CHANNEL_NAMES
+
+# ========================== 数据处理模块 ==========================
+class DataProcessor:
+    """光谱数据存储：绘图缓存 + 数据记录（线程安全，由处理线程写入，GUI只读快照）"""
+
+    def __init__(self, cache_size=MAX_DATA_CACHE):
+        self.spectral_cache = deque(maxlen=cache_size)  # 绘图缓存（超出长度自动删除最旧数据）
+        self.recording = False    # 记录状态
+        self.record_data = []     # 记录数据
+        self.record_writer = None # 边记录边写入文件（带稀疏索引）时的 RecordingWriter
+        self.stream_complete = False  # 数据流完成标记
+        self.lock = threading.RLock()
+
+    def get_cache_count(self):
+        """获取缓存数据点数"""
+        return len(self.spectral_cache)
+
+    def get_record_count(self):
+        """获取记录数据点数"""
+        return len(self.record_data)
+
+    def clear_cache_data(self):
+        """清空缓存数据"""
+        with self.lock:
+            self.spectral_cache.clear()
+        return True
+
+    def clear_record_data(self):
+        """清空记录数据（仅在非记录状态下）"""
+        with self.lock:
+            if not self.recording:
+                self.record_data = []
+                return True
+        return False
+
+    def parse_spectral_data(self, json_data):
+        """光谱数据解析：匹配设备UDP字段"""
+        try:
+            # 从标准化后的数据中提取字段（UDP模块已处理字段映射）
+            data_list = json_data.get("data", [0]*8)
+            spectral_data = {
+                "timestamp": json_data.get("timestamp", 0),
+                "packetCount": json_data.get("packetCount", 0),
+                "streamCount": json_data.get("streamCount", 0)
+            }
+            for i, name in enumerate(CHANNEL_NAMES):
+                spectral_data[name] = data_list[i]
+
+            with self.lock:
+                self.spectral_cache.append(spectral_data)
+                # 记录数据（如果处于记录状态）
+                if self.recording:
+                    self.record_data.append(spectral_data.copy())
+                    if self.record_writer:
+                        self.write_record(spectral_data)
+
+            return spectral_data, None
+
+        except Exception as e:
+            err_msg = f"解析光谱数据错误: {e}，数据: {json_data}"
+            print(f"[DataProcessor] {err_msg}")
+            return None, err_msg
+
+    def latest(self):
+        """最新一个数据点（副本），无数据时返回None"""
+        with self.lock:
+            return self.spectral_cache[-1].copy() if self.spectral_cache else None
+
+    def snapshot(self):
+        """绘图缓存快照（列表副本，供GUI渲染时读取）"""
+        with self.lock:
+            return list(self.spectral_cache)
+
+    def snapshot_columns(self, x_field="packetCount"):
+        """按列返回绘图缓存：(x列表, {通道名: y列表})"""
+        with self.lock:
+            cache = list(self.spectral_cache)
+        x_data = [d[x_field] for d in cache]
+        y_data = {name: [d[name] for d in cache] for name in CHANNEL_NAMES}
+        return x_data, y_data
+
+    def start_record(self, file_path=None):
+        """开始数据记录；指定 file_path 时边记录边写入CSV（同时增量写入稀疏索引，见 recording.py）"""
+        from .recording import RecordingWriter
+
+        with self.lock:
+            if file_path:
+                try:
+                    self.record_writer = RecordingWriter(file_path)
+                except OSError as e:
+                    print(f"[DataProcessor] 无法创建记录文件: {e}")
+                    return False
+            self.recording = True
+            self.record_data = []
+            self.stream_complete = False
+        print("[DataProcessor] 开始记录数据")
+        return True
+
+    def write_record(self, spectral_data):
+        try:
+            self.record_writer.write(spectral_data)
+        except OSError as e:
+            print(f"[DataProcessor] 写入记录文件失败，停止写入文件: {e}")
+            self.close_record_writer()
+
+    def close_record_writer(self):
+        writer, self.record_writer = self.record_writer, None
+        if writer:
+            try:
+                writer.close()
+            except OSError as e:
+                print(f"[DataProcessor] 关闭记录文件失败: {e}")
+
+    def stop_record(self):
+        """停止数据记录"""
+        with self.lock:
+            self.recording = False
+            record_count = len(self.record_data)
+            self.close_record_writer()
+        print(f"[DataProcessor] 停止记录，共{record_count}个数据点")
+        return self.record_data, record_count
+
+    def save_to_csv(self, data_list, file_path):
+        """保存数据到CSV（同时生成稀疏索引 <文件>.idx，供按时间/数据包范围快速读取）"""
+        from .recording import RecordingWriter
+
+        if not data_list:
+            return False, "无数据可保存"
+
+        try:
+            with RecordingWriter(file_path) as writer:
+                writer.write_rows(data_list)
+            return True, f"保存成功: {file_path}"
+        except Exception as e:
+            return False, f"保存错误: {str(e)}"
+
+    def mark_stream_complete(self):
+        """标记数据流完成"""
+        self.stream_complete = True
+
+
+def default_record_filename():
+    """生成默认记录文件名（包含日期时间）"""
+    now = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"spectral_data_{now}.csv"
+
+# ========================== 测量采集模块 ==========================
+class MeasurementCollector:
+    """测量数据采集：在处理线程中按数据包到达事件收集指定数量的新数据点"""
+
+    def __init__(self):
+        self.active = False
+        self.measurement_type = None
+        self.target = 0
+        self.last_packet = None
+        self.samples = []
+        self.on_complete = None
+
+    def start(self, measurement_type, target, last_packet, on_complete):
+        """开始采集：只收集packetCount大于last_packet的新数据"""
+        self.measurement_type = measurement_type
+        self.target = target
+        self.last_packet = last_packet
+        self.samples = []
+        self.on_complete = on_complete
+        self.active = True
+
+    def feed(self, spectral_data):
+        """处理线程每解析一个数据点调用一次，采集完成时返回True"""
+        if not self.active:
+            return False
+        packet_count = spectral_data.get("packetCount", 0)
+        if self.last_packet is not None and packet_count <= self.last_packet:
+            return False
+        self.last_packet = packet_count
+
+        sample = spectral_data.copy()
+        sample["measurement_type"] = self.measurement_type
+        sample["measurement_index"] = len(self.samples)
+        sample["measurement_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.samples.append(sample)
+        print(f"[Measurement] {self.measurement_type} 收集到第 {len(self.samples)} 个数据点")
+        return len(self.samples) >= self.target
+
+    def stop(self):
+        """停止采集，返回 (测量类型, 已收集数据)"""
+        self.active = False
+        return self.measurement_type, self.samples
+
+# ========================== 处理线程模块 ==========================
+class PipelineWorker:
+    """数据处理线程：拥有数据存储、数据记录与测量采集
+
+    接收线程只调用 submit() 入队，解析/记录/采集/统计全部在本线程完成；
+    GUI在渲染时通过 version 判断是否有新数据，再读取 processor 的快照。
+    回调（on_parse_error / 采集完成回调）在本线程中执行，GUI需自行转发到主线程。
+    线程因异常退出后可用 restart() 重新启动，队列、统计与丢包跟踪（last_packet_count）保留。
+    """
+
+    def __init__(self, processor=None, queue_size=PIPELINE_QUEUE_SIZE):
+        self.thread = None
+        self.processor = processor or DataProcessor()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.collector = MeasurementCollector()
+        self.collector_lock = threading.Lock()
+        self.running = False
+        self.on_parse_error = None  # 回调：on_parse_error(err_msg)
+        self.sample_listeners = []  # 回调：listener(spectral_data, device_ip)，在处理线程中调用
+        self.heartbeat = None  # 处理线程最近一次心跳（time.monotonic()）
+        self.error = None      # 处理线程异常退出的原因
+
+        # 统计信息
+        self.version = 0          # 每处理一批数据加1
+        self.received_count = 0   # 入队数据包数
+        self.processed_count = 0  # 已处理数据包数
+        self.dropped_count = 0    # 队列满时丢弃的数据包数
+        self.parse_error_count = 0
+        self.lost_packet_count = 0  # 根据packetCount间隔估计的丢包数
+        self.last_packet_count = None
+
+    def submit(self, json_data):
+        """入队一个标准化后的光谱数据包（可在任意线程调用，永不阻塞）"""
+        self.received_count += 1
+        try:
+            self.queue.put_nowait(json_data)
+        except queue.Full:
+            # 队列满：丢弃最旧数据，保证最新数据可用
+            try:
+                self.queue.get_nowait()
+                self.dropped_count += 1
+            except queue.Empty:
+                pass
+            try:
+                self.queue.put_nowait(json_data)
+            except queue.Full:
+                self.dropped_count += 1
+
+    def start(self):
+        self.heartbeat = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name="PipelineWorker", daemon=True)
+        self.thread.start()
+
+    def is_alive(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def check(self):
+        """Supervisor 检查：正常返回None，否则返回故障原因"""
+        if not self.is_alive():
+            return f"数据处理线程已退出: {self.error}" if self.error else "数据处理线程已退出"
+        silence = time.monotonic() - self.heartbeat
+        if silence > PIPELINE_HEARTBEAT_TIMEOUT:
+            return f"数据处理线程无响应（{silence:.0f}秒无心跳）"
+        return None
+
+    def restart(self):
+        """重新启动已退出的处理线程"""
+        if self.is_alive():
+            raise RuntimeError("数据处理线程仍在运行（阻塞），无法重启")
+        self.error = None
+        self.start()
+
+    def run(self):
+        self.running = True
+        print("[Pipeline] 处理线程已启动")
+        try:
+            self.serve()
+        except Exception as e:
+            self.error = e
+            print(f"[Pipeline] 处理线程异常退出: {e!r}")
+            return
+        print("[Pipeline] 处理线程已退出")
+
+    def serve(self):
+        while self.running:
+            self.heartbeat = time.monotonic()
+            try:
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            batch = [item]
+            # 批量取出已到达的数据，减少加锁与唤醒次数
+            while len(batch) < PIPELINE_BATCH_SIZE:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self.running = False
+                    break
+                batch.append(item)
+            self.process_batch(batch)
+
+    def process_batch(self, batch):
+        """解析、记录、采集与统计一批数据"""
+        for json_data in batch:
+            spectral_data, err_msg = self.processor.parse_spectral_data(json_data)
+            if not spectral_data:
+                self.parse_error_count += 1
+                if self.on_parse_error:
+                    self.on_parse_error(err_msg)
+                continue
+
+            # 丢包统计（packetCount不连续）
+            packet_count = spectral_data["packetCount"]
+            if self.last_packet_count is not None and packet_count > self.last_packet_count + 1:
+                self.lost_packet_count += packet_count - self.last_packet_count - 1
+            self.last_packet_count = packet_count
+            self.processed_count += 1
+
+            for listener in list(self.sample_listeners):
+                try:
+                    listener(spectral_data, json_data.get("device_ip", ""))
+                except Exception as e:
+                    print(f"[Pipeline] 数据监听器错误: {e}")
+
+            # 测量采集
+            callback = None
+            with self.collector_lock:
+                finished = self.collector.feed(spectral_data)
+                if finished:
+                    measurement_type, samples = self.collector.stop()
+                    callback = self.collector.on_complete
+            if finished and callback:
+                callback(measurement_type, samples)
+        self.version += 1
+
+    def start_collection(self, measurement_type, target, on_complete):
+        """开始测量采集：从当前最新数据包之后收集target个点，完成时在处理线程中回调
+        on_complete(measurement_type, samples)"""
+        latest = self.processor.latest()
+        last_packet = latest["packetCount"] if latest else None
+        with self.collector_lock:
+            self.collector.start(measurement_type, target, last_packet, on_complete)
+
+    def cancel_collection(self):
+        """取消测量采集（如超时），返回 (测量类型, 已收集数据)；
+        采集已完成（完成回调已触发）时返回None"""
+        with self.collector_lock:
+            if not self.collector.active:
+                return None
+            return self.collector.stop()
+
+    def collection_active(self):
+        return self.collector.active
+
+    def stop(self):
+        print("[Pipeline] 正在停止...")
+        self.running = False
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if self.is_alive():
+            self.thread.join(2)
+        print("[Pipeline] 已停止")
@@ -0,0 +1,52 @@
+import json
+
+# ========================== 宏定义 ==========================
+TCP_SERVER_PORT = 6677       # 接收设备连接/状态通知
+UDP_SERVER_PORT = 6699       # 接收光谱数据
+DEVICE_CMD_PORT = 6688       # 设备指令服务器
+HEARTBEAT_INTERVAL = 20      # 心跳间隔（秒）
+RECV_BUFFER_SIZE = 4096      # 接收缓冲区
+MIN_STREAM_INTERVAL = 400    # 最小数据流间隔（ms，匹配设备协议）
+DATA_TIMEOUT = 5             # 超过该秒数未收到光谱数据判定为中断
+
+HEARTBEAT_CMD = {"type": "heartbeat"}
+
+# ========================== 工具函数 ==========================
+def is_valid_ipv4(ip):
+    parts = ip.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not part.isdigit():
+            return False
+        num = int(part)
+        if num < 0 or num > 255:
+            return False
+    return True
+
+def encode_cmd(cmd_dict):
+    """编码控制指令（设备要求以\\n结尾）"""
+    return (json.dumps(cmd_dict) + "\n").encode("utf-8")
+
+def normalize_spectral_packet(json_data, device_ip):
+    """将设备UDP字段（t/d/c/sc）映射为标准光谱数据包，缺少必要字段时返回None"""
+    if not all(key in json_data for key in ["t", "d", "c"]):
+        return None
+    return {
+        "timestamp": json_data["t"],
+        "packetCount": json_data["c"],
+        "data": json_data["d"],
+        "streamCount": json_data.get("sc", 0),
+        "device_ip": device_ip
+    }
+
+def notification_kind(json_data):
+    """6677端口通知类型：connection / status / stream_complete / None"""
+    msg_type = json_data.get('type')
+    if msg_type == 'connection':
+        return "connection"
+    if msg_type in ('status', 'deviceStatus'):
+        return "status"
+    if msg_type in ('stream_complete', 'streamComplete'):
+        return "stream_complete"
+    return None
@@ -0,0 +1,242 @@
+import os
+import bisect
+
+from .pipeline import SPECTRAL_FIELDS
+
+# ========================== 宏定义 ==========================
+INDEX_SUFFIX = ".idx"        # 索引文件：<记录文件>.idx
+INDEX_BLOCK_ROWS = 1000      # 每个索引块的行数（稀疏索引：每块一条）
+INDEX_FIELDS = ["row", "rows", "offset", "size", "timestamp_min", "timestamp_max", "packet_min", "packet_max"]
+RANGE_FIELDS = {"timestamp": ("timestamp_min", "timestamp_max"), "packetCount": ("packet_min", "packet_max")}
+
+# ========================== 记录文件索引 ==========================
+# 记录文件为 save_to_csv 的CSV格式（SPECTRAL_FIELDS）。索引按块记录：块起始行号、行数、起始字节偏移、
+# 字节数，以及块内 timestamp / packetCount 的最小值和最大值。数据流重置或设备重启后 timestamp、packetCount 可能回绕，
+# 因此查询按块的 [最小值, 最大值] 是否与查询范围重叠来选块，不要求整个文件单调。
+
+def index_path(file_path):
+    return file_path + INDEX_SUFFIX
+
+def _parse_value(text):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def _format_row(data):
+    return ",".join(str(data[name]) for name in SPECTRAL_FIELDS) + "\r\n"
+
+class _Block:
+    """正在写入/扫描的索引块"""
+
+    def __init__(self, row, offset):
+        self.row = row
+        self.offset = offset
+        self.size = 0
+        self.rows = 0
+        self.timestamp_min = self.timestamp_max = None
+        self.packet_min = self.packet_max = None
+
+    def add(self, timestamp, packet_count, size):
+        self.size += size
+        if self.rows == 0:
+            self.timestamp_min = self.timestamp_max = timestamp
+            self.packet_min = self.packet_max = packet_count
+        else:
+            self.timestamp_min = min(self.timestamp_min, timestamp)
+            self.timestamp_max = max(self.timestamp_max, timestamp)
+            self.packet_min = min(self.packet_min, packet_count)
+            self.packet_max = max(self.packet_max, packet_count)
+        self.rows += 1
+
+    def entry(self):
+        return [self.row, self.rows, self.offset, self.size,
+                self.timestamp_min, self.timestamp_max, self.packet_min, self.packet_max]
+
+
+class RecordingWriter:
+    """逐行写入记录文件（格式与 save_to_csv 一致），同时增量写入稀疏索引：
+    每写满 INDEX_BLOCK_ROWS 行追加一条索引并刷新，异常中断时已写入的块仍可用于查询。
+    """
+
+    def __init__(self, file_path, block_rows=INDEX_BLOCK_ROWS):
+        self.file_path = file_path
+        self.block_rows = block_rows
+        self.file = open(file_path, "wb")
+        self.index = open(index_path(file_path), "w", encoding="utf-8", newline="")
+        self.index.write(",".join(INDEX_FIELDS) + "\n")
+        header = (",".join(SPECTRAL_FIELDS) + "\r\n").encode("utf-8")
+        self.file.write(header)
+        self.offset = len(header)
+        self.row_count = 0
+        self.block = _Block(0, self.offset)
+
+    def write(self, data):
+        line = _format_row(data).encode("utf-8")
+        self.file.write(line)
+        self.block.add(data["timestamp"], data["packetCount"], len(line))
+        self.offset += len(line)
+        self.row_count += 1
+        if self.block.rows >= self.block_rows:
+            self._close_block()
+
+    def write_rows(self, data_list):
+        for data in data_list:
+            self.write(data)
+
+    def _close_block(self):
+        if self.block.rows:
+            self.file.flush()  # 索引指向的数据先落盘
+            self.index.write(",".join(str(v) for v in self.block.entry()) + "\n")
+            self.index.flush()
+        self.block = _Block(self.row_count, self.offset)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._close_block()
+        self.file.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _scan_blocks(f, header, row, offset, block_rows=INDEX_BLOCK_ROWS):
+    """从 offset（第 row 行起始）扫描到文件末尾，返回索引条目列表；末尾不完整的行（仍在写入）不计入"""
+    ts_col, pkt_col = header.index("timestamp"), header.index("packetCount")
+    f.seek(offset)
+    entries = []
+    block = _Block(row, offset)
+    for line in f:
+        if not line.endswith(b"\n"):
+            break
+        fields = line.split(b",")
+        block.add(_parse_value(fields[ts_col].decode()), _parse_value(fields[pkt_col].decode()), len(line))
+        if block.rows >= block_rows:
+            entries.append(block.entry())
+            block = _Block(block.row + block.rows, block.offset + block.size)
+    if block.rows:
+        entries.append(block.entry())
+    return entries
+
+def _read_header(f):
+    f.seek(0)
+    return f.readline().decode("utf-8-sig").strip().split(","), f.tell()
+
+def _write_index(file_path, entries):
+    with open(index_path(file_path), "w", encoding="utf-8", newline="") as f:
+        f.write(",".join(INDEX_FIELDS) + "\n")
+        for entry in entries:
+            f.write(",".join(str(v) for v in entry) + "\n")
+
+def build_index(file_path, block_rows=INDEX_BLOCK_ROWS):
+    """扫描已有记录文件生成索引文件（旧记录或索引丢失时使用），返回索引条目列表"""
+    with open(file_path, "rb") as f:
+        header, offset = _read_header(f)
+        entries = _scan_blocks(f, header, 0, offset, block_rows)
+    _write_index(file_path, entries)
+    return entries
+
+def load_index(file_path):
+    """读取索引：索引不存在时扫描整个文件生成；索引只覆盖文件前一部分时
+    （记录仍在写入，或写入中断），只扫描未覆盖的尾部补齐（不改写索引文件）"""
+    if not os.path.exists(index_path(file_path)):
+        return build_index(file_path)
+    entries = []
+    with open(index_path(file_path), encoding="utf-8") as f:
+        next(f, None)
+        for line in f:
+            values = line.strip().split(",")
+            if len(values) == len(INDEX_FIELDS):
+                entries.append([_parse_value(v) for v in values])
+    with open(file_path, "rb") as f:
+        header, offset = _read_header(f)
+        row = 0
+        if entries:
+            row, offset = entries[-1][0] + entries[-1][1], entries[-1][2] + entries[-1][3]
+        if os.path.getsize(file_path) > offset:
+            entries += _scan_blocks(f, header, row, offset)
+    return entries
+
+# ========================== 记录文件读取 ==========================
+class RecordingReader:
+    """按时间（timestamp）或数据包序号（packetCount）范围读取记录文件：
+    由稀疏索引定位与范围重叠的块，直接seek到块起始偏移，只解析这些块。
+
+    示例：
+        reader = RecordingReader("spectral_data_20251005_153547.csv")
+        for data in reader.iter_range(start=3_600_000, end=3_900_000):   # timestamp（ms）范围
+            ...
+        rows = reader.read_range(1000, 2000, field="packetCount")
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.refresh()
+
+    def refresh(self):
+        """重新读取索引（记录仍在写入时，用于看到新追加的数据）"""
+        self.entries = load_index(self.file_path)
+        with open(self.file_path, "rb") as f:
+            self.header, _ = _read_header(f)
+
+    @property
+    def row_count(self):
+        return self.entries[-1][0] + self.entries[-1][1] if self.entries else 0
+
+    def bounds(self, field="timestamp"):
+        """整个记录的 (最小值, 最大值)"""
+        lo, hi = (INDEX_FIELDS.index(name) for name in RANGE_FIELDS[field])
+        if not self.entries:
+            return None, None
+        return min(e[lo] for e in self.entries), max(e[hi] for e in self.entries)
+
+    def blocks_for_range(self, start=None, end=None, field="timestamp"):
+        """与 [start, end] 重叠的块编号列表"""
+        lo, hi = (INDEX_FIELDS.index(name) for name in RANGE_FIELDS[field])
+        return [i for i, e in enumerate(self.entries)
+                if (start is None or e[hi] >= start) and (end is None or e[lo] <= end)]
+
+    def block_for_row(self, row):
+        """包含第 row 行（0起）的块编号"""
+        return max(0, bisect.bisect_right([e[0] for e in self.entries], row) - 1)
+
+    def _iter_blocks(self, blocks):
+        """依次读取若干块（相邻块合并为一次连续读取），逐行返回 (行号, 字段值列表)"""
+        with open(self.file_path, "rb") as f:
+            i = 0
+            while i < len(blocks):
+                first = blocks[i]
+                while i + 1 < len(blocks) and blocks[i + 1] == blocks[i] + 1:
+                    i += 1
+                last = blocks[i]
+                i += 1
+                f.seek(self.entries[first][2])
+                data = f.read(self.entries[last][2] + self.entries[last][3] - self.entries[first][2])
+                row = self.entries[first][0]
+                for line in data.decode("utf-8").splitlines():
+                    yield row, line.split(",")
+                    row += 1
+
+    def iter_range(self, start=None, end=None, field="timestamp"):
+        """逐行返回 field 在 [start, end] 内的数据点（字典，字段与 SPECTRAL_FIELDS 一致）"""
+        col = self.header.index(field)
+        for _, values in self._iter_blocks(self.blocks_for_range(start, end, field)):
+            value = _parse_value(values[col])
+            if (start is None or value >= start) and (end is None or value <= end):
+                yield {name: _parse_value(v) for name, v in zip(self.header, values)}
+
+    def read_range(self, start=None, end=None, field="timestamp"):
+        return list(self.iter_range(start, end, field))
+
+    def iter_rows(self, first, last=None):
+        """按行号范围 [first, last) 逐行返回数据点"""
+        last_block = len(self.entries) - 1 if last is None else self.block_for_row(max(first, last - 1))
+        blocks = list(range(self.block_for_row(first), last_block + 1))
+        for row, values in self._iter_blocks(blocks):
+            if row >= first and (last is None or row < last):
+                yield {name: _parse_value(v) for name, v in zip(self.header, values)}
@@ -0,0 +1,272 @@
+import os
+import csv
+import json
+import sqlite3
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from .pipeline import CHANNEL_NAMES
+from .measurement import MEASUREMENT_STAGES
+
+# ========================== 宏定义 ==========================
+# 默认会话库放在用户目录下（与启动目录无关），GUI与命令行工具共用同一个会话库
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser("~"), "spectrometer_sessions.db")
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"      # 会话CSV中 measurement_time 的格式
+EPOCH = datetime(1970, 1, 1)
+TYPE_CODES = {type_name: code for code, (_, type_name, _, _) in enumerate(MEASUREMENT_STAGES)}
+TYPE_NAMES = [type_name for _, type_name, _, _ in MEASUREMENT_STAGES]
+SESSION_COLUMNS = ["session_id", "session_start", "device", "device_ip", "firmware", "led_brightness",
+                   "uv_brightness", "interval", "stream_interval", "plate_map", "source", "created"]
+
+# 样本表：每次测量的每个测量类型一行（该组全部重复数据点打包为 BLOB，int32 小端，shape = (重复次数, 通道数)），
+# 以 (会话, 测量序号, 测量类型) 为聚簇主键、另按时间建索引；跨会话查询只需读取少量行再整体解包为NumPy数组。
+# measurement_type 存为测量阶段编号（0=LED Only, 1=UV Only, 2=LED+UV），
+# measurement_time 存为本地时间自1970-01-01起的秒数（与CSV一样不含时区）
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id      INTEGER PRIMARY KEY,
+    session_start   TEXT NOT NULL,
+    device          TEXT,
+    device_ip       TEXT,
+    firmware        TEXT,
+    led_brightness  INTEGER,
+    uv_brightness   INTEGER,
+    interval        REAL,
+    stream_interval INTEGER,
+    plate_map       TEXT,
+    source          TEXT UNIQUE,
+    created         TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_device ON sessions (device, session_start);
+CREATE TABLE IF NOT EXISTS samples (
+    session_id        INTEGER NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE,
+    measurement_index INTEGER NOT NULL,
+    measurement_type  INTEGER NOT NULL,
+    measurement_time  REAL NOT NULL,
+    replicates        INTEGER NOT NULL,
+    data              BLOB NOT NULL,
+    PRIMARY KEY (session_id, measurement_index, measurement_type)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_samples_time ON samples (measurement_time, measurement_type);
+"""
+SAMPLE_DTYPE = np.dtype("<i4")
+INSERT_SAMPLE = ("INSERT INTO samples (session_id, measurement_index, measurement_type, measurement_time, "
+                 "replicates, data) VALUES (?, ?, ?, ?, ?, ?)")
+
+
+def to_timestamp(value):
+    """时间（datetime、"%Y-%m-%d %H:%M:%S" 字符串或秒数）转为库中的时间秒数，None保持不变"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.strptime(value, TIME_FORMAT)
+    return (value - EPOCH).total_seconds()
+
+def pack_group(session_id, measurement_index, type_code, measurement_time, values):
+    """一组重复数据点 (重复次数, 通道数) 打包为 samples 表的一行"""
+    values = np.asarray(values, dtype=SAMPLE_DTYPE).reshape(-1, len(CHANNEL_NAMES))
+    return (session_id, int(measurement_index), int(type_code), float(measurement_time), len(values),
+            values.tobytes())
+
+# ========================== 会话数据库 ==========================
+class SessionDatabase:
+    """SQLite会话库：sessions 表保存会话信息（设备、固件、亮度、间隔、孔板布局），
+    samples 表保存每组重复测量的数据点，按 (会话, 测量序号, 测量类型) 与时间建索引，可跨会话查询。
+
+    写入均在事务中批量执行（executemany），可由采集线程与分析脚本共用（内部加锁）。
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")    # 采集写入时其他进程仍可查询
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    # ---------------------- 写入 ----------------------
+    def _insert_session(self, session_start, device=None, device_ip=None, firmware=None, led_brightness=None,
+                        uv_brightness=None, interval=None, stream_interval=None, plate_map=None, source=None):
+        cursor = self.conn.execute(
+            f"INSERT INTO sessions ({', '.join(SESSION_COLUMNS[1:])}) VALUES ({', '.join('?' * 11)})",
+            (session_start, device, device_ip, firmware, led_brightness, uv_brightness, interval, stream_interval,
+             None if plate_map is None else json.dumps(plate_map, ensure_ascii=False),
+             source, datetime.now().isoformat(timespec="seconds")))
+        return cursor.lastrowid
+
+    def create_session(self, session_start, **session_fields):
+        """新建会话，返回 session_id。session_fields: device, device_ip, firmware, led_brightness,
+        uv_brightness, interval（测量间隔，秒）, stream_interval（ms）, plate_map（可JSON序列化的孔板布局，
+        如 {"A1": "control"}）, source（来源文件）"""
+        with self.lock, self.conn:
+            return self._insert_session(session_start, **session_fields)
+
+    def add_groups(self, session_id, groups):
+        """批量写入（一个事务），groups 为 (measurement_index, measurement_type编号, measurement_time秒数,
+        (重复次数, 通道数) 数据) 元组，返回写入的数据点数"""
+        rows = [pack_group(session_id, *group) for group in groups]
+        with self.lock, self.conn:
+            self.conn.executemany(INSERT_SAMPLE, rows)
+        return sum(row[4] for row in rows)
+
+    def add_measurement(self, session_id, measurement):
+        """写入一次测量（测量流程返回的 {measurement_index, measurement_time, led_only, uv_only, led_uv}）"""
+        timestamp = to_timestamp(measurement["measurement_time"])
+        groups = []
+        for code, (measurement_type, _, _, _) in enumerate(MEASUREMENT_STAGES):
+            samples = measurement.get(measurement_type) or []
+            if samples:
+                groups.append((measurement["measurement_index"], code, timestamp,
+                               [[data[name] for name in CHANNEL_NAMES] for data in samples]))
+        return self.add_groups(session_id, groups)
+
+    def import_session_csv(self, file_path, session_start=None, **session_fields):
+        """导入已有的测量会话CSV（measurement_session_<开始时间>.csv），返回 session_id；
+        同一文件已导入过时直接返回原 session_id"""
+        source = str(file_path)
+        with self.lock:
+            existing = self.conn.execute("SELECT session_id FROM sessions WHERE source = ?", (source,)).fetchone()
+        if existing:
+            return existing[0]
+        if session_start is None:
+            stem = source.replace("\\", "/").rsplit("/", 1)[-1].rsplit(".", 1)[0]
+            session_start = "_".join(stem.rsplit("_", 2)[-2:])
+
+        # 按 (测量序号, 测量类型) 归组（文件中同组的行是连续的，按 data_index 排列）
+        groups = {}
+        with open(file_path, newline="", encoding="utf-8-sig") as f:
+            for row in csv.DictReader(f):
+                key = (int(row["measurement_index"]), TYPE_CODES[row["measurement_type"]])
+                if key not in groups:
+                    groups[key] = (to_timestamp(row["measurement_time"]), [])
+                groups[key][1].append([int(float(row[name])) for name in CHANNEL_NAMES])
+
+        with self.lock, self.conn:  # 会话与所有数据点在同一个事务中写入
+            session_id = self._insert_session(session_start, source=source, **session_fields)
+            self.conn.executemany(INSERT_SAMPLE, [pack_group(session_id, index, code, timestamp, values)
+                                                  for (index, code), (timestamp, values) in sorted(groups.items())])
+        return session_id
+
+    def delete_session(self, session_id):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    # ---------------------- 查询 ----------------------
+    def sessions(self, device=None):
+        """会话列表（字典列表，按开始时间排序），plate_map 已解析为对象"""
+        sql = f"SELECT {', '.join(SESSION_COLUMNS)} FROM sessions"
+        params = ()
+        if device is not None:
+            sql += " WHERE device = ?"
+            params = (device,)
+        with self.lock:
+            rows = self.conn.execute(sql + " ORDER BY session_start", params).fetchall()
+        sessions = [dict(zip(SESSION_COLUMNS, row)) for row in rows]
+        for session in sessions:
+            if session["plate_map"] is not None:
+                session["plate_map"] = json.loads(session["plate_map"])
+        return sessions
+
+    @staticmethod
+    def _sample_query(columns, session_id=None, device=None, measurement_type=None, since=None, until=None,
+                      measurement_index=None):
+        where, params = [], []
+        if session_id is not None:
+            ids = [session_id] if isinstance(session_id, int) else list(session_id)
+            where.append(f"session_id IN ({', '.join('?' * len(ids))})")
+            params += ids
+        if device is not None:
+            where.append("session_id IN (SELECT session_id FROM sessions WHERE device = ?)")
+            params.append(device)
+        if measurement_index is not None:
+            where.append("measurement_index = ?")
+            params.append(measurement_index)
+        if measurement_type is not None:
+            types = [measurement_type] if isinstance(measurement_type, (str, int)) else list(measurement_type)
+            codes = [TYPE_CODES[t] if isinstance(t, str) else t for t in types]
+            where.append(f"measurement_type IN ({', '.join('?' * len(codes))})")
+            params += codes
+        if since is not None:
+            where.append("measurement_time >= ?")
+            params.append(to_timestamp(since))
+        if until is not None:
+            where.append("measurement_time < ?")
+            params.append(to_timestamp(until))
+        sql = f"SELECT {', '.join(columns)} FROM samples"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return sql, params
+
+    def query(self, channels=CHANNEL_NAMES, session_id=None, device=None, measurement_type=None,
+              since=None, until=None, measurement_index=None):
+        """跨会话查询数据点，条件可任意组合：
+
+          session_id: 会话ID或ID列表；device: 设备名；measurement_type: 类型名（如 "LED+UV"）、编号或其列表；
+          measurement_index: 测量序号；since/until: 时间范围 [since, until)（datetime、字符串或秒数）
+        返回字典（NumPy数组，每个数据点一行，按会话、测量序号、测量类型排序）：session_id, measurement_index,
+          measurement_type（类型名）, data_index, measurement_time（秒数，见 to_timestamp）, values（(行数, 通道数)）
+        """
+        channels = [channels] if isinstance(channels, str) else list(channels)
+        unknown = set(channels) - set(CHANNEL_NAMES)
+        if unknown:
+            raise ValueError(f"未知通道: {sorted(unknown)}")
+        sql, params = self._sample_query(
+            ["session_id", "measurement_index", "measurement_type", "measurement_time", "replicates", "data"],
+            session_id, device, measurement_type, since, until, measurement_index)
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+
+        # 排序在NumPy中完成（SQL中 ORDER BY 会对按时间索引取出的整行BLOB建临时B树，慢得多）
+        keys = np.array([row[:5] for row in rows], dtype=float).reshape(-1, 5)
+        order = np.lexsort((keys[:, 2], keys[:, 1], keys[:, 0]))
+        keys = keys[order]
+        counts = keys[:, 4].astype(np.int64)
+        values = np.frombuffer(b"".join([rows[i][5] for i in order]), dtype=SAMPLE_DTYPE)
+        values = values.reshape(-1, len(CHANNEL_NAMES))
+        starts = np.cumsum(counts) - counts
+        return {
+            "session_id": np.repeat(keys[:, 0].astype(np.int64), counts),
+            "measurement_index": np.repeat(keys[:, 1].astype(np.int64), counts),
+            "measurement_type": np.repeat(np.array(TYPE_NAMES, dtype=object)[keys[:, 2].astype(np.int64)], counts),
+            "data_index": np.arange(counts.sum()) - np.repeat(starts, counts),
+            "measurement_time": np.repeat(keys[:, 3], counts),
+            "values": values[:, [CHANNEL_NAMES.index(c) for c in channels]],
+        }
+
+    def query_frame(self, channels=CHANNEL_NAMES, **filters):
+        """与 query 相同，返回 pandas DataFrame（measurement_time 为datetime列，每个通道一列）"""
+        import pandas as pd
+
+        channels = [channels] if isinstance(channels, str) else list(channels)
+        result = self.query(channels, **filters)
+        frame = pd.DataFrame({
+            "session_id": result["session_id"],
+            "measurement_index": result["measurement_index"],
+            "measurement_type": pd.Categorical(result["measurement_type"], categories=TYPE_NAMES),
+            "data_index": result["data_index"],
+            "measurement_time": pd.to_datetime(result["measurement_time"], unit="s"),
+        })
+        for c, channel in enumerate(channels):
+            frame[channel] = result["values"][:, c]
+        return frame
+
+    def sample_count(self, session_id=None):
+        """数据点总数（指定 session_id 时为该会话）"""
+        sql, params = "SELECT COALESCE(SUM(replicates), 0) FROM samples", ()
+        if session_id is not None:
+            sql, params = sql + " WHERE session_id = ?", (session_id,)
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()[0]
@@ -0,0 +1,250 @@
+import os
+import time
+import struct
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from .pipeline import CHANNEL_NAMES
+
+# ========================== 宏定义 ==========================
+RING_NAME = "spectrometer_live"  # 默认共享内存名称
+RING_CAPACITY = 65536            # 槽位数（最小间隔400ms时约7小时，连续快速数据流约数分钟）
+RING_MAGIC = b"SPECRING"
+RING_VERSION = 1
+RING_HEADER_SIZE = 64
+RING_POLL_INTERVAL = 0.001       # read(timeout=...) 等待新数据时的轮询间隔（秒）
+
+# ========================== 共享内存布局 ==========================
+# 所有字段为小端序。头部 RING_HEADER_SIZE 字节：
+#   偏移  类型    字段
+#   0     8s      magic        固定为 RING_MAGIC
+#   8     u32     version      RING_VERSION
+#   12    u32     header_size  槽位区起始偏移
+#   16    u64     capacity     槽位数
+#   24    u32     slot_size    每个槽位的字节数（SLOT_DTYPE.itemsize）
+#   28    u32     n_channels   通道数（values 字段的长度）
+#   32    u64     write_seq    最近发布的记录序号（0 表示尚无数据），写入者在记录写完后更新
+#   40    u64     writer_pid   写入进程PID
+#   48    f8      created      创建时间（time.time()）
+# 随后为 capacity 个槽位（SLOT_DTYPE）。序号为 s（从1开始）的记录写在第 s % capacity 个槽位。
+#
+# 单写多读、无锁协议（每个槽位一个序列锁）：
+#   写入者：seq_begin = s → 写数据字段 → seq_end = s → 头部 write_seq = s
+#   读取者：读 write_seq → 复制所需槽位 → 再次读取这些槽位的 seq_begin；
+#           复制结果中 seq_begin == seq_end == s 且再次读取的 seq_begin 仍为 s 时记录有效，
+#           否则该槽位在读取期间已被覆盖（读取落后超过 capacity 条，即溢出）。
+# 读取者不写共享内存，因此读取者数量不影响写入者。写入顺序依赖处理器按程序顺序提交存储（x86 成立）；
+# 其他平台上序列号校验同样会把撕裂的记录判为无效。
+HEADER_FORMAT = "<8sIIQIIQQd"
+WRITE_SEQ_OFFSET = 32
+SLOT_DTYPE = np.dtype([
+    ("seq_begin", "<u8"),
+    ("recv_time", "<f8"),        # PC接收时间（time.time()）
+    ("timestamp", "<i8"),        # 设备时间戳（ms）
+    ("packetCount", "<i8"),
+    ("streamCount", "<i8"),
+    ("values", "<i4", (len(CHANNEL_NAMES),)),  # F1..F8
+    ("seq_end", "<u8"),
+])
+
+
+SLOT_DATA_STRUCT = struct.Struct("<dqqq%di" % len(CHANNEL_NAMES))  # recv_time ~ values（紧随 seq_begin）
+SEQ_END_OFFSET = SLOT_DTYPE.fields["seq_end"][1]
+
+_owned_names = set()  # 本进程创建的共享内存名称
+
+
+class RingFormatError(Exception):
+    """共享内存格式不匹配（magic/版本/槽位大小）"""
+
+
+class RingInUseError(FileExistsError):
+    """同名环形缓冲正由另一个仍在运行的写入进程使用"""
+
+
+def _pid_alive(pid):
+    if os.name != "posix":
+        return True  # Windows：共享内存随最后一个句柄释放，已存在即说明仍被使用
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _remove_stale(name):
+    """同名共享内存已存在：写入进程已退出时删除（上次异常退出遗留），否则抛出异常"""
+    shm = _attach(name)
+    try:
+        if shm.size < RING_HEADER_SIZE:
+            raise RingFormatError(f"共享内存 {name} 不是环形缓冲，未删除")
+        magic, _, _, _, _, _, _, pid, _ = struct.unpack_from(HEADER_FORMAT, shm.buf, 0)
+        if magic != RING_MAGIC:
+            raise RingFormatError(f"共享内存 {name} 不是环形缓冲，未删除")
+        if name in _owned_names or (pid != os.getpid() and _pid_alive(pid)):
+            raise RingInUseError(f"共享内存 {name} 正由进程 {pid} 使用")
+    finally:
+        shm.close()
+    shm = shared_memory.SharedMemory(name=name, create=False)
+    shm.close()
+    shm.unlink()
+
+
+def _attach(name):
+    """打开已有的共享内存（读取者）：不由本进程的 resource_tracker 跟踪，退出时不会删除写入者的共享内存"""
+    try:
+        return shared_memory.SharedMemory(name=name, create=False, track=False)
+    except TypeError:  # Python < 3.13 没有 track 参数
+        shm = shared_memory.SharedMemory(name=name, create=False)
+        if os.name == "posix" and name not in _owned_names:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+def _map_slots(shm, capacity):
+    return np.ndarray((capacity,), dtype=SLOT_DTYPE, buffer=shm.buf, offset=RING_HEADER_SIZE)
+
+# ========================== 写入者 ==========================
+class RingWriter:
+    """把实时光谱数据发布到命名共享内存环形缓冲（单写入者）。
+
+    可作为 PipelineWorker.sample_listeners 的监听器：每个数据点只做几次定长内存写入，
+    不分配内存、不加锁，读取者在其他进程中独立读取。
+    """
+
+    def __init__(self, name=RING_NAME, capacity=RING_CAPACITY):
+        self.name = name
+        self.capacity = capacity
+        size = RING_HEADER_SIZE + capacity * SLOT_DTYPE.itemsize
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        except FileExistsError:
+            # 上次异常退出遗留的共享内存（POSIX）：确认写入进程已退出后删除重建
+            _remove_stale(name)
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        _owned_names.add(name)
+        struct.pack_into(HEADER_FORMAT, self.shm.buf, 0, RING_MAGIC, RING_VERSION, RING_HEADER_SIZE, capacity,
+                         SLOT_DTYPE.itemsize, len(CHANNEL_NAMES), 0, os.getpid(), time.time())
+        self.seq = 0
+
+    def publish(self, spectral_data, recv_time=None):
+        """发布一个光谱数据点（按协议顺序直接写共享内存）"""
+        seq = self.seq + 1
+        buf = self.shm.buf
+        offset = RING_HEADER_SIZE + (seq % self.capacity) * SLOT_DTYPE.itemsize
+        struct.pack_into("<Q", buf, offset, seq)
+        SLOT_DATA_STRUCT.pack_into(
+            buf, offset + 8, time.time() if recv_time is None else recv_time,
+            spectral_data["timestamp"], spectral_data["packetCount"], spectral_data["streamCount"],
+            *[spectral_data[name] for name in CHANNEL_NAMES])
+        struct.pack_into("<Q", buf, offset + SEQ_END_OFFSET, seq)
+        struct.pack_into("<Q", buf, WRITE_SEQ_OFFSET, seq)
+        self.seq = seq
+
+    def add_sample(self, spectral_data, device_ip=""):
+        """PipelineWorker 数据监听器"""
+        self.publish(spectral_data)
+
+    def close(self):
+        """关闭并删除共享内存（已打开的读取者仍可读取已映射的数据）"""
+        if self.shm is None:
+            return
+        self.shm.close()
+        self.shm.unlink()
+        _owned_names.discard(self.name)
+        self.shm = None
+
+# ========================== 读取者 ==========================
+class RingReader:
+    """读取共享内存环形缓冲（任意数量的读取者，可在其他进程中使用）。
+
+    slots 为整个槽位区的 NumPy 结构化数组视图（零拷贝，内容随写入者变化，使用前需按协议校验序号）；
+    read() / latest() 返回已校验的记录副本，records["values"] 为 (记录数, 通道数) 的通道数据。
+
+    示例：
+        reader = RingReader()
+        while True:
+            records, lost = reader.read(timeout=1.0)
+            print(records["packetCount"], records["values"].mean(axis=0), lost)
+    """
+
+    def __init__(self, name=RING_NAME, from_start=False):
+        self.name = name
+        self.shm = _attach(name)
+        magic, version, header_size, capacity, slot_size, n_channels, _, pid, created = struct.unpack_from(
+            HEADER_FORMAT, self.shm.buf, 0)
+        if magic != RING_MAGIC or version != RING_VERSION or header_size != RING_HEADER_SIZE \
+                or slot_size != SLOT_DTYPE.itemsize or n_channels != len(CHANNEL_NAMES):
+            self.shm.close()
+            raise RingFormatError(f"共享内存 {name} 不是受支持的环形缓冲格式")
+        self.capacity = capacity
+        self.writer_pid = pid
+        self.created = created
+        self.slots = _map_slots(self.shm, capacity)
+        self.write_seq = np.ndarray((1,), dtype="<u8", buffer=self.shm.buf, offset=WRITE_SEQ_OFFSET)
+        self.next_seq = 1 if from_start else self.head() + 1  # 下一条要读取的记录序号
+        self.lost_count = 0  # 因溢出丢失的记录数（累计）
+
+    def head(self):
+        """最近发布的记录序号"""
+        return int(self.write_seq[0])
+
+    def _copy(self, first, last):
+        """复制序号 [first, last] 的记录并校验，返回有效记录（只可能丢失最旧的一段）"""
+        seqs = np.arange(first, last + 1, dtype=np.uint64)
+        idx = (seqs % np.uint64(self.capacity)).astype(np.intp)
+        records = self.slots[idx]
+        recheck = self.slots["seq_begin"][idx]
+        valid = (records["seq_begin"] == seqs) & (records["seq_end"] == seqs) & (recheck == seqs)
+        if valid.all():
+            return records
+        invalid = np.flatnonzero(~valid)
+        return records[invalid[-1] + 1:]
+
+    def read(self, max_records=None, timeout=0):
+        """读取上次读取之后的新记录，返回 (记录数组, 本次丢失的记录数)。
+        timeout > 0 时在没有新数据时最多等待 timeout 秒；max_records 限制单次读取数量（从最旧的开始）"""
+        head = self.head()
+        if head < self.next_seq and timeout > 0:
+            deadline = time.monotonic() + timeout
+            while head < self.next_seq and time.monotonic() < deadline:
+                time.sleep(RING_POLL_INTERVAL)
+                head = self.head()
+        if head < self.next_seq:
+            return np.empty(0, dtype=SLOT_DTYPE), 0
+        first = max(self.next_seq, head - self.capacity + 1, 1)
+        last = head if max_records is None else min(head, first + max_records - 1)
+        records = self._copy(first, last)
+        lost = (first - self.next_seq) + (last - first + 1 - len(records))
+        self.next_seq = last + 1
+        self.lost_count += lost
+        return records, lost
+
+    def latest(self, count=1):
+        """最近 count 条记录（不影响 read() 的读取位置）"""
+        head = self.head()
+        first = max(1, head - min(count, self.capacity) + 1)
+        if head < first:
+            return np.empty(0, dtype=SLOT_DTYPE)
+        return self._copy(first, head)
+
+    def close(self):
+        """关闭映射；若仍有对 slots 的引用，映射在这些引用释放后才会解除"""
+        if self.shm is None:
+            return
+        self.slots = self.write_seq = None
+        try:
+            self.shm.close()
+        except BufferError:
+            pass
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
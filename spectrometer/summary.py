@@ -0,0 +1,132 @@
+import warnings
+
+import numpy as np
+
+from .pipeline import CHANNEL_NAMES
+from .measurement import MEASUREMENT_STAGES
+
+# ========================== 宏定义 ==========================
+TRIM_FRACTION = 0.2        # 截尾均值两端各去掉的比例（5次重复时去掉最高、最低各1个）
+OUTLIER_THRESHOLD = 3.0    # 离群判定阈值倍数（基于组内MAD，与分析脚本的突变阈值一致）
+OUTLIER_MIN_DELTA = 2.0    # 离群点至少偏离组内中位数的计数值（避免整数量化误差被判为离群）
+SESSION_TYPE_NAMES = [type_name for _, type_name, _, _ in MEASUREMENT_STAGES]
+SUMMARY_STATS = ["median", "mean", "trimmed_mean", "cv", "min", "max", "outliers"]
+
+# ========================== 重复测量汇总 ==========================
+def _sorted_median(sorted_values, count):
+    """按组排好序（NaN在末尾）的 (组数, 重复次数, 通道数) 数组的中位数，count 为每组有效个数"""
+    count = np.broadcast_to(count, (sorted_values.shape[0], 1, sorted_values.shape[2]))
+    low = np.take_along_axis(sorted_values, np.maximum(count - 1, 0) // 2, axis=1)
+    high = np.take_along_axis(sorted_values, count // 2 - (count == 0), axis=1)
+    median = ((low + high) / 2)[:, 0, :]
+    return np.where(count[:, 0, :] > 0, median, np.nan)
+
+def summarize_replicates(measurement_index, measurement_type, values, type_order=SESSION_TYPE_NAMES,
+                         trim=TRIM_FRACTION, outlier_threshold=OUTLIER_THRESHOLD):
+    """对整个会话按 (measurement_index, measurement_type) 分组，向量化计算每组的重复测量统计量
+
+      measurement_index: 每行的测量序号，shape = (行数,)
+      measurement_type:  每行的测量类型名（如 "LED Only"）
+      values:            通道数据，shape = (行数, 通道数)
+    全零行不参与统计，只计入 zero_rows。返回字典（各统计量为 (组数, 通道数) 数组，组按序号、类型排序）：
+      measurement_index, measurement_type, replicates, zero_rows,
+      median, mean, trimmed_mean, cv, min, max, outliers
+    """
+    index = np.asarray(measurement_index, dtype=np.int64)
+    types = np.asarray(measurement_type, dtype=str)
+    values = np.asarray(values, dtype=float)
+    n_channels = values.shape[1]
+
+    # 组键：序号 * 类型数 + 类型编号（已知类型按测量顺序编号，未知类型排在后面）
+    names, type_codes = np.unique(types, return_inverse=True)
+    known = {name: i for i, name in enumerate(type_order)}
+    order = np.array([known.get(name, len(type_order) + i) for i, name in enumerate(names)], dtype=np.int64)
+    codes = order[type_codes]
+    keys, group_of_row = np.unique(index * (len(type_order) + len(names)) + codes, return_inverse=True)
+    group_of_row = group_of_row.reshape(-1)
+    n_groups = len(keys)
+    first_row = np.zeros(n_groups, dtype=np.int64)
+    first_row[group_of_row[::-1]] = np.arange(len(index))[::-1]
+
+    nonzero = np.any(values != 0, axis=1)
+    replicates = np.bincount(group_of_row[nonzero], minlength=n_groups)
+    zero_rows = np.bincount(group_of_row[~nonzero], minlength=n_groups)
+
+    # 各组非零行补齐为 (组数, 最大重复次数, 通道数)，不足部分为 NaN
+    rows = np.flatnonzero(nonzero)
+    rows = rows[np.argsort(group_of_row[rows], kind="stable")]
+    groups = group_of_row[rows]
+    starts = np.concatenate([[0], np.cumsum(replicates)[:-1]])
+    slot = np.arange(len(rows)) - starts[groups]
+    padded = np.full((n_groups, max(1, replicates.max(initial=0)), n_channels), np.nan)
+    padded[groups, slot] = values[rows]
+
+    with warnings.catch_warnings(), np.errstate(invalid="ignore", divide="ignore"):
+        warnings.simplefilter("ignore", RuntimeWarning)  # 全零组（无有效重复）的统计量为 NaN
+        count = replicates[:, None, None]
+        ordered = np.sort(padded, axis=1)  # NaN 排在末尾
+        median = _sorted_median(ordered, count)
+        mean = np.nanmean(padded, axis=1)
+        std = np.nanstd(padded, axis=1, ddof=1)
+        cv = std / mean
+
+        # 截尾均值：排序后保留第 k 到 n-k-1 个
+        k = np.floor(count * trim).astype(np.int64)
+        position = np.arange(padded.shape[1])[None, :, None]
+        keep = (position >= k) & (position < count - k)
+        trimmed_mean = np.nanmean(np.where(keep, ordered, np.nan), axis=1)
+
+        # 离群点：偏离组内中位数超过 threshold * 1.4826 * MAD（MAD为0时用平均绝对偏差）
+        deviation = np.abs(padded - median[:, None, :])
+        mad = _sorted_median(np.sort(deviation, axis=1), count)
+        mad = np.where(mad == 0, np.nanmean(deviation, axis=1), mad)
+        limit = np.maximum(outlier_threshold * 1.4826 * mad, OUTLIER_MIN_DELTA)
+        outliers = np.sum(deviation > limit[:, None, :], axis=1)
+
+        minimum = np.nanmin(padded, axis=1)
+        maximum = np.nanmax(padded, axis=1)
+
+    return {
+        "measurement_index": index[first_row],
+        "measurement_type": types[first_row],
+        "replicates": replicates,
+        "zero_rows": zero_rows,
+        "median": median,
+        "mean": mean,
+        "trimmed_mean": trimmed_mean,
+        "cv": cv,
+        "min": minimum,
+        "max": maximum,
+        "outliers": outliers,
+    }
+
+def summary_columns(summary, channels=CHANNEL_NAMES):
+    """将汇总结果展开为整洁表格的列（每组一行）：measurement_index, measurement_type,
+    replicates, zero_rows 以及每个通道的 <通道>_<统计量>，返回 {列名: 1-D 数组}"""
+    columns = {name: summary[name] for name in ("measurement_index", "measurement_type", "replicates", "zero_rows")}
+    for c, channel in enumerate(channels):
+        for stat in SUMMARY_STATS:
+            columns[f"{channel}_{stat}"] = summary[stat][:, c]
+    return columns
+
+def summary_rows(summary, channels=CHANNEL_NAMES):
+    """整洁表格行（字典列表，值为Python内置类型），可直接写入CSV"""
+    columns = summary_columns(summary, channels)
+    names = list(columns)
+    return [dict(zip(names, values)) for values in zip(*(columns[name].tolist() for name in names))]
+
+def summarize_measurements(measurements):
+    """汇总GUI/引擎的测量会话记录（{measurement_index, led_only, uv_only, led_uv} 列表）"""
+    index, types, values = [], [], []
+    for measurement in measurements:
+        for measurement_type, type_name, _, _ in MEASUREMENT_STAGES:
+            for data in measurement.get(measurement_type) or []:
+                index.append(measurement["measurement_index"])
+                types.append(type_name)
+                values.append([data[name] for name in CHANNEL_NAMES])
+    return summarize_replicates(index, types, np.array(values, dtype=float).reshape(-1, len(CHANNEL_NAMES)))
+
+def stat_series(summary, type_name, stat="median"):
+    """取某测量类型有有效重复的各组：返回 (measurement_index 数组, (组数, 通道数) 统计量数组)"""
+    mask = (summary["measurement_type"] == type_name) & (summary["replicates"] > 0)
+    return summary["measurement_index"][mask], summary[stat][mask]
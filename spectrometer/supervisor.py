@@ -0,0 +1,239 @@
+import time
+import threading
+
+# ========================== 宏定义 ==========================
+SUPERVISE_INTERVAL = 1.0        # 检查间隔（秒）
+RESTART_BACKOFF_INITIAL = 1.0   # 重启失败后的首次重试等待（秒），之后每次加倍
+RESTART_BACKOFF_MAX = 60.0      # 重试等待上限（秒）；恢复后在此时间内再次中断时不重置等待
+STOP_TIMEOUT = 10               # 停止时等待监控线程（可能正在重启工作者）的超时（秒）
+MAX_OUTAGES = 10000             # 最多保留的中断记录数（超出时丢弃最旧的）
+
+WORKER_LABELS = {
+    "event_loop": "网络事件循环",
+    "notification_server": "6677通知服务器",
+    "data_endpoint": "6699数据端点",
+    "device_clients": "设备指令连接",
+    "pipeline": "数据处理线程",
+}
+
+# ========================== 工作者 ==========================
+class SupervisedWorker:
+    """被监控的工作者：check() 返回None表示正常，否则返回故障原因；restart() 失败时抛出异常。
+    depends 为所依赖的工作者名称，依赖中断期间不检查本工作者（如事件循环中断时其上的服务无法重启）"""
+
+    def __init__(self, name, check, restart, depends=None):
+        self.name = name
+        self.check = check
+        self.restart = restart
+        self.depends = depends
+        self.restart_count = 0       # 成功重启次数（累计）
+        self.outage = None           # 当前中断记录（正常时为None）
+        self.backoff = RESTART_BACKOFF_INITIAL
+        self.next_attempt = 0.0      # 下次允许重启的时间（time.monotonic()）
+        self.recovered_at = None     # 最近一次恢复的时间（time.monotonic()）
+        self.lost_start = None       # 当前中断开始时的累计丢包数
+        self.last_ok = None          # 最近一次检查正常的时间（time.time()）
+
+# ========================== 监控器 ==========================
+class Supervisor:
+    """工作者监控：每 interval 秒检查各工作者的存活与心跳，故障时按指数退避重启，
+    并记录每次中断的起止时间、重启次数与期间丢失的数据包数。
+
+    中断记录 outages 中每项为 {"worker", "reason", "start", "end", "restarts", "failed_restarts", "lost"}：
+    start 为故障前最后一次检查正常的时间、end 为恢复时间（time.time()，精度为检查间隔，
+    end 为None表示仍在中断）；lost 为从中断开始到恢复后第一个数据包之间
+    按 packetCount 间隔统计的丢包数（数据尚未恢复时为None）。工作者重启不重置数据处理状态，
+    因此恢复后的 packetCount 间隔即为中断期间丢失的数据。
+    会话开始时调用 mark()，结束时用 report(标记) 得到该会话内的中断、重启与丢包统计。
+    """
+
+    def __init__(self, counters=None, on_event=None, interval=SUPERVISE_INTERVAL):
+        self.counters = counters  # 返回 (已处理数据包数, 累计丢包数) 的函数
+        self.on_event = on_event  # 回调：on_event(事件名, 工作者名称, 信息dict)，在监控线程中调用
+        self.interval = interval
+        self.workers = {}
+        self.outages = []
+        self.unsettled = []  # [(中断记录, 中断开始时的丢包数, 恢复时的已处理数)]，等待数据恢复后统计丢包
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def add(self, name, check, restart, depends=None):
+        self.workers[name] = SupervisedWorker(name, check, restart, depends)
+
+    # ---------------------- 生命周期 ----------------------
+    def start(self):
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.run, name="Supervisor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(STOP_TIMEOUT)
+
+    def run(self):
+        print("[Supervisor] 监控线程已启动")
+        while not self.stop_event.wait(self.interval):
+            self.check_all()
+        print("[Supervisor] 监控线程已退出")
+
+    # ---------------------- 检查与重启 ----------------------
+    def check_all(self):
+        for worker in list(self.workers.values()):
+            dependency = self.workers.get(worker.depends)
+            if dependency is not None and dependency.outage is not None:
+                continue
+            self.check_worker(worker)
+        self.settle_losses()
+
+    def probe(self, worker):
+        try:
+            return worker.check()
+        except Exception as e:
+            return f"状态检查失败: {e}"
+
+    def check_worker(self, worker):
+        reason = self.probe(worker)
+        if reason is None:
+            if worker.outage is not None:
+                self.recover(worker)
+            worker.last_ok = time.time()
+            return
+        if worker.outage is None:
+            self.begin_outage(worker, reason)
+        if time.monotonic() < worker.next_attempt:
+            return
+
+        delay = worker.backoff
+        worker.next_attempt = time.monotonic() + delay
+        worker.backoff = min(delay * 2, RESTART_BACKOFF_MAX)
+        try:
+            worker.restart()
+        except Exception as e:
+            worker.outage["failed_restarts"] += 1
+            print(f"[Supervisor] {worker.name} 重启失败: {e}，{delay:.0f}秒后重试")
+            self.emit("worker_restart_failed", worker.name, error=str(e), retry_in=delay)
+            return
+        worker.restart_count += 1
+        worker.outage["restarts"] += 1
+        print(f"[Supervisor] {worker.name} 已重启（第{worker.restart_count}次）")
+        self.emit("worker_restarted", worker.name, restarts=worker.restart_count)
+        if self.probe(worker) is None:
+            self.recover(worker)
+            worker.last_ok = time.time()
+
+    def begin_outage(self, worker, reason):
+        outage = {"worker": worker.name, "reason": reason, "start": worker.last_ok or time.time(), "end": None,
+                  "restarts": 0, "failed_restarts": 0, "lost": None}
+        # 刚恢复不久又中断时沿用当前退避等待，避免反复快速重启
+        if worker.recovered_at is None or time.monotonic() - worker.recovered_at > RESTART_BACKOFF_MAX:
+            worker.backoff = RESTART_BACKOFF_INITIAL
+            worker.next_attempt = 0.0
+        worker.outage = outage
+        worker.lost_start = self.counters()[1] if self.counters else None
+        with self.lock:
+            self.outages.append(outage)
+            del self.outages[:-MAX_OUTAGES]
+        print(f"[Supervisor] {worker.name} 中断: {reason}")
+        self.emit("worker_down", worker.name, reason=reason)
+
+    def recover(self, worker):
+        outage = worker.outage
+        with self.lock:
+            outage["end"] = time.time()
+        worker.outage = None
+        worker.recovered_at = time.monotonic()
+        if self.counters:
+            self.unsettled.append((outage, worker.lost_start, self.counters()[0]))
+        downtime = outage["end"] - outage["start"]
+        print(f"[Supervisor] {worker.name} 已恢复，中断 {downtime:.1f} 秒")
+        self.emit("worker_recovered", worker.name, downtime=round(downtime, 3), restarts=outage["restarts"])
+
+    def settle_losses(self):
+        """数据恢复（恢复后处理了新的数据包）后统计中断期间的丢包数"""
+        if not self.unsettled:
+            return
+        processed = self.counters()[0]
+        lost = self.counters()[1]  # 先读已处理数：该数据包的丢包统计已在其之前完成
+        remaining = []
+        for outage, lost_start, processed_at_recovery in self.unsettled:
+            if processed > processed_at_recovery:
+                with self.lock:
+                    outage["lost"] = lost - lost_start
+            else:
+                remaining.append((outage, lost_start, processed_at_recovery))
+        self.unsettled = remaining
+
+    def emit(self, event, name, **info):
+        if self.on_event:
+            try:
+                self.on_event(event, name, info)
+            except Exception as e:
+                print(f"[Supervisor] 事件回调错误: {e}")
+
+    # ---------------------- 统计 ----------------------
+    def mark(self):
+        """会话开始时调用，返回传给 report() 的标记"""
+        return {"time": time.time(), "lost": self.counters()[1] if self.counters else None}
+
+    def report(self, mark=None):
+        """mark 之后（未指定时为全部）的中断统计：
+        {"outages": 中断记录, "restarts": {工作者: 重启次数}, "downtime": {工作者: 中断秒数},
+         "total_downtime": 任一工作者中断的总秒数（重叠部分只计一次）, "lost_packets": 会话内丢包数}"""
+        now = time.time()
+        since = mark["time"] if mark else 0
+        with self.lock:
+            outages = [dict(o) for o in self.outages if o["end"] is None or o["end"] >= since]
+        restarts, downtime, intervals = {}, {}, []
+        for outage in outages:
+            start, end = max(outage["start"], since), outage["end"] or now
+            restarts[outage["worker"]] = restarts.get(outage["worker"], 0) + outage["restarts"]
+            downtime[outage["worker"]] = downtime.get(outage["worker"], 0) + end - start
+            intervals.append((start, end))
+
+        # 合并重叠的中断区间
+        total, covered_until = 0.0, since
+        for start, end in sorted(intervals):
+            start = max(start, covered_until)
+            if end > start:
+                total += end - start
+                covered_until = end
+
+        lost_packets = None
+        if self.counters and (mark is None or mark["lost"] is not None):
+            lost_packets = self.counters()[1] - (mark["lost"] if mark else 0)
+        return {
+            "outages": outages,
+            "restarts": restarts,
+            "downtime": {name: round(seconds, 3) for name, seconds in downtime.items()},
+            "total_downtime": round(total, 3),
+            "lost_packets": lost_packets,
+        }
+
+
+def summarize_report(report):
+    """中断统计的一行中文摘要（用于通知与日志）"""
+    if not report["outages"]:
+        text = "无中断"
+    else:
+        restarts = sum(report["restarts"].values())
+        workers = "、".join(WORKER_LABELS.get(name, name) for name in report["downtime"])
+        text = f"中断 {len(report['outages'])} 次（{workers}），累计 {report['total_downtime']:.1f} 秒，重启 {restarts} 次"
+    if report["lost_packets"] is not None:
+        text += f"，丢失数据包 {report['lost_packets']} 个"
+    return text
+
+
+def acquisition_supervisor(network, pipeline, on_event=None):
+    """监控采集链路：网络事件循环、6677/6699服务、设备指令连接与数据处理线程"""
+    supervisor = Supervisor(lambda: (pipeline.processed_count, pipeline.lost_packet_count), on_event)
+    supervisor.add("event_loop", network.check_loop, network.restart_loop)
+    supervisor.add("notification_server", network.check_notification_server,
+                   network.restart_notification_server, depends="event_loop")
+    supervisor.add("data_endpoint", network.check_data_endpoint, network.restart_data_endpoint,
+                   depends="event_loop")
+    supervisor.add("device_clients", network.check_device_clients, network.restart_device_clients,
+                   depends="event_loop")
+    supervisor.add("pipeline", pipeline.check, pipeline.restart)
+    return supervisor